@@ -1,136 +1,630 @@
 import sqlite3
+import json
+import os
+import socket
+import time
+import uuid
 from datetime import datetime
-from typing import List, Dict
-from collections import defaultdict
+from typing import List, Dict, Optional, Set, Tuple
+from collections import Counter, defaultdict
+from contextlib import nullcontext
 import logging
 
 from app.config import settings
+from app.database import Database, get_database
+from app.migrations import migrate
+from app.metrics import DB_OPERATION_SECONDS, timed
+from app.digest_state import DigestState
 from app.models import (
-    MediaItem, MediaType, DigestData,
+    MediaItem, MediaType, DigestData, DigestBatch, DeliveryResult,
     TVShowAggregation, MovieAggregation, MusicAggregation
 )
 
 logger = logging.getLogger(__name__)
 
+# Keys per IN (...) lookup, well under SQLite's bound-variable limit
+# (999 before 3.32)
+KEY_LOOKUP_CHUNK = 500
+
+# GROUP BY queries of the SQL engine; served from the covering indexes
+# idx_pending_shows and idx_pending_music (the benchmark checks their plans)
+SHOW_SEASONS_SQL = """
+    SELECT show_title, season_number, json_group_array(DISTINCT episode_number)
+    FROM media_items
+    WHERE processed = 0 AND media_type = ? AND digest_id IS ?
+    GROUP BY show_title, season_number
+    ORDER BY show_title, season_number
+"""
+ARTIST_ALBUMS_SQL = """
+    SELECT artist, json_group_array(DISTINCT album)
+    FROM media_items
+    WHERE processed = 0 AND media_type = ? AND digest_id IS ?
+    AND artist IS NOT NULL AND album IS NOT NULL
+    AND artist != '' AND album != ''
+    GROUP BY artist
+    ORDER BY artist
+"""
+
+# Each worker keeps a lease named WORKER_LEASE_PREFIX + worker id alive while
+# it runs (see coordination.py); digests it claimed are released once it expires
+WORKER_LEASE_PREFIX = "worker:"
+
+# Shared sequence numbers around one write: ((change, reset) before, (change, reset, max item id) after)
+Change = Tuple[Tuple[int, int], Tuple[int, int, int]]
+
 
 class MediaAggregator:
     """Handles media aggregation and database operations"""
     
-    def __init__(self):
-        self.db_path = settings.db_path
+    def __init__(self, db: Optional[Database] = None):
+        # A separate Database stands in for another worker process sharing the file
+        self.db = db or get_database(settings.db_path)
+        self.db_path = self.db.db_path
+        # Recorded as the owner of the digests this process claims
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.state = DigestState()
+        # States of digests claimed but not yet sent, by digest id
+        self._claimed: Dict[int, DigestState] = {}
+        # Partly delivered digests this process is retrying
+        self._retrying: Set[int] = set()
+        # Bumped whenever the pending backlog changes; keys caches of anything derived from it
+        self.version = 0
+        
+        # Shared change sequence numbers (in sync_state) this process has applied.
+        # Other worker processes write to the same database; see sync().
+        self.change_seq = 0
+        self.reset_seq = 0
+        self._loaded_max_id = 0
+        # Items claimed by other processes' in-flight digests, by media type
+        self._foreign_claimed: Counter = Counter()
+        
         self._init_database()
+        self._load_state()
     
+    @timed(DB_OPERATION_SECONDS)
     def _init_database(self):
-        """Initialize SQLite database with required tables"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS media_items (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    media_type TEXT NOT NULL,
-                    title TEXT NOT NULL,
-                    year INTEGER,
-                    show_title TEXT,
-                    season_number INTEGER,
-                    episode_number INTEGER,
-                    artist TEXT,
-                    album TEXT,
-                    track_title TEXT,
-                    added_at TIMESTAMP NOT NULL,
-                    thumb_url TEXT,
-                    rating_key TEXT,
-                    processed BOOLEAN DEFAULT 0
+        """Create the database schema or upgrade it in place"""
+        version = migrate(self.db)
+        # One-time full VACUUM for databases created without auto_vacuum;
+        # done here, before serving, rather than by the retention job
+        self.db.enable_incremental_vacuum()
+        logger.info(f"Database initialized successfully (schema version {version})")
+    
+    @timed(DB_OPERATION_SECONDS)
+    def release_stale_claims(self) -> int:
+        """
+        Return items claimed by digests whose worker is gone (stopped, crashed,
+        or a leader that went away) to the backlog. A worker is gone once its
+        lease has expired; digests of live workers, this one included, are left
+        alone. Returns the number of items released.
+        """
+        now = time.time()
+        with self.db.transaction() as conn:
+            stale = [row[0] for row in conn.execute("""
+                SELECT id FROM digests
+                WHERE status IN ('pending', 'retrying') AND owner IS NOT ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM leases WHERE name = ? || digests.owner AND expires_at >= ?
                 )
-            """)
+            """, (self.worker_id, WORKER_LEASE_PREFIX, now))]
+            # Their digests are released below; nothing refers to the leases after that
+            conn.execute("DELETE FROM leases WHERE name LIKE ? AND expires_at < ?", (WORKER_LEASE_PREFIX + "%", now))
+            if not stale:
+                return 0
             
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_processed 
-                ON media_items(processed)
-            """)
+            released = 0
+            for start in range(0, len(stale), KEY_LOOKUP_CHUNK):
+                chunk = stale[start:start + KEY_LOOKUP_CHUNK]
+                placeholders = ", ".join("?" * len(chunk))
+                # Partly delivered digests keep their items; their failed destinations are retried
+                released += conn.execute(f"""
+                    UPDATE media_items SET digest_id = NULL
+                    WHERE processed = 0 AND digest_id IN (
+                        SELECT id FROM digests WHERE status = 'pending' AND id IN ({placeholders})
+                    )
+                """, chunk).rowcount
+                conn.execute(f"UPDATE digests SET status = 'failed' WHERE status = 'pending' AND id IN ({placeholders})", chunk)
+                conn.execute(f"UPDATE digests SET status = 'partial' WHERE status = 'retrying' AND id IN ({placeholders})", chunk)
+            change = self._record_change(conn, reset=True)
+        if released:
+            # The released items are not in memory yet
+            self._load_state()
+            self.version += 1
+        else:
+            self._applied(change)
+        logger.info(f"Released {released} items from {len(stale)} digest(s) of stopped workers: {stale}")
+        return released
+    
+    def has_claims(self) -> bool:
+        """Whether this process has digests in flight (being sent or retried)"""
+        return bool(self._claimed or self._retrying)
+    
+    @timed(DB_OPERATION_SECONDS)
+    def _load_state(self, conn: Optional[sqlite3.Connection] = None):
+        """Rebuild the incremental digest state (unclaimed items) from the database"""
+        with self._snapshot(conn) as conn:
+            self.change_seq, self.reset_seq = conn.execute(
+                "SELECT change_seq, reset_seq FROM sync_state"
+            ).fetchone()
+            self._loaded_max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM media_items").fetchone()[0]
             
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_media_type 
-                ON media_items(media_type)
+            self.state.clear()
+            cursor = conn.execute("""
+                SELECT media_type, title, year, show_title, season_number,
+                       episode_number, artist, album, thumb_url, added_at, rating_key
+                FROM media_items
+                WHERE processed = 0 AND digest_id IS NULL
+                ORDER BY added_at ASC
             """)
+            for row in cursor:
+                self.state.add_row(row)
+            
+            own = list(self._claimed)
+            placeholders = ", ".join("?" * len(own))
+            self._foreign_claimed = Counter(dict(conn.execute(f"""
+                SELECT media_type, COUNT(*) FROM media_items
+                WHERE processed = 0 AND digest_id IS NOT NULL AND digest_id NOT IN ({placeholders})
+                GROUP BY media_type
+            """, own).fetchall()))
+        logger.info(f"Loaded {self.state.total_items} unprocessed items into digest state")
+    
+    def _snapshot(self, conn: Optional[sqlite3.Connection]):
+        """Reads against a consistent snapshot: the caller's transaction if given"""
+        return nullcontext(conn) if conn is not None else self.db.snapshot()
+    
+    @timed(DB_OPERATION_SECONDS)
+    def sync(self, conn: Optional[sqlite3.Connection] = None) -> bool:
+        """
+        Catch up with backlog changes committed by other worker processes.
+        
+        New items are loaded incrementally. Claims, sends and releases move
+        items in or out of the backlog and trigger a full reload. With a
+        single process the sequence never moves behind our back and this is
+        one indexed read. Returns True if anything changed.
+        """
+        with self._snapshot(conn) as conn:
+            change_seq, reset_seq = conn.execute("SELECT change_seq, reset_seq FROM sync_state").fetchone()
+            if change_seq == self.change_seq and reset_seq == self.reset_seq:
+                return False
             
-            conn.commit()
-            logger.info("Database initialized successfully")
+            if reset_seq != self.reset_seq:
+                self._load_state(conn)
+            else:
+                max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM media_items").fetchone()[0]
+                cursor = conn.execute("""
+                    SELECT media_type, title, year, show_title, season_number,
+                           episode_number, artist, album, thumb_url, added_at, rating_key
+                    FROM media_items
+                    WHERE id > ? AND processed = 0 AND digest_id IS NULL
+                    ORDER BY added_at ASC
+                """, (self._loaded_max_id,))
+                for row in cursor:
+                    self.state.add_row(row)
+                self._loaded_max_id = max_id
+                self.change_seq = change_seq
+        
+        self.version += 1
+        return True
+    
+    def _record_change(self, conn: sqlite3.Connection, reset: bool = False) -> Change:
+        """
+        Advance the shared change sequence inside a write transaction.
+        Returns the sequence numbers before and after the change, for _applied().
+        Only touches the database, so it is safe to call from a worker thread.
+        """
+        change_seq, reset_seq = conn.execute("SELECT change_seq, reset_seq FROM sync_state").fetchone()
+        conn.execute(
+            "UPDATE sync_state SET change_seq = change_seq + 1, reset_seq = reset_seq + ?",
+            (int(reset),)
+        )
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM media_items").fetchone()[0]
+        return (change_seq, reset_seq), (change_seq + 1, reset_seq + int(reset), max_id)
+    
+    def _in_sync(self, change: Change) -> bool:
+        """Whether this process had applied every change before this one"""
+        return change[0] == (self.change_seq, self.reset_seq)
+    
+    def _applied(self, change: Change):
+        """After commit: adopt our own change's sequence numbers, or catch up"""
+        if self._in_sync(change):
+            self.change_seq, self.reset_seq, self._loaded_max_id = change[1]
+        else:
+            self.sync()
+        self.version += 1
     
     def add_media_item(self, item: MediaItem):
         """Add a media item to the database"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
+        self.add_media_items([item])
+    
+    def add_media_items(self, items: List[MediaItem]):
+        """
+        Add a batch of media items in a single transaction.
+        Items already pending (same ratingKey and type) are updated in place.
+        """
+        if not items:
+            return
+        self.apply_media_items(items, self.write_media_items(items))
+    
+    @timed(DB_OPERATION_SECONDS)
+    def write_media_items(self, items: List[MediaItem]) -> Change:
+        """
+        Store a batch of media items in a single transaction, without
+        touching the in-memory state: safe to run in a worker thread.
+        Pass the result to apply_media_items() on the event loop.
+        """
+        with self.db.transaction() as conn:
+            conn.executemany("""
                 INSERT INTO media_items (
                     media_type, title, year, show_title, season_number,
                     episode_number, artist, album, track_title,
                     added_at, thumb_url, rating_key, processed
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                item.media_type,
-                item.title,
-                item.year,
-                item.show_title,
-                item.season_number,
-                item.episode_number,
-                item.artist,
-                item.album,
-                item.track_title,
-                item.added_at.isoformat(),
-                item.thumb_url,
-                item.rating_key,
-                False
-            ))
-            conn.commit()
-            logger.info(f"Added {item.media_type}: {item.title}")
+                ON CONFLICT (rating_key, media_type) WHERE processed = 0
+                DO UPDATE SET
+                    title = excluded.title,
+                    year = excluded.year,
+                    show_title = excluded.show_title,
+                    season_number = excluded.season_number,
+                    episode_number = excluded.episode_number,
+                    artist = excluded.artist,
+                    album = excluded.album,
+                    track_title = excluded.track_title,
+                    thumb_url = COALESCE(excluded.thumb_url, thumb_url)
+            """, [self._item_row(item) for item in items])
+            return self._record_change(conn)
+    
+    def apply_media_items(self, items: List[MediaItem], change: Change):
+        """Add stored items to the in-memory state (after write_media_items)"""
+        if not self._in_sync(change) or self._foreign_claimed:
+            # Catch up from the database; it also knows which rows other workers have claimed
+            self.sync()
+        else:
+            for item in items:
+                # The upsert updated rows already claimed by an in-flight digest in place
+                if any(claimed.has_item(item.media_type, item.rating_key) for claimed in self._claimed.values()):
+                    continue
+                self.state.add_item(item)
+            self.change_seq, self.reset_seq, self._loaded_max_id = change[1]
+        self.version += 1
+        
+        if len(items) == 1:
+            logger.info(f"Added {items[0].media_type}: {items[0].title}")
+        else:
+            logger.info(f"Added batch of {len(items)} media items")
+    
+    @timed(DB_OPERATION_SECONDS)
+    def filter_new_items(self, items: List[MediaItem]) -> List[MediaItem]:
+        """Drop items that are already stored, pending or sent (same ratingKey and type)"""
+        rating_keys = list({item.rating_key for item in items if item.rating_key})
+        if not rating_keys:
+            return list(items)
+        
+        conn = self.db.reader()
+        known = set()
+        for start in range(0, len(rating_keys), KEY_LOOKUP_CHUNK):
+            chunk = rating_keys[start:start + KEY_LOOKUP_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            known.update(conn.execute(f"""
+                SELECT rating_key, media_type FROM media_items
+                WHERE rating_key IN ({placeholders})
+            """, chunk))
+        return [item for item in items if (item.rating_key, item.media_type) not in known]
+    
+    @timed(DB_OPERATION_SECONDS)
+    def get_latest_added_at(self) -> Optional[datetime]:
+        """Plex addedAt of the most recently added item we have stored"""
+        row = self.db.reader().execute("SELECT MAX(added_at) FROM media_items").fetchone()
+        return datetime.fromtimestamp(row[0]) if row and row[0] is not None else None
+    
+    def _item_row(self, item: MediaItem) -> tuple:
+        """Convert a media item into an insert parameter tuple"""
+        return (
+            item.media_type,
+            item.title,
+            item.year,
+            item.show_title,
+            item.season_number,
+            item.episode_number,
+            item.artist,
+            item.album,
+            item.track_title,
+            int(item.added_at.timestamp()),
+            item.thumb_url,
+            item.rating_key,
+            False
+        )
     
     def get_unprocessed_count(self) -> int:
-        """Get count of unprocessed media items"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM media_items WHERE processed = 0")
-            count = cursor.fetchone()[0]
-            return count
-    
-    def get_unprocessed_items(self) -> List[Dict]:
-        """Get all unprocessed media items"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT * FROM media_items 
-                WHERE processed = 0 
-                ORDER BY added_at ASC
-            """)
-            items = [dict(row) for row in cursor.fetchall()]
-            return items
+        """Get count of unprocessed media items (kept in memory, no database access)"""
+        claimed = sum(claimed.total_items for claimed in self._claimed.values())
+        return self.state.total_items + claimed + sum(self._foreign_claimed.values())
+    
+    def get_unclaimed_count(self) -> int:
+        """Get count of unprocessed items not yet claimed by an in-flight digest"""
+        return self.state.total_items
+    
+    def get_unprocessed_counts(self) -> Dict[str, int]:
+        """Get counts of unprocessed media items by type"""
+        counts = Counter(self.state.type_counts)
+        for claimed in self._claimed.values():
+            counts.update(claimed.type_counts)
+        counts.update(self._foreign_claimed)
+        return {
+            "movies": counts[MediaType.MOVIE.value],
+            "episodes": counts[MediaType.TV_SHOW.value],
+            "tracks": counts[MediaType.MUSIC.value]
+        }
     
-    def mark_items_processed(self):
-        """Mark all unprocessed items as processed"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("UPDATE media_items SET processed = 1 WHERE processed = 0")
-            conn.commit()
-            logger.info("Marked all items as processed")
+    @timed(DB_OPERATION_SECONDS)
+    def get_unprocessed_items(self, digest_id: Optional[int] = None) -> List[Dict]:
+        """Get unprocessed media items not claimed by a digest (or claimed by digest_id)"""
+        cursor = self.db.reader().cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute("""
+            SELECT * FROM media_items 
+            WHERE processed = 0 AND digest_id IS ?
+            ORDER BY added_at ASC
+        """, (digest_id,))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    @timed(DB_OPERATION_SECONDS)
+    def claim_digest(self) -> Optional[DigestBatch]:
+        """
+        Claim every unclaimed item up to the current max id for a new digest.
+        Items that arrive while the digest is being sent are left for the next one.
+        """
+        with self.db.transaction() as conn:
+            # Under the write lock: bring the in-memory backlog up to date with other workers
+            self.sync(conn)
+            
+            min_id, max_id, count = conn.execute("""
+                SELECT MIN(id), MAX(id), COUNT(*) FROM media_items
+                WHERE processed = 0 AND digest_id IS NULL
+            """).fetchone()
+            
+            if not count:
+                logger.info("No items to aggregate")
+                return None
+            
+            digest_id = conn.execute("""
+                INSERT INTO digests (created_at, min_item_id, max_item_id, item_count, owner)
+                VALUES (?, ?, ?, ?, ?)
+            """, (datetime.now().isoformat(), min_id, max_id, count, self.worker_id)).lastrowid
+            
+            conn.execute("""
+                UPDATE media_items SET digest_id = ?
+                WHERE processed = 0 AND digest_id IS NULL AND id <= ?
+            """, (digest_id, max_id))
+            change = self._record_change(conn, reset=True)
+        
+        # The claimed rows are exactly the current state: hand it to the digest
+        claimed, self.state = self.state, DigestState()
+        self._claimed[digest_id] = claimed
+        self._applied(change)
+        
+        digest = self._aggregate(claimed, digest_id)
+        logger.info(f"Claimed {count} items (ids {min_id}-{max_id}) for digest {digest_id}")
+        return DigestBatch(
+            digest_id=digest_id,
+            min_item_id=min_id,
+            max_item_id=max_id,
+            digest=digest
+        )
+    
+    @timed(DB_OPERATION_SECONDS)
+    def claim_partial_digests(self) -> List[Tuple[DigestBatch, Set[str]]]:
+        """
+        Claim the partly delivered digests for a retry. Returns each digest
+        with the destinations that already have it (sent or skipped).
+        """
+        with self.db.transaction() as conn:
+            rows = conn.execute("""
+                SELECT id, min_item_id, max_item_id FROM digests
+                WHERE status = 'partial' ORDER BY id
+            """).fetchall()
+            conn.execute("UPDATE digests SET status = 'retrying', owner = ? WHERE status = 'partial'", (self.worker_id,))
+            done = defaultdict(set)
+            for digest_id, destination in conn.execute("""
+                SELECT digest_id, destination FROM digest_deliveries
+                WHERE status != 'failed' AND digest_id IN (SELECT id FROM digests WHERE status = 'retrying')
+            """):
+                done[digest_id].add(destination)
+        
+        batches = []
+        for digest_id, min_id, max_id in rows:
+            self._retrying.add(digest_id)
+            # Claimed in another process, or before a restart: aggregate from the database
+            claimed = self._claimed.get(digest_id)
+            digest = self._aggregate(claimed, digest_id) if claimed is not None else self._aggregate_sql(digest_id)
+            if digest is None:
+                # Nothing left to render: every destination gets skipped and the digest completes
+                digest = DigestData(digest_start=datetime.now(), digest_end=datetime.now())
+            batch = DigestBatch(digest_id=digest_id, min_item_id=min_id, max_item_id=max_id, digest=digest)
+            batches.append((batch, done[digest_id]))
+        if batches:
+            logger.info(f"Retrying {len(batches)} partly delivered digest(s): {[batch.digest_id for batch, _ in batches]}")
+        return batches
+    
+    @timed(DB_OPERATION_SECONDS)
+    def record_deliveries(self, digest_id: int, deliveries: List[DeliveryResult]):
+        """Store each destination's outcome for a digest: sent, skipped or failed"""
+        now = datetime.now().isoformat()
+        rows = [
+            (
+                digest_id,
+                delivery.destination,
+                "failed" if not delivery.success else "skipped" if delivery.skipped else "sent",
+                json.dumps(delivery.message_ids),
+                delivery.attempts,
+                now
+            )
+            for delivery in deliveries
+        ]
+        with self.db.transaction() as conn:
+            conn.executemany("""
+                INSERT INTO digest_deliveries (digest_id, destination, status, message_ids, attempts, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (digest_id, destination) DO UPDATE SET
+                    status = excluded.status,
+                    message_ids = excluded.message_ids,
+                    attempts = attempts + excluded.attempts,
+                    updated_at = excluded.updated_at
+            """, rows)
+    
+    @timed(DB_OPERATION_SECONDS)
+    def defer_digest(self, batch: DigestBatch):
+        """Keep a partly delivered digest's items claimed until its failed destinations have it"""
+        with self.db.transaction() as conn:
+            conn.execute("UPDATE digests SET status = 'partial' WHERE id = ?", (batch.digest_id,))
+        self._retrying.discard(batch.digest_id)
+        logger.info(f"Digest {batch.digest_id} partly delivered; failed destinations will be retried")
+    
+    @timed(DB_OPERATION_SECONDS)
+    def mark_digest_processed(self, batch: DigestBatch):
+        """Mark the items claimed by a fully delivered digest as processed"""
+        with self.db.transaction() as conn:
+            cursor = conn.execute("""
+                UPDATE media_items SET processed = 1
+                WHERE id BETWEEN ? AND ? AND digest_id = ?
+            """, (batch.min_item_id, batch.max_item_id, batch.digest_id))
+            # Message ids of every destination, including those sent by earlier attempts
+            message_ids = {
+                destination: json.loads(ids)
+                for destination, ids in conn.execute("""
+                    SELECT destination, message_ids FROM digest_deliveries
+                    WHERE digest_id = ? AND status = 'sent'
+                """, (batch.digest_id,))
+            }
+            conn.execute("""
+                UPDATE digests SET status = 'sent', sent_at = ?, message_ids = ? WHERE id = ?
+            """, (datetime.now().isoformat(), json.dumps(message_ids), batch.digest_id))
+            change = self._record_change(conn, reset=True)
+        self._claimed.pop(batch.digest_id, None)
+        self._retrying.discard(batch.digest_id)
+        self._applied(change)
+        logger.info(f"Marked {cursor.rowcount} items from digest {batch.digest_id} as processed")
+    
+    @timed(DB_OPERATION_SECONDS)
+    def release_digest(self, batch: DigestBatch):
+        """Return the items of a digest that failed to send to the backlog"""
+        with self.db.transaction() as conn:
+            conn.execute("""
+                UPDATE media_items SET digest_id = NULL
+                WHERE id BETWEEN ? AND ? AND digest_id = ?
+            """, (batch.min_item_id, batch.max_item_id, batch.digest_id))
+            conn.execute("UPDATE digests SET status = 'failed' WHERE id = ?", (batch.digest_id,))
+            change = self._record_change(conn, reset=True)
+        
+        claimed = self._claimed.pop(batch.digest_id, None)
+        if claimed is not None:
+            # Released items are older, so they go first
+            claimed.merge(self.state)
+            self.state = claimed
+        self._applied(change)
+        logger.info(f"Released items from digest {batch.digest_id} back to the backlog")
     
     def aggregate_digest(self) -> DigestData:
-        """Aggregate unprocessed items into a digest"""
-        items = self.get_unprocessed_items()
+        """Aggregate the unclaimed backlog into a digest without claiming it"""
+        return self._aggregate(self.state)
+    
+    def _aggregate(self, state: DigestState, digest_id: Optional[int] = None) -> Optional[DigestData]:
+        """Aggregate a set of pending items using the configured engine"""
+        if settings.digest_engine == "python":
+            digest = self._aggregate_full(digest_id)
+        elif settings.digest_engine == "sql":
+            digest = self._aggregate_sql(digest_id)
+        else:
+            digest = state.build()
+        if not digest:
+            logger.info("No items to aggregate")
+            return None
+        
+        logger.info(f"Aggregated digest: {len(digest.movies)} movies, {len(digest.tv_shows)} shows, {len(digest.music)} artists")
+        return digest
+    
+    @timed(DB_OPERATION_SECONDS)
+    def _aggregate_sql(self, digest_id: Optional[int] = None) -> DigestData:
+        """Aggregate unprocessed items with GROUP BY queries, without loading rows"""
+        conn = self.db.reader()
+        
+        total, first_added, last_added = conn.execute("""
+            SELECT COUNT(*), MIN(added_at), MAX(added_at)
+            FROM media_items
+            WHERE processed = 0 AND digest_id IS ?
+        """, (digest_id,)).fetchone()
+        
+        if not total:
+            return None
+        
+        movies = []
+        if settings.enable_movies:
+            movies = [
+                MovieAggregation(title=title, year=year, thumb_url=thumb_url)
+                for title, year, thumb_url in conn.execute("""
+                    SELECT title, year, thumb_url
+                    FROM media_items
+                    WHERE processed = 0 AND media_type = ? AND digest_id IS ?
+                    ORDER BY added_at ASC
+                """, (MediaType.MOVIE.value, digest_id))
+            ]
+        
+        tv_shows = []
+        if settings.enable_tv_shows:
+            # SQLite fills bare columns from the MIN(added_at) row: the first thumb per show
+            show_thumbs = dict(
+                (show, thumb_url) for show, thumb_url, _ in conn.execute("""
+                    SELECT show_title, thumb_url, MIN(added_at)
+                    FROM media_items
+                    WHERE processed = 0 AND media_type = ? AND digest_id IS ?
+                    AND thumb_url IS NOT NULL
+                    GROUP BY show_title
+                """, (MediaType.TV_SHOW.value, digest_id))
+            )
+            
+            for show, season, episodes_json in conn.execute(SHOW_SEASONS_SQL, (MediaType.TV_SHOW.value, digest_id)):
+                episodes = sorted(json.loads(episodes_json))
+                tv_shows.append(TVShowAggregation(
+                    show_title=show,
+                    season_number=season,
+                    episodes=episodes,
+                    episode_count=len(episodes),
+                    thumb_url=show_thumbs.get(show)
+                ))
+        
+        music = []
+        if settings.enable_music:
+            music = [
+                MusicAggregation(artist=artist, albums=sorted(json.loads(albums_json)))
+                for artist, albums_json in conn.execute(ARTIST_ALBUMS_SQL, (MediaType.MUSIC.value, digest_id))
+            ]
+        
+        return DigestData(
+            movies=movies,
+            tv_shows=tv_shows,
+            music=music,
+            total_items=total,
+            digest_start=datetime.fromtimestamp(first_added),
+            digest_end=datetime.fromtimestamp(last_added)
+        )
+    
+    @timed(DB_OPERATION_SECONDS)
+    def _aggregate_full(self, digest_id: Optional[int] = None) -> DigestData:
+        """Re-aggregate the whole backlog from the database"""
+        items = self.get_unprocessed_items(digest_id)
         
         if not items:
-            logger.info("No items to aggregate")
             return None
         
         # Get time range
-        digest_start = datetime.fromisoformat(items[0]['added_at'])
-        digest_end = datetime.fromisoformat(items[-1]['added_at'])
+        digest_start = datetime.fromtimestamp(items[0]['added_at'])
+        digest_end = datetime.fromtimestamp(items[-1]['added_at'])
         
         # Aggregate by type
         movies = self._aggregate_movies(items)
         tv_shows = self._aggregate_tv_shows(items)
         music = self._aggregate_music(items)
         
-        digest = DigestData(
+        return DigestData(
             movies=movies,
             tv_shows=tv_shows,
             music=music,
@@ -138,9 +632,6 @@ class MediaAggregator:
             digest_start=digest_start,
             digest_end=digest_end
         )
-        
-        logger.info(f"Aggregated digest: {len(movies)} movies, {len(tv_shows)} shows, {len(music)} artists")
-        return digest
     
     def _aggregate_movies(self, items: List[Dict]) -> List[MovieAggregation]:
         """Aggregate movie items"""
@@ -159,8 +650,8 @@ class MediaAggregator:
         if not settings.enable_tv_shows:
             return []
         
-        # Group by show and season
-        show_seasons = defaultdict(lambda: defaultdict(list))
+        # Group by show and season (an episode stored twice, e.g. two versions, counts once)
+        show_seasons = defaultdict(lambda: defaultdict(set))
         show_thumbs = {}
         
         for item in items:
@@ -169,7 +660,7 @@ class MediaAggregator:
                 season = item['season_number']
                 episode = item['episode_number']
                 
-                show_seasons[show][season].append(episode)
+                show_seasons[show][season].add(episode)
                 
                 # Store first thumb we find for this show
                 if show not in show_thumbs and item['thumb_url']:
@@ -182,7 +673,7 @@ class MediaAggregator:
                 aggregations.append(TVShowAggregation(
                     show_title=show,
                     season_number=season,
-                    episodes=episodes,
+                    episodes=sorted(episodes),
                     episode_count=len(episodes),
                     thumb_url=show_thumbs.get(show)
                 ))
@@ -218,15 +709,36 @@ class MediaAggregator:
         aggregations.sort(key=lambda x: x.artist)
         return aggregations
     
-    def clear_processed_items(self, days_old: int = 30):
-        """Clear processed items older than N days"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                DELETE FROM media_items 
-                WHERE processed = 1 
-                AND added_at < datetime('now', '-' || ? || ' days')
-            """, (days_old,))
-            deleted = cursor.rowcount
-            conn.commit()
-            logger.info(f"Cleared {deleted} processed items older than {days_old} days")
+    @timed(DB_OPERATION_SECONDS)
+    def delete_processed_chunk(self, cutoff: datetime, limit: int) -> int:
+        """Delete up to limit processed items added before cutoff; returns rows deleted"""
+        with self.db.transaction() as conn:
+            return conn.execute("""
+                DELETE FROM media_items WHERE id IN (
+                    SELECT id FROM media_items
+                    WHERE processed = 1 AND added_at < ?
+                    LIMIT ?
+                )
+            """, (int(cutoff.timestamp()), limit)).rowcount
+    
+    @timed(DB_OPERATION_SECONDS)
+    def delete_finished_digests(self, cutoff: datetime, limit: int) -> int:
+        """Delete up to limit sent or failed digests created before cutoff that no item refers to"""
+        with self.db.transaction() as conn:
+            digest_ids = [row[0] for row in conn.execute("""
+                SELECT id FROM digests
+                WHERE status != 'pending' AND created_at < ?
+                AND NOT EXISTS (SELECT 1 FROM media_items WHERE digest_id = digests.id)
+                LIMIT ?
+            """, (cutoff.isoformat(), limit))]
+            deleted = 0
+            for start in range(0, len(digest_ids), KEY_LOOKUP_CHUNK):
+                chunk = digest_ids[start:start + KEY_LOOKUP_CHUNK]
+                placeholders = ", ".join("?" * len(chunk))
+                conn.execute(f"DELETE FROM digest_deliveries WHERE digest_id IN ({placeholders})", chunk)
+                deleted += conn.execute(f"DELETE FROM digests WHERE id IN ({placeholders})", chunk).rowcount
+            return deleted
+
+
+# Global instance
+aggregator = MediaAggregator()
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+import aiohttp
+
+from app.config import settings
+from app.models import BackfillRun, MediaItem
+from app.aggregator import MediaAggregator
+
+logger = logging.getLogger(__name__)
+
+# Plex item type to list for each library section type
+SECTION_ITEM_TYPES = {
+    "movie": 1,  # movie
+    "show": 4,  # episode
+    "artist": 10  # track
+}
+
+
+class PlexBackfill:
+    """
+    Catches up on library additions whose webhooks were missed.
+
+    Pages through every library section's items added since the newest item
+    already stored, newest first, one Plex API page at a time. Each page is
+    converted with the webhook's mapping and stored in a single transaction;
+    items that are already stored (pending or sent) are skipped.
+    """
+
+    def __init__(
+        self,
+        aggregator: MediaAggregator,
+        to_media_item: Callable[[dict], Optional[MediaItem]],
+        on_batch_written: Optional[Callable[[int], Awaitable[None]]] = None
+    ):
+        self.aggregator = aggregator
+        self.to_media_item = to_media_item
+        self.on_batch_written = on_batch_written
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Optional[BackfillRun] = None
+        self.total_runs = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, trigger: str = "manual", since: Optional[datetime] = None) -> Optional[BackfillRun]:
+        """Start a backfill in the background; returns None if one is already running"""
+        if self.running:
+            return None
+        run = BackfillRun(trigger=trigger, started_at=datetime.now(), since=since or self._default_since())
+        self.last_run = run
+        self._task = asyncio.create_task(self._run(run), name="plex-backfill")
+        return run
+
+    async def stop(self):
+        """Cancel a running backfill"""
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def _default_since(self) -> datetime:
+        """Start just before the newest stored item, or a fixed window back on a fresh install"""
+        latest = self.aggregator.get_latest_added_at()
+        if latest is None:
+            return datetime.now() - timedelta(hours=settings.backfill_initial_hours)
+        return latest - timedelta(seconds=settings.backfill_overlap_seconds)
+
+    async def _run(self, run: BackfillRun) -> BackfillRun:
+        self.total_runs += 1
+        start = time.perf_counter()
+        logger.info(f"Backfilling items added to Plex since {run.since.isoformat()} (trigger: {run.trigger})")
+
+        headers = {"Accept": "application/json"}
+        if settings.plex_token:
+            headers["X-Plex-Token"] = settings.plex_token
+        timeout = aiohttp.ClientTimeout(total=settings.backfill_request_timeout)
+
+        try:
+            async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
+                for section in await self._sections(session):
+                    item_type = SECTION_ITEM_TYPES.get(section.get("type"))
+                    if item_type is None:
+                        continue
+
+                    run.sections += 1
+                    async for page in self._pages(session, section["key"], item_type, run.since):
+                        await self._store(run, page)
+                        run.items_per_second = round(run.fetched / (time.perf_counter() - start), 1)
+
+                    logger.info(
+                        f"Backfilled section '{section.get('title')}': {run.inserted} new, "
+                        f"{run.skipped} skipped so far ({run.items_per_second} items/s)"
+                    )
+            run.status = "done"
+
+        except asyncio.CancelledError:
+            run.status = "cancelled"
+            raise
+
+        except Exception as e:
+            logger.error(f"Backfill failed: {str(e)}")
+            run.status = "error"
+            run.error = str(e) or type(e).__name__
+
+        finally:
+            elapsed = time.perf_counter() - start
+            run.finished_at = datetime.now()
+            run.items_per_second = round(run.fetched / elapsed, 1) if elapsed > 0 else 0.0
+            logger.info(
+                f"Backfill {run.status}: {run.fetched} items fetched in {run.pages} pages, "
+                f"{run.inserted} new, {run.skipped} skipped, {elapsed:.2f}s ({run.items_per_second} items/s)"
+            )
+
+        return run
+
+    async def _get(self, session: aiohttp.ClientSession, path: str, params: Optional[dict] = None) -> dict:
+        """GET a Plex API path and return its MediaContainer"""
+        async with session.get(f"{settings.plex_url.rstrip('/')}{path}", params=params) as response:
+            if response.status != 200:
+                raise RuntimeError(f"Plex returned {response.status} for {path}")
+            body = await response.json(content_type=None)
+        return body.get("MediaContainer") or {}
+
+    async def _sections(self, session: aiohttp.ClientSession) -> List[dict]:
+        """List library sections"""
+        container = await self._get(session, "/library/sections")
+        return container.get("Directory") or []
+
+    async def _pages(
+        self,
+        session: aiohttp.ClientSession,
+        section_key: str,
+        item_type: int,
+        since: datetime
+    ) -> AsyncIterator[List[dict]]:
+        """Yield pages of a section's items added since a time, newest first"""
+        since_ts = int(since.timestamp())
+        page_size = max(1, settings.backfill_page_size)
+        offset = 0
+
+        while True:
+            container = await self._get(session, f"/library/sections/{section_key}/all", {
+                "type": item_type,
+                "sort": "addedAt:desc",
+                "addedAt>>": since_ts,
+                "X-Plex-Container-Start": offset,
+                "X-Plex-Container-Size": page_size
+            })
+            items = container.get("Metadata") or []
+
+            # Sorted newest first, so anything older than the cutoff ends the section
+            recent = [item for item in items if item.get("addedAt", 0) >= since_ts]
+            if recent:
+                yield recent
+
+            offset += len(items)
+            total = container.get("totalSize")
+            if len(recent) < len(items) or len(items) < page_size or (total is not None and offset >= total):
+                return
+
+    async def _store(self, run: BackfillRun, page: List[dict]):
+        """Convert and store one page of Plex items in a single transaction"""
+        items = [item for item in map(self.to_media_item, page) if item is not None]
+        # Query and commit in a worker thread, like the ingest queue, so a full page
+        # doesn't hold up webhooks and live updates; the in-memory state is updated here
+        new_items = await asyncio.to_thread(self.aggregator.filter_new_items, items)
+        if new_items:
+            change = await asyncio.to_thread(self.aggregator.write_media_items, new_items)
+            self.aggregator.apply_media_items(new_items, change)
+
+        run.pages += 1
+        run.fetched += len(page)
+        run.inserted += len(new_items)
+        run.skipped += len(page) - len(new_items)
+
+        if new_items and self.on_batch_written is not None:
+            await self.on_batch_written(len(new_items))
+
+    def get_stats(self) -> dict:
+        """Get backfill status and the last run's progress"""
+        return {
+            "running": self.running,
+            "total_runs": self.total_runs,
+            "last_run": self.last_run.model_dump(mode="json") if self.last_run else None
+        }
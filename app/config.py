@@ -1,5 +1,5 @@
 import os
-from typing import Optional
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -16,16 +16,60 @@ class Settings(BaseSettings):
     plex_url: str = "http://plex:32400"  # Default to Docker service name
     plex_token: Optional[str] = None
     
+    # Public URL of this Digestarr instance, used for thumbnail links in Discord
+    # embeds (e.g. https://digestarr.example.com). Unset = link to Plex directly.
+    public_base_url: Optional[str] = None
+    
+    # Thumbnail Cache
+    thumb_cache_dir: Optional[str] = None  # Defaults to <data_dir>/thumbs
+    thumb_cache_max_mb: int = 200
+    thumb_max_width: int = 0  # Downscale wider images (0 = keep size, requires Pillow)
+    thumb_prefetch: bool = True  # Fetch thumbnails in the background on ingest
+    thumb_prefetch_concurrency: int = 4  # Parallel prefetch requests to Plex
+    thumb_prefetch_queue_size: int = 1000  # Prefetches beyond this are skipped (fetched on first view)
+    thumb_fetch_timeout: float = 15.0  # Seconds
+    
     # Discord Configuration (can be empty at startup, configured via Web UI)
     discord_webhook_url: Optional[str] = None
     discord_username: str = "Digestarr"
     discord_avatar_url: Optional[str] = None
+    # Extra destinations, as JSON: [{"name": ..., "webhook_url": ..., "enable_music": false}, ...]
+    discord_destinations: List[dict] = []
+    discord_max_concurrent_sends: int = 4
+    discord_pool_limit: int = 10  # Max pooled connections to Discord
+    discord_connect_timeout: float = 10.0  # Seconds
+    discord_read_timeout: float = 30.0  # Seconds
+    discord_keepalive_timeout: float = 60.0  # Seconds an idle connection is kept
+    discord_dns_cache_ttl: int = 300  # Seconds
+    discord_rate_limit_requests: int = 5  # Requests per window per webhook
+    discord_rate_limit_window: float = 2.0  # Seconds
+    discord_retry_deadline: float = 120.0  # Seconds to keep retrying a message
+    discord_max_attempts: int = 8
+    discord_retry_base_delay: float = 1.0  # Seconds
+    discord_retry_max_delay: float = 30.0  # Seconds
+    
+    # Backfill (catch up on library additions missed while Digestarr was down)
+    backfill_on_startup: bool = True
+    backfill_page_size: int = 500  # Items per Plex API request
+    backfill_initial_hours: int = 24  # How far back to look when nothing is stored yet
+    backfill_overlap_seconds: int = 300  # Re-check this far before the newest stored item
+    backfill_request_timeout: float = 30.0  # Seconds
     
     # Scheduling Configuration
     digest_schedule: str = "0 */6 * * *"  # Cron format: every 6 hours
     digest_threshold: int = 0  # Auto-send if N items queued (0 = disabled)
     timezone: str = "America/New_York"
     
+    # Retention of items that have already been sent
+    retention_days: int = 30  # Delete processed items older than this (0 = keep forever)
+    retention_schedule: str = "30 4 * * *"  # Cron format: daily at 04:30
+    retention_chunk_size: int = 1000  # Rows deleted per transaction
+    retention_chunk_pause_ms: int = 10  # Pause between chunks so webhooks get the write lock
+    retention_vacuum_pages: int = 1000  # Free pages returned to the filesystem per step
+    
+    # Digest Aggregation
+    digest_engine: str = "incremental"  # incremental, sql, or python (full re-aggregation)
+    
     # Feature Flags
     enable_movies: bool = True
     enable_tv_shows: bool = True
@@ -34,6 +78,37 @@ class Settings(BaseSettings):
     # Data Persistence
     data_dir: str = "/data"
     db_path: str = "/data/digestarr.db"
+
+    # SQLite Tuning
+    sqlite_synchronous: str = "NORMAL"  # NORMAL is durable enough in WAL mode
+    sqlite_cache_size_kb: int = 8192
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_cached_statements: int = 128
+    
+    # Webhook Ingest Queue
+    ingest_batch_size: int = 100  # Max items per group commit
+    ingest_batch_delay_ms: int = 50  # Max time an item waits for its batch
+    ingest_queue_max_size: int = 10000
+    ingest_wait_durable: bool = False  # Acknowledge Plex only after commit
+    ingest_retry_delay_ms: int = 500  # First retry of a failed batch; doubles up to the max
+    ingest_retry_max_delay_ms: int = 30000
+
+    # Web UI live updates (server-sent events)
+    events_client_buffer: int = 100  # Events buffered per client before a slow client is dropped
+    events_keepalive_seconds: float = 15.0
+    events_retry_ms: int = 3000  # Browser reconnect delay
+    
+    # Multi-worker coordination (all workers share the SQLite database on one host)
+    leader_lease_seconds: float = 15.0  # A dead leader is replaced after at most this long
+    leader_renew_seconds: float = 5.0
+    sync_poll_seconds: float = 1.0  # How often workers pick up each other's changes
+    
+    # Profiling (off by default; can also be switched on at runtime via /api/profiling)
+    profiling_webhook_sample_rate: float = 0.0  # Share of /webhook requests to profile (0 = off)
+    profiling_webhook_max_profiles: int = 20  # Stop sampling after this many profiles
+    profiling_digest_runs: int = 0  # Profile the next N digest runs
+    profiling_tracemalloc: bool = False  # Also report top allocations (slows every request while on)
+    profiling_max_reports: int = 100  # Oldest reports are deleted beyond this
     
     # Logging
     log_level: str = "INFO"
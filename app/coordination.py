@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from app.config import settings
+from app.aggregator import aggregator, MediaAggregator, WORKER_LEASE_PREFIX
+
+logger = logging.getLogger(__name__)
+
+LEADER_LEASE = "leader"
+
+Handler = Callable[[], Awaitable[None]]
+
+
+class Coordinator:
+    """
+    Leader election and change propagation between worker processes that
+    share one SQLite database: uvicorn --workers N, or several containers on
+    the same host mounting the same local directory. WAL mode relies on
+    shared memory, so the database must not be shared between hosts or over
+    a network filesystem.
+
+    Every worker ingests webhooks. Only the holder of the leader lease runs
+    the scheduler (digest and retention jobs) and the threshold trigger.
+    The lease is a row in the leases table, renewed every
+    leader_renew_seconds; if the leader goes away, the first worker to
+    renew after it expires takes over. Every worker also renews a lease of
+    its own, which keeps the digests it claimed from being released while
+    it is still sending them.
+
+    Each worker also polls the shared change sequence, so its in-memory
+    backlog, counters and caches follow the writes of the others, and the
+    config sequence, so a configuration saved on one worker is applied on
+    all of them. Call from the event loop.
+    """
+
+    def __init__(self, aggregator: MediaAggregator):
+        self.aggregator = aggregator
+        self.db = aggregator.db
+        self.owner = aggregator.worker_id
+        self.is_leader = False
+        self.leader: Optional[str] = None
+        # Next digest run announced by the leader (epoch seconds)
+        self.leader_next_run: Optional[float] = None
+        self.config_seq = 0
+        self._lease_expires = 0.0
+        self._last_renewal = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+        self._on_elected: Optional[Handler] = None
+        self._on_demoted: Optional[Handler] = None
+        self._on_changed: Optional[Handler] = None
+        self._on_config_changed: Optional[Handler] = None
+        self._next_run: Optional[Callable[[], Optional[float]]] = None
+
+        # Statistics
+        self.elections = 0
+        self.demotions = 0
+        self.syncs = 0
+
+    def set_handlers(
+        self,
+        on_elected: Handler,
+        on_demoted: Handler,
+        on_changed: Handler,
+        on_config_changed: Handler,
+        next_run: Callable[[], Optional[float]]
+    ):
+        """
+        Callbacks for becoming and ceasing to be the leader, for backlog
+        changes made by other workers and for configuration saved by them,
+        and the function giving the local next digest run while leading
+        """
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        self._on_changed = on_changed
+        self._on_config_changed = on_config_changed
+        self._next_run = next_run
+
+    async def start(self):
+        """Try to become the leader right away, then keep the lease and the backlog in sync"""
+        self.config_seq = self._read_config_seq()
+        await self._renew()
+        if not self.is_leader:
+            logger.info(f"Running as follower; leader is {self.leader}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop and hand the lease over immediately instead of letting it expire"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self.is_leader:
+            await self._demote("shutting down", logging.INFO)
+        try:
+            with self.db.transaction() as conn:
+                conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (LEADER_LEASE, self.owner))
+                # A digest still in flight keeps its claim until the lease expires
+                if not self.aggregator.has_claims():
+                    conn.execute("DELETE FROM leases WHERE name = ?", (WORKER_LEASE_PREFIX + self.owner,))
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to release the leases: {str(e)}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.sync_poll_seconds)
+            try:
+                await self._poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Coordination failed: {str(e)}", exc_info=True)
+
+    async def _poll(self):
+        """Pick up other workers' changes, and renew the lease when due"""
+        if self.aggregator.sync():
+            self.syncs += 1
+            if self._on_changed is not None:
+                await self._on_changed()
+
+        config_seq = self._read_config_seq()
+        if config_seq != self.config_seq:
+            self.config_seq = config_seq
+            logger.info("Configuration changed by another worker, reloading")
+            if self._on_config_changed is not None:
+                await self._on_config_changed()
+
+        if time.monotonic() - self._last_renewal >= settings.leader_renew_seconds:
+            await self._renew()
+
+    def _read_config_seq(self) -> int:
+        return self.db.reader().execute("SELECT config_seq FROM sync_state").fetchone()[0]
+
+    def _local_next_run(self) -> Optional[float]:
+        return self._next_run() if self.is_leader and self._next_run is not None else None
+
+    async def _renew(self):
+        """Renew our worker lease and the leader lease if we hold it, take it if it expired, and learn who leads"""
+        self._last_renewal = time.monotonic()
+        now = time.time()
+        try:
+            with self.db.transaction() as conn:
+                # Only the owner extends a live lease; anyone may take an expired one
+                conn.execute("""
+                    INSERT INTO leases (name, owner, acquired_at, expires_at, next_run)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (name) DO UPDATE SET
+                        owner = excluded.owner,
+                        acquired_at = CASE WHEN leases.owner = excluded.owner
+                                           THEN leases.acquired_at ELSE excluded.acquired_at END,
+                        expires_at = excluded.expires_at,
+                        next_run = excluded.next_run
+                    WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+                """, (LEADER_LEASE, self.owner, now, now + settings.leader_lease_seconds, self._local_next_run(), now))
+                # Our own liveness lease: digests we claimed stay ours while it is current
+                conn.execute("""
+                    INSERT INTO leases (name, owner, acquired_at, expires_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (name) DO UPDATE SET expires_at = excluded.expires_at
+                """, (WORKER_LEASE_PREFIX + self.owner, self.owner, now, now + settings.leader_lease_seconds))
+                leader, expires_at, next_run = conn.execute(
+                    "SELECT owner, expires_at, next_run FROM leases WHERE name = ?", (LEADER_LEASE,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to renew the leader lease: {str(e)}")
+            # Another worker may take over once our lease runs out: stop acting as leader first
+            if self.is_leader and time.time() >= self._lease_expires - settings.leader_renew_seconds:
+                await self._demote("could not renew the lease")
+            return
+
+        self.leader = leader
+        if leader != self.owner:
+            self.leader_next_run = next_run
+            if self.is_leader:
+                await self._demote(f"lease taken over by {leader}")
+            return
+
+        self._lease_expires = expires_at
+        if not self.is_leader:
+            await self._elect()
+            # Announce the schedule now rather than at the next renewal
+            self.leader_next_run = self._local_next_run()
+            with self.db.transaction() as conn:
+                conn.execute(
+                    "UPDATE leases SET next_run = ? WHERE name = ? AND owner = ?",
+                    (self.leader_next_run, LEADER_LEASE, self.owner)
+                )
+        else:
+            self.leader_next_run = self._local_next_run()
+
+    async def _elect(self):
+        self.is_leader = True
+        self.elections += 1
+        logger.info(f"Elected leader ({self.owner}); running the scheduler")
+        if self._on_elected is not None:
+            await self._on_elected()
+
+    async def _demote(self, reason: str, level: int = logging.WARNING):
+        self.is_leader = False
+        self.demotions += 1
+        logger.log(level, f"No longer the leader ({reason}); stopping the scheduler")
+        if self._on_demoted is not None:
+            await self._on_demoted()
+
+    def record_config_change(self):
+        """Tell the other workers to reload the saved configuration"""
+        with self.db.transaction() as conn:
+            conn.execute("UPDATE sync_state SET config_seq = config_seq + 1")
+            self.config_seq = conn.execute("SELECT config_seq FROM sync_state").fetchone()[0]
+
+    def get_stats(self) -> dict:
+        """Get coordination status"""
+        return {
+            "worker": self.owner,
+            "is_leader": self.is_leader,
+            "leader": self.leader,
+            "lease_expires_at": datetime.fromtimestamp(self._lease_expires).isoformat() if self.is_leader else None,
+            "change_seq": self.aggregator.change_seq,
+            "elections": self.elections,
+            "demotions": self.demotions,
+            "syncs": self.syncs
+        }
+
+
+# Global instance
+coordinator = Coordinator(aggregator)
@@ -0,0 +1,177 @@
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+class Database:
+    """
+    Long-lived SQLite connections shared by everything that touches the database.
+
+    Writes go through a single connection serialized behind a lock and wrapped
+    in explicit transactions. Each thread gets its own reader connection, so
+    with WAL enabled readers never block on (or get blocked by) the writer.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._write_lock = threading.RLock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new connection with the tuned pragmas applied"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=settings.sqlite_busy_timeout_ms / 1000,
+            isolation_level=None,  # Transactions are managed explicitly
+            check_same_thread=False,
+            cached_statements=settings.sqlite_cached_statements
+        )
+
+        synchronous = settings.sqlite_synchronous.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            logger.warning(f"Invalid SQLite synchronous mode '{settings.sqlite_synchronous}', using NORMAL")
+            synchronous = "NORMAL"
+
+        conn.execute(f"PRAGMA synchronous = {synchronous}")
+        # Negative cache_size is in KiB rather than pages
+        conn.execute(f"PRAGMA cache_size = -{int(settings.sqlite_cache_size_kb)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def _writer_connection(self) -> sqlite3.Connection:
+        if self._writer is None:
+            conn = self._connect()
+            # File settings, so readers leave them alone; auto_vacuum must precede
+            # the WAL switch to take effect on a new database file
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("PRAGMA journal_mode = WAL")
+            self._writer = conn
+        return self._writer
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run a write transaction on the shared writer connection"""
+        with self._write_lock:
+            conn = self._writer_connection()
+
+            if conn.in_transaction:
+                # Nested use joins the outer transaction
+                yield conn
+                return
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                conn.execute("COMMIT")
+
+    @contextmanager
+    def snapshot(self) -> Iterator[sqlite3.Connection]:
+        """Run several reads on this thread's reader against one consistent snapshot"""
+        conn = self.reader()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def enable_incremental_vacuum(self) -> bool:
+        """
+        Switch a database created without auto_vacuum to incremental mode.
+        This needs one full VACUUM; returns True if it had to run.
+        """
+        with self._write_lock:
+            conn = self._writer_connection()
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return False
+            logger.info("Converting database to incremental auto-vacuum (one-time VACUUM)")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            return True
+
+    def incremental_vacuum(self, max_pages: int) -> int:
+        """Return up to max_pages free pages to the filesystem; returns the number freed"""
+        with self._write_lock:
+            conn = self._writer_connection()
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if before:
+                # execute() would only step the pragma once, freeing a single page
+                conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)})")
+            return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    def optimize(self):
+        """Let SQLite refresh query planner statistics where they are stale"""
+        with self._write_lock:
+            self._writer_connection().execute("PRAGMA optimize")
+
+    def page_size(self) -> int:
+        return self.reader().execute("PRAGMA page_size").fetchone()[0]
+
+    def page_count(self) -> int:
+        return self.reader().execute("PRAGMA page_count").fetchone()[0]
+
+    def reader(self) -> sqlite3.Connection:
+        """Get this thread's read-only connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            conn.execute("PRAGMA query_only = ON")
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def close(self):
+        """Close every connection opened by this manager"""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+
+        self._local = threading.local()
+        logger.info(f"Closed database connections for {self.db_path}")
+
+
+_databases: Dict[str, Database] = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(db_path: Optional[str] = None) -> Database:
+    """Get the shared connection manager for a database file"""
+    db_path = db_path or settings.db_path
+    with _databases_lock:
+        db = _databases.get(db_path)
+        if db is None:
+            db = Database(db_path)
+            _databases[db_path] = db
+        return db
+
+
+def close_databases():
+    """Close all shared connection managers (called on shutdown)"""
+    with _databases_lock:
+        for db in _databases.values():
+            db.close()
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import aiohttp
+
+from app.config import settings
+from app.models import DeliveryResult
+from app.metrics import DISCORD_RESPONSES
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitBucket:
+    """
+    Local token bucket for one webhook URL.
+
+    Starts from the configured limit and is corrected from Discord's
+    X-RateLimit-* headers on every response, so we wait before hitting a 429
+    instead of after.
+    """
+
+    def __init__(self, capacity: int, window: float):
+        self.capacity = max(1, capacity)
+        self.refill_rate = self.capacity / window if window > 0 else float("inf")
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a request may be sent, then take a token"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.refill_rate)
+
+    def block_for(self, seconds: float):
+        """Hold all requests for this bucket for the given time"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        """Sync the bucket with Discord's rate limit headers"""
+        limit = headers.get("X-RateLimit-Limit")
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+
+        try:
+            if limit is not None:
+                self.capacity = max(1, int(limit))
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+                if int(remaining) == 0 and reset_after is not None:
+                    self.block_for(float(reset_after))
+                    self.tokens = 0.0
+        except ValueError:
+            logger.debug(f"Ignoring malformed rate limit headers: {dict(headers)}")
+
+
+class WebhookDelivery:
+    """
+    Posts payloads to Discord webhooks, respecting rate limits and retrying
+    429 and 5xx responses with jittered exponential backoff within a deadline.
+    """
+
+    def __init__(self, get_session: Callable[[], Awaitable[aiohttp.ClientSession]]):
+        self._get_session = get_session
+        self._buckets: Dict[str, RateLimitBucket] = {}
+
+    def _bucket(self, url: str) -> RateLimitBucket:
+        bucket = self._buckets.get(url)
+        if bucket is None:
+            bucket = RateLimitBucket(settings.discord_rate_limit_requests, settings.discord_rate_limit_window)
+            self._buckets[url] = bucket
+        return bucket
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        ceiling = min(settings.discord_retry_max_delay, settings.discord_retry_base_delay * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    async def _retry_after(self, response: aiohttp.ClientResponse) -> float:
+        """Read how long Discord wants us to wait after a 429"""
+        try:
+            body = await response.json(content_type=None)
+            if isinstance(body, dict) and body.get("retry_after") is not None:
+                return float(body["retry_after"])
+        except (ValueError, aiohttp.ClientError):
+            pass
+
+        for header in ("Retry-After", "X-RateLimit-Reset-After"):
+            if response.headers.get(header):
+                try:
+                    return float(response.headers[header])
+                except ValueError:
+                    pass
+
+        return settings.discord_retry_base_delay
+
+    async def post(self, url: str, payload: dict, params: Optional[dict] = None) -> DeliveryResult:
+        """Post a payload, retrying transient failures until the deadline"""
+        bucket = self._bucket(url)
+        deadline = time.monotonic() + settings.discord_retry_deadline
+        result = DeliveryResult(success=False)
+
+        while result.attempts < settings.discord_max_attempts:
+            await bucket.acquire()
+            result.attempts += 1
+
+            try:
+                session = await self._get_session()
+                async with session.post(url, json=payload, params=params) as response:
+                    bucket.update_from_headers(response.headers)
+                    result.status = response.status
+                    DISCORD_RESPONSES.inc(status=response.status)
+
+                    if response.status in (200, 204):
+                        result.success = True
+                        result.error = None
+                        if response.status == 200:
+                            try:
+                                result.response = await response.json(content_type=None)
+                            except (ValueError, aiohttp.ClientError) as e:
+                                # The message was posted; retrying would post it twice
+                                logger.warning(f"Discord accepted the message but its response was unreadable: {e}")
+                        return result
+
+                    if response.status == 429:
+                        retry_after = await self._retry_after(response)
+                        bucket.block_for(retry_after)
+                        delay = retry_after + random.uniform(0, settings.discord_retry_base_delay / 4)
+                        result.error = f"Rate limited, retry after {retry_after:.2f}s"
+                    elif response.status >= 500:
+                        delay = self._backoff(result.attempts - 1)
+                        result.error = f"{response.status} - {await response.text()}"
+                    else:
+                        # Client errors won't succeed on retry
+                        result.error = f"{response.status} - {await response.text()}"
+                        return result
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                DISCORD_RESPONSES.inc(status="error")
+                delay = self._backoff(result.attempts - 1)
+                result.status = None
+                result.error = str(e) or type(e).__name__
+
+            if result.attempts >= settings.discord_max_attempts:
+                break
+
+            if time.monotonic() + delay > deadline:
+                logger.warning(f"Giving up on Discord delivery: retry would pass the {settings.discord_retry_deadline}s deadline")
+                break
+
+            logger.warning(f"Discord delivery attempt {result.attempts} failed ({result.error}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+        return result
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Collection, List, Optional, Set, Tuple
+
+from app.aggregator import aggregator
+from app.discord_sender import discord_sender
+from app.models import DeliveryResult, DigestBatch, DigestRun
+from app.metrics import DIGEST_STAGE_SECONDS, DIGEST_RUNS
+from app.profiling import profiler
+from app.events import event_broadcaster
+
+logger = logging.getLogger(__name__)
+
+
+class DigestEngine:
+    """
+    Single-flight digest runner shared by the cron job, the threshold trigger
+    and the manual send endpoint.
+
+    Only one run is ever in progress. Triggers that arrive while a run is in
+    progress coalesce into a single pending run that starts as soon as the
+    current one finishes, and every caller gets the run that covers it.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._next: Optional[asyncio.Future] = None
+        self._next_trigger: Optional[str] = None
+        self._next_coalesced = 0
+        self.last_run: Optional[DigestRun] = None
+        self.total_runs = 0
+        self.total_coalesced = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def trigger(self, trigger: str = "manual") -> asyncio.Future:
+        """
+        Request a digest run without waiting for it.
+        Returns a future resolving to the DigestRun that covers this request.
+        """
+        if self._next is None:
+            self._next = asyncio.get_running_loop().create_future()
+            self._next_trigger = trigger
+            self._next_coalesced = 0
+        else:
+            self._next_coalesced += 1
+            self.total_coalesced += 1
+            logger.debug(f"Digest trigger '{trigger}' coalesced into pending run")
+
+        future = self._next
+        if not self.running:
+            self._task = asyncio.create_task(self._run_pending(), name="digest-engine")
+        return future
+
+    async def run(self, trigger: str = "manual") -> DigestRun:
+        """Request a digest run and wait for it to finish"""
+        return await asyncio.shield(self.trigger(trigger))
+
+    async def _run_pending(self):
+        """Keep running while triggers are pending"""
+        while self._next is not None:
+            future, trigger, coalesced = self._next, self._next_trigger, self._next_coalesced
+            self._next = None
+
+            if profiler.digest_runs_left and profiler.take_digest_run():
+                run, profile = await profiler.profile("digest", self._run_once(trigger))
+                run.profile = profile
+            else:
+                run = await self._run_once(trigger)
+            run.coalesced_triggers = coalesced
+            if not future.done():
+                future.set_result(run)
+
+    @contextmanager
+    def _timed(self, run: DigestRun, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            run.timings_ms[stage] = round(elapsed * 1000, 3)
+            DIGEST_STAGE_SECONDS.observe(elapsed, stage=stage)
+
+    def _settle(self, batch: DigestBatch, result: DeliveryResult, exclude: Collection[str] = ()) -> str:
+        """
+        Record each destination's outcome and settle the digest's items:
+        processed once every destination has it (or had nothing to receive),
+        kept claimed for a retry of the failed destinations if any destination
+        has it, released to the backlog otherwise. Returns sent, partial or failed.
+        """
+        if result.destinations:
+            aggregator.record_deliveries(batch.digest_id, result.destinations)
+            failed = [destination for destination in result.destinations if not destination.success]
+        else:
+            # Not attempted at all (no destinations configured), or nothing left to send to
+            failed = [result] if result.error else []
+
+        if not failed:
+            aggregator.mark_digest_processed(batch)
+            return "sent"
+        # Never resend to destinations that have it: retry only the failed ones
+        if result.success or exclude:
+            aggregator.defer_digest(batch)
+            return "partial"
+        aggregator.release_digest(batch)
+        return "failed"
+
+    async def _retry_partial(self, run: DigestRun, retries: List[Tuple[DigestBatch, Set[str]]]):
+        """Send partly delivered digests to the destinations that don't have them yet"""
+        for batch, done in retries:
+            try:
+                rendered = discord_sender.render_digest(batch.digest)
+                result = await discord_sender.deliver(rendered, batch.digest.total_items, exclude=done)
+                run.retried[batch.digest_id] = self._settle(batch, result, exclude=done)
+            except Exception as e:
+                logger.error(f"Error retrying digest {batch.digest_id}: {str(e)}", exc_info=True)
+                aggregator.defer_digest(batch)
+                run.retried[batch.digest_id] = "partial"
+
+    async def _run_once(self, trigger: str) -> DigestRun:
+        """Retry partly delivered digests, then claim, render, send and mark a new one"""
+        run = DigestRun(trigger=trigger, started_at=datetime.now())
+        self.total_runs += 1
+        logger.info(f"Generating and sending digest (trigger: {trigger})...")
+        event_broadcaster.publish("digest", {"status": run.status, "trigger": trigger})
+
+        batch = None
+        try:
+            with self._timed(run, "aggregate"):
+                # Claims of workers that stopped mid-send go back to the backlog first
+                aggregator.release_stale_claims()
+                retries = aggregator.claim_partial_digests()
+                try:
+                    batch = aggregator.claim_digest()
+                except Exception:
+                    # The retries never started: hand them back, or they would stay claimed by us
+                    for retry, _ in retries:
+                        aggregator.defer_digest(retry)
+                    raise
+
+            if retries:
+                with self._timed(run, "retry"):
+                    await self._retry_partial(run, retries)
+
+            if not batch:
+                if retries:
+                    run.status = "sent" if all(outcome == "sent" for outcome in run.retried.values()) else "partial"
+                    return run
+                logger.info("No unprocessed items to send")
+                run.status = "empty"
+                return run
+
+            run.digest_id = batch.digest_id
+            run.item_count = batch.digest.total_items
+
+            with self._timed(run, "render"):
+                rendered = discord_sender.render_digest(batch.digest)
+            run.pages = sum(len(payloads) for payloads in rendered.values())
+
+            with self._timed(run, "send"):
+                result = await discord_sender.deliver(rendered, batch.digest.total_items)
+            for destination in result.destinations:
+                if not destination.success:
+                    run.destinations[destination.destination] = "failed"
+                else:
+                    run.destinations[destination.destination] = "skipped" if destination.skipped else "sent"
+                run.message_ids[destination.destination] = destination.message_ids
+
+            with self._timed(run, "mark"):
+                run.status = self._settle(batch, result)
+
+            if run.status == "sent":
+                logger.info("Digest sent and items marked as processed")
+            elif run.status == "partial":
+                run.error = result.error
+                logger.error(f"Digest only partly delivered, failed destinations will be retried: {result.error}")
+            else:
+                run.error = result.error
+                logger.error("Failed to send digest, items remain unprocessed")
+
+        except Exception as e:
+            logger.error(f"Error running digest: {str(e)}", exc_info=True)
+            if batch is not None and run.status == "running":
+                aggregator.release_digest(batch)
+            run.status = "error"
+            run.error = str(e)
+
+        finally:
+            run.finished_at = datetime.now()
+            self.last_run = run
+            DIGEST_RUNS.inc(status=run.status)
+            logger.info(f"Digest run finished: {run.status} {run.timings_ms}")
+            event_broadcaster.publish("digest", {
+                "status": run.status,
+                "trigger": trigger,
+                "item_count": run.item_count,
+                "error": run.error
+            })
+            event_broadcaster.publish_stats()
+
+        return run
+
+    def get_stats(self) -> dict:
+        """Get engine status and the last run's timings"""
+        return {
+            "running": self.running,
+            "pending": self._next is not None,
+            "total_runs": self.total_runs,
+            "coalesced_triggers": self.total_coalesced,
+            "last_run": self.last_run.model_dump(mode="json") if self.last_run else None
+        }
+
+
+# Global instance
+digest_engine = DigestEngine()
@@ -0,0 +1,204 @@
+import itertools
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime
+from operator import attrgetter
+from typing import Dict, Hashable, NamedTuple, Optional, Tuple
+
+from app.config import settings
+from app.models import (
+    MediaItem, MediaType, DigestData,
+    TVShowAggregation, MovieAggregation, MusicAggregation
+)
+
+logger = logging.getLogger(__name__)
+
+# Shared so keys of items without a ratingKey never collide across states
+_unkeyed = itertools.count()
+
+
+class _Entry(NamedTuple):
+    """The fields of a pending media item that contribute to a digest"""
+    media_type: str
+    title: str
+    year: Optional[int]
+    show_title: Optional[str]
+    season_number: Optional[int]
+    episode_number: Optional[int]
+    artist: Optional[str]
+    album: Optional[str]
+    thumb_url: Optional[str]
+    added_at: datetime
+
+
+class DigestState:
+    """
+    Running aggregation of unprocessed media items.
+
+    Every insert updates the show -> season -> episodes, artist -> albums and
+    movie groupings in place, so building a digest only walks the groups that
+    end up in the output instead of re-reading the whole backlog.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Forget all pending items"""
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._movies: Dict[Hashable, _Entry] = {}
+        self._show_seasons: Dict[str, Dict[int, Counter]] = defaultdict(lambda: defaultdict(Counter))
+        # Thumb of each show's earliest item, with its added_at
+        self._show_thumbs: Dict[str, Tuple[datetime, str]] = {}
+        self._artist_albums: Dict[str, Counter] = defaultdict(Counter)
+        self.type_counts: Counter = Counter()
+        self.digest_start: Optional[datetime] = None
+        self.digest_end: Optional[datetime] = None
+
+    @property
+    def total_items(self) -> int:
+        return len(self._entries)
+
+    def _key(self, media_type: str, rating_key: Optional[str]) -> Hashable:
+        """Dedupe key matching the database's unique pending-item index"""
+        if rating_key is None:
+            return ("unkeyed", next(_unkeyed))
+        return (rating_key, media_type)
+
+    def has_item(self, media_type: str, rating_key: Optional[str]) -> bool:
+        """Check whether an item is already pending"""
+        return rating_key is not None and (rating_key, media_type) in self._entries
+
+    def add_item(self, item: MediaItem) -> bool:
+        """
+        Apply a newly stored media item.
+        Returns False if it replaced an item that was already pending.
+        """
+        return self._add(self._key(item.media_type, item.rating_key), _Entry(
+            item.media_type, item.title, item.year,
+            item.show_title, item.season_number, item.episode_number,
+            item.artist, item.album, item.thumb_url, item.added_at
+        ))
+
+    def add_row(self, row: tuple) -> bool:
+        """
+        Apply a database row of (media_type, title, year, show_title,
+        season_number, episode_number, artist, album, thumb_url, added_at,
+        rating_key), with added_at in epoch seconds
+        """
+        *fields, added_at, rating_key = row
+        return self._add(self._key(fields[0], rating_key), _Entry(*fields, datetime.fromtimestamp(added_at)))
+
+    def merge(self, other: "DigestState"):
+        """Fold another state's items into this one (used when a claim is released)"""
+        for key, entry in other._entries.items():
+            self._add(key, entry)
+
+    def _add(self, key: Hashable, entry: _Entry) -> bool:
+        previous = self._entries.get(key)
+
+        if previous is not None:
+            # Same as the database upsert: refresh metadata, keep added_at
+            self._discard(key, previous)
+            entry = entry._replace(
+                added_at=previous.added_at,
+                thumb_url=entry.thumb_url or previous.thumb_url
+            )
+
+        self._entries[key] = entry
+        self._apply(key, entry)
+
+        if previous is None:
+            self.type_counts[entry.media_type] += 1
+            if self.digest_start is None or entry.added_at < self.digest_start:
+                self.digest_start = entry.added_at
+            if self.digest_end is None or entry.added_at > self.digest_end:
+                self.digest_end = entry.added_at
+
+        return previous is None
+
+    def _apply(self, key: Hashable, entry: _Entry):
+        if entry.media_type == MediaType.MOVIE:
+            self._movies[key] = entry
+
+        elif entry.media_type == MediaType.TV_SHOW:
+            show = entry.show_title
+            self._show_seasons[show][entry.season_number][entry.episode_number] += 1
+            # Keep the thumb of the earliest added item, like the sql and python engines
+            # (backfilled items can arrive after newer ones)
+            thumb = self._show_thumbs.get(show)
+            if entry.thumb_url and (thumb is None or entry.added_at < thumb[0]):
+                self._show_thumbs[show] = (entry.added_at, entry.thumb_url)
+
+        elif entry.media_type == MediaType.MUSIC:
+            if entry.artist and entry.album:
+                self._artist_albums[entry.artist][entry.album] += 1
+
+    def _discard(self, key: Hashable, entry: _Entry):
+        if entry.media_type == MediaType.MOVIE:
+            self._movies.pop(key, None)
+
+        elif entry.media_type == MediaType.TV_SHOW:
+            seasons = self._show_seasons[entry.show_title]
+            episodes = seasons[entry.season_number]
+            episodes[entry.episode_number] -= 1
+            if episodes[entry.episode_number] <= 0:
+                del episodes[entry.episode_number]
+            if not episodes:
+                del seasons[entry.season_number]
+            if not seasons:
+                del self._show_seasons[entry.show_title]
+                self._show_thumbs.pop(entry.show_title, None)
+
+        elif entry.media_type == MediaType.MUSIC:
+            if entry.artist and entry.album:
+                albums = self._artist_albums[entry.artist]
+                albums[entry.album] -= 1
+                if albums[entry.album] <= 0:
+                    del albums[entry.album]
+                if not albums:
+                    del self._artist_albums[entry.artist]
+
+    def build(self) -> Optional[DigestData]:
+        """Build a digest from the current state"""
+        if not self._entries:
+            return None
+
+        movies = []
+        if settings.enable_movies:
+            # In added_at order, whatever order they arrived in
+            movies = [
+                MovieAggregation(title=movie.title, year=movie.year, thumb_url=movie.thumb_url)
+                for movie in sorted(self._movies.values(), key=attrgetter("added_at"))
+            ]
+
+        tv_shows = []
+        if settings.enable_tv_shows:
+            for show in sorted(self._show_seasons):
+                seasons = self._show_seasons[show]
+                for season in sorted(seasons):
+                    episodes = sorted(seasons[season])
+                    thumb = self._show_thumbs.get(show)
+                    tv_shows.append(TVShowAggregation(
+                        show_title=show,
+                        season_number=season,
+                        episodes=episodes,
+                        episode_count=len(episodes),
+                        thumb_url=thumb[1] if thumb else None
+                    ))
+
+        music = []
+        if settings.enable_music:
+            music = [
+                MusicAggregation(artist=artist, albums=sorted(self._artist_albums[artist]))
+                for artist in sorted(self._artist_albums)
+            ]
+
+        return DigestData(
+            movies=movies,
+            tv_shows=tv_shows,
+            music=music,
+            total_items=len(self._entries),
+            digest_start=self.digest_start,
+            digest_end=self.digest_end
+        )
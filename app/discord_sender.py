@@ -1,10 +1,13 @@
 import aiohttp
+import asyncio
 import logging
 from datetime import datetime
-from typing import Optional
+from typing import Collection, Dict, List, Optional, Tuple
 
 from app.config import settings
-from app.models import DigestData
+from app.delivery import WebhookDelivery
+from app.models import DigestData, DeliveryResult, DiscordDestination
+from app.embed_builder import EmbedPaginator
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +16,11 @@ class DiscordSender:
     """Handles sending digests to Discord via webhook"""
     
     def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.delivery = WebhookDelivery(self._get_session)
+        self.destination_stats: Dict[str, dict] = {}
+        # Bumped on every configuration change; keys caches of rendered digests
+        self.config_version = 0
         self.update_config()
     
     def update_config(self):
@@ -20,10 +28,67 @@ class DiscordSender:
         self.webhook_url = settings.discord_webhook_url
         self.username = settings.discord_username
         self.avatar_url = settings.discord_avatar_url
+        self.destinations = self._load_destinations()
+        self.config_version += 1
+    
+    def _load_destinations(self) -> List[DiscordDestination]:
+        """Build the destination list from the main webhook URL plus any extra destinations"""
+        destinations = []
+        if self.webhook_url:
+            destinations.append(DiscordDestination(
+                name="default",
+                webhook_url=self.webhook_url,
+                enable_movies=settings.enable_movies,
+                enable_tv_shows=settings.enable_tv_shows,
+                enable_music=settings.enable_music
+            ))
+        
+        for index, config in enumerate(settings.discord_destinations, start=1):
+            try:
+                config = {"name": f"destination-{index}", **config}
+                destination = DiscordDestination(**config)
+            except Exception as e:
+                logger.error(f"Invalid Discord destination #{index}: {str(e)}")
+                continue
+            
+            if any(existing.name == destination.name for existing in destinations):
+                logger.error(f"Duplicate Discord destination name '{destination.name}', skipping")
+                continue
+            destinations.append(destination)
+        
+        return destinations
+    
+    async def start(self):
+        """Open the shared HTTP session (called from the app lifespan)"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.discord_pool_limit,
+                ttl_dns_cache=settings.discord_dns_cache_ttl,
+                keepalive_timeout=settings.discord_keepalive_timeout
+            )
+            timeout = aiohttp.ClientTimeout(
+                sock_connect=settings.discord_connect_timeout,
+                sock_read=settings.discord_read_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            logger.info("Discord HTTP session opened")
+    
+    async def close(self):
+        """Close the shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("Discord HTTP session closed")
+        self._session = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get the shared session, opening it if used outside the lifespan"""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
     
     async def send_digest(self, digest: DigestData) -> bool:
-        """Send a digest to Discord"""
-        if not self.webhook_url:
+        """Send a digest to every Discord destination"""
+        if not self.destinations:
             logger.warning("Discord webhook URL not configured. Please configure via Web UI.")
             return False
         
@@ -31,105 +96,220 @@ class DiscordSender:
             logger.info("No items in digest, skipping send")
             return False
         
-        try:
-            embed = self._build_embed(digest)
-            
+        result = await self.deliver(self.render_digest(digest), digest.total_items)
+        return result.success
+    
+    def render_digest(self, digest: DigestData) -> Dict[Tuple[bool, bool, bool], List[dict]]:
+        """
+        Render a digest once per distinct destination filter.
+        Returns the webhook payloads (one per message) keyed by media filter.
+        """
+        rendered = {}
+        for destination in self.destinations:
+            media_filter = destination.media_filter()
+            if media_filter not in rendered:
+                rendered[media_filter] = self._render_payloads(self._filter_digest(digest, media_filter))
+        return rendered
+    
+    def render_preview(self, digest: DigestData) -> Dict[str, List[dict]]:
+        """
+        Render a digest the way each destination would receive it, by destination name.
+        Without destinations, renders it with the global media type settings.
+        """
+        if not self.destinations:
+            media_filter = (settings.enable_movies, settings.enable_tv_shows, settings.enable_music)
+            return {"default": self._render_payloads(self._filter_digest(digest, media_filter))}
+        
+        rendered = self.render_digest(digest)
+        return {destination.name: rendered[destination.media_filter()] for destination in self.destinations}
+    
+    def _filter_digest(self, digest: DigestData, media_filter: Tuple[bool, bool, bool]) -> DigestData:
+        """Drop the media types a destination doesn't want"""
+        enable_movies, enable_tv_shows, enable_music = media_filter
+        if all(media_filter):
+            return digest
+        return digest.model_copy(update={
+            "movies": digest.movies if enable_movies else [],
+            "tv_shows": digest.tv_shows if enable_tv_shows else [],
+            "music": digest.music if enable_music else []
+        })
+    
+    def _render_payloads(self, digest: DigestData) -> List[dict]:
+        """Render a digest into one Discord webhook payload per message"""
+        if not (digest.movies or digest.tv_shows or digest.music):
+            return []
+        
+        payloads = []
+        for embeds in self._build_messages(digest):
             payload = {
                 "username": self.username,
-                "embeds": [embed]
+                "embeds": embeds
             }
             
             if self.avatar_url:
                 payload["avatar_url"] = self.avatar_url
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.webhook_url, json=payload) as response:
-                    if response.status == 204:
-                        logger.info(f"Successfully sent digest with {digest.total_items} items")
-                        return True
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Failed to send digest: {response.status} - {error_text}")
-                        return False
+            payloads.append(payload)
+        
+        return payloads
+    
+    async def deliver(
+        self,
+        rendered: Dict[Tuple[bool, bool, bool], List[dict]],
+        total_items: int,
+        exclude: Collection[str] = ()
+    ) -> DeliveryResult:
+        """
+        Send rendered digests concurrently to all destinations not in exclude
+        (those that already have this digest). Succeeds if at least one
+        destination actually received its pages; destinations with nothing
+        to receive are skipped and don't count.
+        """
+        if not self.destinations:
+            logger.warning("Discord webhook URL not configured. Please configure via Web UI.")
+            return DeliveryResult(success=False, error="Discord webhook URL not configured")
+        
+        semaphore = asyncio.Semaphore(max(1, settings.discord_max_concurrent_sends))
+        
+        async def send(destination: DiscordDestination) -> DeliveryResult:
+            async with semaphore:
+                payloads = rendered.get(destination.media_filter(), [])
+                return await self._deliver_to(destination, payloads, total_items)
+        
+        destinations = [destination for destination in self.destinations if destination.name not in exclude]
+        results = await asyncio.gather(*(send(destination) for destination in destinations))
+        
+        failed = [result for result in results if not result.success]
+        return DeliveryResult(
+            success=any(result.success and not result.skipped for result in results),
+            attempts=sum(result.attempts for result in results),
+            error="; ".join(f"{result.destination}: {result.error}" for result in failed) or None,
+            destinations=list(results)
+        )
+    
+    async def _deliver_to(self, destination: DiscordDestination, payloads: List[dict], total_items: int) -> DeliveryResult:
+        """Post rendered digest messages to one destination in order, collecting their message ids"""
+        stats = self.destination_stats.setdefault(destination.name, {
+            "sent": 0, "failed": 0, "last_status": None, "last_error": None, "last_sent_at": None
+        })
+        
+        if not payloads:
+            logger.info(f"Nothing in digest for destination '{destination.name}', skipping")
+            return DeliveryResult(success=True, skipped=True, destination=destination.name)
+        
+        message_ids = []
+        attempts = 0
+        result = DeliveryResult(success=False, destination=destination.name)
+        try:
+            for page, payload in enumerate(payloads, start=1):
+                # wait=true makes Discord return the created message, including its id
+                result = await self.delivery.post(destination.webhook_url, payload, params={"wait": "true"})
+                result.destination = destination.name
+                attempts += result.attempts
+                
+                if not result.success:
+                    logger.error(
+                        f"Failed to send digest page {page}/{len(payloads)} to '{destination.name}' "
+                        f"after {result.attempts} attempts: {result.error}"
+                    )
+                    break
+                
+                if result.response and result.response.get("id"):
+                    message_ids.append(str(result.response["id"]))
         
         except Exception as e:
-            logger.error(f"Error sending digest to Discord: {str(e)}", exc_info=True)
-            return False
+            logger.error(f"Error sending digest to '{destination.name}': {str(e)}", exc_info=True)
+            result = DeliveryResult(success=False, destination=destination.name, error=str(e))
+        
+        result.attempts = attempts
+        result.message_ids = message_ids
+        result.response = None
+        
+        stats["last_status"] = result.status
+        if result.success:
+            stats["sent"] += 1
+            stats["last_error"] = None
+            stats["last_sent_at"] = datetime.now().isoformat()
+            logger.info(
+                f"Successfully sent digest with {total_items} items to '{destination.name}' "
+                f"in {len(payloads)} message(s): {message_ids}"
+            )
+        else:
+            stats["failed"] += 1
+            stats["last_error"] = result.error
+        
+        return result
     
-    def _build_embed(self, digest: DigestData) -> dict:
-        """Build Discord embed from digest data"""
+    def _build_messages(self, digest: DigestData) -> List[List[dict]]:
+        """Build Discord embeds from digest data, paginated into messages"""
         
         # Calculate time range
         time_range = self._format_time_range(digest.digest_start, digest.digest_end)
         
-        # Build description
-        description = f"📺 **Plex Library Update** - {time_range}\n{'─' * 50}\n\n"
+        # Add thumbnail if we have one (use first movie or show thumb)
+        thumbnail_url = None
+        if digest.movies and digest.movies[0].thumb_url:
+            thumbnail_url = digest.movies[0].thumb_url
+        elif digest.tv_shows and digest.tv_shows[0].thumb_url:
+            thumbnail_url = digest.tv_shows[0].thumb_url
+        
+        paginator = EmbedPaginator(
+            title="📬 New Media Available",
+            color=0xe5a00d,  # Plex orange color
+            timestamp=datetime.utcnow().isoformat(),
+            footer={
+                "text": f"Digestarr v{settings.app_version}",
+                "icon_url": "https://raw.githubusercontent.com/Plex-Inc/plex-media-player/master/resources/images/icon.png"
+            },
+            thumbnail_url=thumbnail_url
+        )
+        
+        # Header
+        paginator.add_block([f"📺 **Plex Library Update** - {time_range}\n", f"{'─' * 50}\n", "\n"])
         
         # Add movies section
         if digest.movies:
-            description += f"🎬 **Movies** ({len(digest.movies)} added)\n"
-            for movie in digest.movies:
-                year_str = f" ({movie.year})" if movie.year else ""
-                description += f"  • {movie.title}{year_str}\n"
-            description += "\n"
+            paginator.add_section(
+                f"🎬 **Movies** ({len(digest.movies)} added)\n",
+                (
+                    f"  • {movie.title}{f' ({movie.year})' if movie.year else ''}\n"
+                    for movie in digest.movies
+                )
+            )
         
         # Add TV shows section
         if digest.tv_shows:
             total_episodes = sum(show.episode_count for show in digest.tv_shows)
-            description += f"📺 **TV Shows** ({total_episodes} episodes added)\n"
-            for show in digest.tv_shows:
-                episode_range = show.format_episode_range()
-                description += f"  • {show.show_title} - {show.episode_count} episode"
-                if show.episode_count != 1:
-                    description += "s"
-                description += f" ({episode_range})\n"
-            description += "\n"
+            paginator.add_section(
+                f"📺 **TV Shows** ({total_episodes} episodes added)\n",
+                (
+                    f"  • {show.show_title} - {show.episode_count} episode{'s' if show.episode_count != 1 else ''}"
+                    f" ({show.format_episode_range()})\n"
+                    for show in digest.tv_shows
+                )
+            )
         
         # Add music section
         if digest.music:
             total_albums = sum(len(artist.albums) for artist in digest.music)
-            description += f"🎵 **Music** ({total_albums} album"
-            if total_albums != 1:
-                description += "s"
-            description += " added)\n"
-            for artist_data in digest.music:
-                albums_str = ", ".join(artist_data.albums)
-                description += f"  • {artist_data.artist} - {albums_str}\n"
-            description += "\n"
-        
-        # Add footer with total library info (optional)
-        description += f"{'─' * 50}\n"
-        description += f"📊 Total items added: {digest.total_items}\n"
+            paginator.add_section(
+                f"🎵 **Music** ({total_albums} album{'s' if total_albums != 1 else ''} added)\n",
+                (
+                    f"  • {artist_data.artist} - {', '.join(artist_data.albums)}\n"
+                    for artist_data in digest.music
+                )
+            )
+        
+        # Add footer with total library info
+        footer_lines = [f"{'─' * 50}\n", f"📊 Total items added: {digest.total_items}\n"]
         
         # Add Plex link if available
         if settings.plex_url:
-            # Clean URL for display
-            plex_display_url = settings.plex_url.replace("http://", "").replace("https://", "")
-            description += f"🔗 [Stream now on Plex]({settings.plex_url}/web)\n"
-        
-        # Build embed
-        embed = {
-            "title": "📬 New Media Available",
-            "description": description,
-            "color": 0xe5a00d,  # Plex orange color
-            "timestamp": datetime.utcnow().isoformat(),
-            "footer": {
-                "text": f"Digestarr v{settings.app_version}",
-                "icon_url": "https://raw.githubusercontent.com/Plex-Inc/plex-media-player/master/resources/images/icon.png"
-            }
-        }
+            footer_lines.append(f"🔗 [Stream now on Plex]({settings.plex_url}/web)\n")
         
-        # Add thumbnail if we have one (use first movie or show thumb)
-        thumbnail_url = None
-        if digest.movies and digest.movies[0].thumb_url:
-            thumbnail_url = digest.movies[0].thumb_url
-        elif digest.tv_shows and digest.tv_shows[0].thumb_url:
-            thumbnail_url = digest.tv_shows[0].thumb_url
-        
-        if thumbnail_url:
-            embed["thumbnail"] = {"url": thumbnail_url}
+        paginator.add_block(footer_lines)
         
-        return embed
+        return paginator.finish()
     
     def _format_time_range(self, start: datetime, end: datetime) -> str:
         """Format time range for display"""
@@ -158,32 +338,50 @@ class DiscordSender:
                 return f"{start.strftime('%B %d')} - {end.strftime('%B %d, %Y')}"
     
     async def send_test_message(self) -> bool:
-        """Send a test message to verify Discord webhook"""
-        if not self.webhook_url:
+        """Send a test message to verify every Discord destination"""
+        if not self.destinations:
             logger.warning("Discord webhook URL not configured")
             return False
         
-        try:
-            payload = {
-                "username": self.username,
-                "content": "✅ Digestarr test message - webhook is working correctly!"
-            }
-            
-            if self.avatar_url:
-                payload["avatar_url"] = self.avatar_url
+        payload = {
+            "username": self.username,
+            "content": "✅ Digestarr test message - webhook is working correctly!"
+        }
+        
+        if self.avatar_url:
+            payload["avatar_url"] = self.avatar_url
+        
+        async def send(destination: DiscordDestination) -> bool:
+            try:
+                result = await self.delivery.post(destination.webhook_url, payload)
+                if result.success:
+                    logger.info(f"Test message sent successfully to '{destination.name}'")
+                    return True
+                else:
+                    logger.error(f"Test message to '{destination.name}' failed: {result.error}")
+                    return False
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.webhook_url, json=payload) as response:
-                    if response.status == 204:
-                        logger.info("Test message sent successfully")
-                        return True
-                    else:
-                        logger.error(f"Test message failed: {response.status}")
-                        return False
+            except Exception as e:
+                logger.error(f"Error sending test message to '{destination.name}': {str(e)}", exc_info=True)
+                return False
         
-        except Exception as e:
-            logger.error(f"Error sending test message: {str(e)}", exc_info=True)
-            return False
+        results = await asyncio.gather(*(send(destination) for destination in self.destinations))
+        return all(results)
+    
+    def get_stats(self) -> List[dict]:
+        """Get per-destination delivery statistics"""
+        return [
+            {
+                "name": destination.name,
+                "media_filter": {
+                    "movies": destination.enable_movies,
+                    "tv_shows": destination.enable_tv_shows,
+                    "music": destination.enable_music
+                },
+                **self.destination_stats.get(destination.name, {"sent": 0, "failed": 0})
+            }
+            for destination in self.destinations
+        ]
 
 
 # Global instance
@@ -0,0 +1,172 @@
+import logging
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Discord limits
+DESCRIPTION_LIMIT = 4096  # Characters in one embed description
+MESSAGE_EMBED_LIMIT = 6000  # Characters across all embeds of one message
+EMBEDS_PER_MESSAGE = 10
+
+# A single line may never take more than this, so it always fits a fresh embed
+MAX_LINE_LENGTH = 2048
+
+# Room kept for the " (n/m)" page suffix added to titles once pages are counted
+TITLE_SUFFIX_RESERVE = 12
+
+
+def _clip(line: str, limit: int = MAX_LINE_LENGTH) -> str:
+    """Shorten an oversized line, keeping its trailing newline"""
+    if len(line) <= limit:
+        return line
+    return line[:limit - 2].rstrip() + "…\n"
+
+
+class EmbedPaginator:
+    """
+    Packs digest lines into embeds and messages within Discord's size limits.
+
+    Lines are collected into lists and joined once per embed, and character and
+    byte budgets are tracked as lines are added, so building is linear in the
+    size of the digest. Content is only split at section and item boundaries.
+    """
+
+    def __init__(
+        self,
+        title: str,
+        color: int,
+        footer: Optional[dict] = None,
+        timestamp: Optional[str] = None,
+        thumbnail_url: Optional[str] = None
+    ):
+        self.title = title
+        self.color = color
+        self.footer = footer
+        self.timestamp = timestamp
+        self.thumbnail_url = thumbnail_url
+
+        # Every embed reserves room for a title and the footer
+        self._overhead = len(title) + TITLE_SUFFIX_RESERVE
+        if footer:
+            self._overhead += len(footer.get("text", ""))
+
+        self._messages: List[List[dict]] = []
+        self._message: List[dict] = []
+        self._message_chars = 0
+        self._message_bytes = 0
+        self._parts: List[str] = []
+        self._chars = 0
+        self._bytes = 0
+
+        # Size of each finished message: {"embeds", "chars", "bytes"}
+        self.page_stats: List[dict] = []
+
+    def _capacity(self) -> int:
+        """Characters still available to the current embed's description"""
+        return min(DESCRIPTION_LIMIT, MESSAGE_EMBED_LIMIT - self._message_chars - self._overhead)
+
+    def _fits(self, length: int) -> bool:
+        return self._chars + length <= self._capacity()
+
+    def _push(self, text: str):
+        self._parts.append(text)
+        self._chars += len(text)
+        self._bytes += len(text.encode("utf-8"))
+
+    def _close_embed(self):
+        """Finish the current embed and add it to the current message"""
+        if not self._parts:
+            return
+
+        self._message.append({
+            "description": "".join(self._parts),
+            "color": self.color
+        })
+        self._message_chars += self._chars + self._overhead
+        self._message_bytes += self._bytes
+        self._parts = []
+        self._chars = 0
+        self._bytes = 0
+
+        if len(self._message) >= EMBEDS_PER_MESSAGE:
+            self._close_message()
+
+    def _close_message(self):
+        """Finish the current message"""
+        self._close_embed()
+        if not self._message:
+            return
+
+        self._messages.append(self._message)
+        self.page_stats.append({
+            "embeds": len(self._message),
+            "chars": self._message_chars,
+            "bytes": self._message_bytes
+        })
+        self._message = []
+        self._message_chars = 0
+        self._message_bytes = 0
+
+    def _start_embed_for(self, length: int):
+        """Move to a fresh embed (and message, if needed) with room for length characters"""
+        self._close_embed()
+        if not self._fits(length):
+            self._close_message()
+
+    def add_block(self, lines: List[str]):
+        """Add lines that should stay together in one embed"""
+        lines = [_clip(line) for line in lines]
+        length = sum(len(line) for line in lines)
+        if length > self._capacity() - self._chars:
+            self._start_embed_for(length)
+        for line in lines:
+            self.add_line(line)
+
+    def add_line(self, line: str, continuation: Optional[str] = None):
+        """Add one line, repeating the continuation heading if it starts a new embed"""
+        line = _clip(line)
+        if self._fits(len(line)):
+            self._push(line)
+            return
+
+        prefix = continuation or ""
+        self._start_embed_for(len(prefix) + len(line))
+        if prefix:
+            self._push(prefix)
+        self._push(line)
+
+    def add_section(self, heading: str, lines: Iterable[str]):
+        """Add a section; its heading always stays with its first item"""
+        continuation = heading.rstrip("\n") + " (continued)\n"
+        lines = iter(lines)
+        first = next(lines, None)
+        self.add_block([heading] if first is None else [heading, first])
+        for line in lines:
+            self.add_line(line, continuation)
+        # Blank separator line, unless the section ended exactly at a page break
+        if self._fits(1):
+            self._push("\n")
+
+    def finish(self) -> List[List[dict]]:
+        """Finish paging and decorate the embeds; returns a list of messages"""
+        self._close_message()
+        messages = self._messages
+        if not messages:
+            return []
+
+        total = len(messages)
+        for index, embeds in enumerate(messages, start=1):
+            embeds[0]["title"] = self.title if total == 1 else f"{self.title} ({index}/{total})"
+
+        if self.thumbnail_url:
+            messages[0][0]["thumbnail"] = {"url": self.thumbnail_url}
+
+        last = messages[-1][-1]
+        if self.timestamp:
+            last["timestamp"] = self.timestamp
+        if self.footer:
+            last["footer"] = self.footer
+
+        if total > 1:
+            logger.info(f"Digest split into {total} messages: {self.page_stats}")
+        return messages
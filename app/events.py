@@ -0,0 +1,146 @@
+import asyncio
+import itertools
+import json
+import logging
+from typing import AsyncIterator, Callable, Optional, Set
+
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+class _Subscriber:
+    """One connected client: a bounded buffer of encoded events"""
+
+    def __init__(self, buffer_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.closed = False
+
+
+class EventBroadcaster:
+    """
+    In-process fan-out of server-sent events to any number of clients.
+
+    Each event is encoded once and offered to every subscriber's bounded
+    buffer; publishing never waits. A client whose buffer is full is too
+    slow to keep up and is evicted: its stream ends and the browser's
+    EventSource reconnects, receiving a fresh stats snapshot, so nothing
+    is lost but stale intermediate states. Call from the event loop.
+    """
+
+    def __init__(self):
+        self._subscribers: Set[_Subscriber] = set()
+        self._ids = itertools.count(1)
+        self._snapshot: Optional[Callable[[], dict]] = None
+
+        # Statistics
+        self.events_published = 0
+        self.connections = 0
+        self.evictions = 0
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def set_snapshot(self, function: Callable[[], dict]):
+        """Function returning the current stats, sent on connect and after changes"""
+        self._snapshot = function
+
+    def _encode(self, event: str, data: dict) -> str:
+        return f"id: {next(self._ids)}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+    def publish(self, event: str, data: dict):
+        """Send an event to every connected client"""
+        if not self._subscribers:
+            return
+
+        message = self._encode(event, data)
+        self.events_published += 1
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._evict(subscriber)
+
+    def publish_stats(self):
+        """Send the current stats to every connected client"""
+        if self._subscribers and self._snapshot is not None:
+            self.publish("stats", self._snapshot())
+
+    def _evict(self, subscriber: _Subscriber):
+        # The full buffer wakes the stream, which sees the flag and ends
+        subscriber.closed = True
+        self._subscribers.discard(subscriber)
+        self.evictions += 1
+        logger.warning(f"Dropped a slow event stream client ({settings.events_client_buffer} events behind)")
+
+    def close(self):
+        """End every stream (called on shutdown)"""
+        for subscriber in list(self._subscribers):
+            subscriber.closed = True
+            try:
+                subscriber.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+        self._subscribers.clear()
+
+    async def stream(self, request: Request) -> AsyncIterator[str]:
+        """Server-sent event stream for one client"""
+        subscriber = _Subscriber(max(1, settings.events_client_buffer))
+        self._subscribers.add(subscriber)
+        self.connections += 1
+        try:
+            # Reconnect quickly after an eviction or restart, then start from a snapshot
+            yield f"retry: {settings.events_retry_ms}\n\n"
+            if self._snapshot is not None:
+                yield self._encode("stats", self._snapshot())
+
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), timeout=settings.events_keepalive_seconds)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comment line: keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+
+                if message is None or subscriber.closed:
+                    break
+                yield message
+        finally:
+            self._subscribers.discard(subscriber)
+
+    def get_stats(self) -> dict:
+        """Get broadcaster statistics"""
+        return {
+            "subscribers": self.subscribers,
+            "connections": self.connections,
+            "events_published": self.events_published,
+            "evictions": self.evictions
+        }
+
+
+# Global instance
+event_broadcaster = EventBroadcaster()
+
+
+@router.get("/api/events")
+async def events(request: Request):
+    """
+    Live updates as server-sent events: stats (counters and next run),
+    items (ingested batches) and digest (run started and finished)
+    """
+    return StreamingResponse(
+        event_broadcaster.stream(request),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx from buffering the stream
+            "X-Accel-Buffering": "no"
+        }
+    )
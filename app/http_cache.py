@@ -0,0 +1,151 @@
+import gzip
+import hashlib
+import json
+import logging
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+logger = logging.getLogger(__name__)
+
+# brotli is optional; without it responses are offered with gzip only
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 512
+
+# Compression levels: bodies built once per version get the best, per-request bodies a fast one
+BEST = {"br": 11, "gzip": 9}
+FAST = {"br": 4, "gzip": 6}
+
+
+def etag_matches(request: Request, *etags: str) -> bool:
+    """Whether If-None-Match names any of the given ETags (weak comparison, as RFC 9110 asks)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or any(etag in tags for etag in etags)
+
+
+def _accepted_encodings(request: Request) -> List[str]:
+    """Content codings the client accepts, ignoring q=0"""
+    accepted = []
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.partition(";")
+        name, _, value = params.partition("=")
+        try:
+            quality = float(value) if name.strip() == "q" else 1.0
+        except ValueError:
+            quality = 1.0
+        if coding.strip() and quality > 0:
+            accepted.append(coding.strip().lower())
+    return accepted
+
+
+class EncodedBody:
+    """
+    A response body with its compressed encodings and a strong ETag for
+    each, computed once. ETags are derived from the content, so they stay
+    valid across restarts and never match a different body.
+    """
+
+    def __init__(self, body: bytes, media_type: str, levels: Dict[str, int] = BEST):
+        self.body = body
+        self.media_type = media_type
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+
+        # Preferred encoding first
+        self.encodings: Dict[str, bytes] = {}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            if brotli is not None:
+                self.encodings["br"] = brotli.compress(body, quality=levels["br"])
+            self.encodings["gzip"] = gzip.compress(body, compresslevel=levels["gzip"], mtime=0)
+        # Only keep encodings that actually save bytes
+        self.encodings = {coding: data for coding, data in self.encodings.items() if len(data) < len(body)}
+        self.encodings["identity"] = body
+
+        # Representations differ per encoding, so their strong ETags must too
+        self.etags = {
+            coding: f'"{digest}"' if coding == "identity" else f'"{digest}-{coding}"'
+            for coding in self.encodings
+        }
+
+    def response(self, request: Request, cache_control: str = "no-cache") -> Response:
+        """The best encoding the client accepts, or 304 if it already has this body"""
+        accepted = _accepted_encodings(request)
+        coding = next(
+            (coding for coding in self.encodings if coding != "identity" and (coding in accepted or "*" in accepted)),
+            "identity"
+        )
+
+        headers = {"ETag": self.etags[coding], "Cache-Control": cache_control}
+        if len(self.encodings) > 1:
+            headers["Vary"] = "Accept-Encoding"
+
+        if etag_matches(request, *self.etags.values()):
+            return Response(status_code=304, headers=headers)
+
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        return Response(content=self.encodings[coding], media_type=self.media_type, headers=headers)
+
+
+class CachedResponse:
+    """
+    A GET response built from a render function and served as an EncodedBody.
+
+    With a version function, the body is rendered and compressed once per
+    version. Without one, it is rendered on every request, but compression
+    and the ETag are reused for as long as the content stays the same.
+    """
+
+    def __init__(
+        self,
+        render: Callable[[], Any],
+        media_type: str = "application/json",
+        version: Optional[Callable[[], Hashable]] = None,
+        cache_control: str = "no-cache"
+    ):
+        self._render = render
+        self.media_type = media_type
+        self._version = version
+        self.cache_control = cache_control
+        self._key: Optional[Hashable] = None
+        self._body: Optional[EncodedBody] = None
+
+        # Statistics
+        self.builds = 0
+
+    def _encode(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        if isinstance(content, str):
+            return content.encode("utf-8")
+        # Same serialization as JSONResponse
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    def _build(self, body: bytes, levels: Dict[str, int]) -> EncodedBody:
+        self.builds += 1
+        return EncodedBody(body, self.media_type, levels)
+
+    def get(self) -> EncodedBody:
+        """The current body, re-rendered only if its version moved"""
+        if self._version is not None:
+            key = self._version()
+            if self._body is None or key != self._key:
+                self._body = self._build(self._encode(self._render()), BEST)
+                self._key = key
+            return self._body
+
+        body = self._encode(self._render())
+        if self._body is None or body != self._body.body:
+            self._body = self._build(body, FAST)
+        return self._body
+
+    def response(self, request: Request) -> Response:
+        return self.get().response(request, self.cache_control)
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.models import MediaItem
+from app.aggregator import MediaAggregator
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueue:
+    """
+    In-process queue in front of the media store.
+
+    Webhook handlers enqueue items and return; a single writer task drains the
+    queue and inserts everything it has collected in one transaction, flushing
+    when the batch is full or the oldest queued item has waited long enough.
+    The commit runs in a worker thread, so the event loop never waits on disk
+    or on another writer. A batch that fails to commit is retried with
+    backoff until it is stored: Plex has usually been answered already.
+    """
+
+    def __init__(
+        self,
+        aggregator: MediaAggregator,
+        on_batch_written: Optional[Callable[[int], Awaitable[None]]] = None
+    ):
+        self.aggregator = aggregator
+        self.on_batch_written = on_batch_written
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._callback_tasks: Set[asyncio.Task] = set()
+        self._stopping = False
+
+        # Statistics
+        self.batches_written = 0
+        self.items_written = 0
+        self.last_batch_size = 0
+        self.max_batch_size_seen = 0
+        self.failed_batches = 0
+        self.retrying_items = 0
+
+    @property
+    def running(self) -> bool:
+        return self._writer_task is not None and not self._writer_task.done()
+
+    async def start(self):
+        """Start the writer task"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=settings.ingest_queue_max_size)
+        self._writer_task = asyncio.create_task(self._run(), name="ingest-writer")
+        logger.info(
+            f"Ingest queue started (batch size: {settings.ingest_batch_size}, "
+            f"max delay: {settings.ingest_batch_delay_ms}ms)"
+        )
+
+    async def stop(self):
+        """Flush anything still queued and stop the writer task"""
+        if not self.running:
+            return
+        # A batch still failing after this gives up instead of blocking shutdown
+        self._stopping = True
+        await self._queue.join()
+        self._writer_task.cancel()
+        try:
+            await self._writer_task
+        except asyncio.CancelledError:
+            pass
+        self._writer_task = None
+        self._stopping = False
+        logger.info("Ingest queue stopped")
+
+    async def put(self, item: MediaItem, wait: bool = False):
+        """
+        Queue a media item for insertion.
+        With wait=True, return only once the item has been committed.
+        """
+        if not self.running:
+            # No writer (e.g. during startup/shutdown), write synchronously
+            self.aggregator.add_media_items([item])
+            return
+
+        future = asyncio.get_running_loop().create_future() if wait else None
+        await self._queue.put((item, future))
+        if future is not None:
+            await future
+
+    async def _run(self):
+        """Writer loop: collect a batch, write it, repeat"""
+        while True:
+            batch = await self._collect_batch()
+            try:
+                await self._write_with_retry(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _collect_batch(self) -> List[Tuple[MediaItem, Optional[asyncio.Future]]]:
+        """Wait for the first item, then gather more until size or time limit"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + settings.ingest_batch_delay_ms / 1000
+
+        while len(batch) < settings.ingest_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _write_with_retry(self, batch: List[Tuple[MediaItem, Optional[asyncio.Future]]]):
+        """Write a batch, retrying with exponential backoff until it is stored"""
+        delay = settings.ingest_retry_delay_ms / 1000
+        while True:
+            try:
+                await self._write_batch(batch)
+                self.retrying_items = 0
+                return
+            except Exception as e:
+                self.failed_batches += 1
+                # Waiting webhooks get the error; the items themselves are kept
+                for _, future in batch:
+                    if future is not None and not future.done():
+                        future.set_exception(e)
+
+                if self._stopping:
+                    self.retrying_items = 0
+                    logger.error(f"Dropping batch of {len(batch)} items on shutdown: {str(e)}", exc_info=True)
+                    return
+
+                self.retrying_items = len(batch)
+                logger.error(f"Failed to write batch of {len(batch)} items, retrying in {delay:.1f}s: {str(e)}", exc_info=True)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, settings.ingest_retry_max_delay_ms / 1000)
+
+    async def _write_batch(self, batch: List[Tuple[MediaItem, Optional[asyncio.Future]]]):
+        """Insert a batch in one transaction and resolve any waiters"""
+        items = [item for item, _ in batch]
+        # Commit (and wait for the write lock) in a worker thread; the in-memory state is updated here
+        change = await asyncio.to_thread(self.aggregator.write_media_items, items)
+        self.aggregator.apply_media_items(items, change)
+
+        self.batches_written += 1
+        self.items_written += len(items)
+        self.last_batch_size = len(items)
+        self.max_batch_size_seen = max(self.max_batch_size_seen, len(items))
+
+        for _, future in batch:
+            if future is not None and not future.done():
+                future.set_result(None)
+
+        if self.on_batch_written:
+            task = asyncio.create_task(self.on_batch_written(len(items)))
+            self._callback_tasks.add(task)
+            task.add_done_callback(self._callback_tasks.discard)
+
+    def get_stats(self) -> dict:
+        """Get queue statistics"""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "batches_written": self.batches_written,
+            "items_written": self.items_written,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size_seen,
+            "avg_batch_size": round(self.items_written / self.batches_written, 2) if self.batches_written else 0,
+            "failed_batches": self.failed_batches,
+            "retrying_items": self.retrying_items
+        }
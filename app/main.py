@@ -5,17 +5,28 @@ from fastapi.templating import Jinja2Templates
 from fastapi import Request as FastAPIRequest
 from contextlib import asynccontextmanager
 from pydantic import BaseModel
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import List, Optional
 import logging
 import sys
 import json
 import os
+from pathlib import Path
 
 from app.config import settings
-from app.webhook import router as webhook_router
-from app.scheduler import start_scheduler, stop_scheduler, get_next_run_time, send_digest_now
+from app.webhook import router as webhook_router, ingest_queue, plex_backfill, check_threshold
+from app.scheduler import start_scheduler, stop_scheduler, get_next_run_time, send_digest_now, get_last_retention_run
 from app.discord_sender import discord_sender
-from app.aggregator import MediaAggregator
+from app.thumbnails import router as thumbnails_router, thumbnail_cache
+from app.digest_engine import digest_engine
+from app.aggregator import aggregator
+from app.database import close_databases
+from app.metrics import router as metrics_router, UNPROCESSED_ITEMS, NEXT_DIGEST
+from app.profiling import router as profiling_router, profiler
+from app.preview import router as preview_router, digest_preview
+from app.events import router as events_router, event_broadcaster
+from app.http_cache import CachedResponse
+from app.coordination import coordinator
 
 # Configure logging
 logging.basicConfig(
@@ -28,9 +39,6 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# Initialize aggregator
-aggregator = MediaAggregator()
-
 # Configuration file path
 CONFIG_FILE = os.path.join(settings.data_dir, "config.json")
 
@@ -48,14 +56,43 @@ async def lifespan(app: FastAPI):
     # Load saved configuration if exists
     load_saved_config()
     
-    # Start scheduler
-    start_scheduler()
+    # Render and compress the Web UI once
+    ui_page.get()
+    
+    # Open pooled Discord HTTP session
+    await discord_sender.start()
+    
+    # Index thumbnail cache and open Plex HTTP session
+    await thumbnail_cache.start()
+    
+    # Start batched webhook writer
+    await ingest_queue.start()
+    
+    # Profile sampled webhooks and digest runs if configured
+    profiler.start()
+    
+    # Elect a leader among the workers; the leader runs the scheduler
+    coordinator.set_handlers(
+        on_elected=_on_elected,
+        on_demoted=_on_demoted,
+        on_changed=_on_changed,
+        on_config_changed=_on_config_changed,
+        next_run=_next_digest_timestamp
+    )
+    await coordinator.start()
     
     yield
     
     # Shutdown
     logger.info("Shutting down...")
-    stop_scheduler()
+    event_broadcaster.close()
+    # Stops the scheduler if this worker leads
+    await coordinator.stop()
+    await plex_backfill.stop()
+    await ingest_queue.stop()
+    await discord_sender.close()
+    await thumbnail_cache.close()
+    close_databases()
 
 
 # Create FastAPI application
@@ -66,11 +103,79 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# Setup templates
-templates = Jinja2Templates(directory="app/templates")
+# Setup templates (relative to this file, not the working directory)
+templates = Jinja2Templates(directory=str(Path(__file__).parent / "templates"))
 
 # Include routers
 app.include_router(webhook_router, tags=["webhook"])
+app.include_router(thumbnails_router, tags=["thumbnails"])
+app.include_router(metrics_router, tags=["metrics"])
+app.include_router(profiling_router, tags=["profiling"])
+app.include_router(preview_router, tags=["digest"])
+app.include_router(events_router, tags=["events"])
+
+# Gauges computed on every scrape
+UNPROCESSED_ITEMS.set_function(
+    lambda: {(media_type,): count for media_type, count in aggregator.get_unprocessed_counts().items()}
+)
+
+
+def _next_digest_timestamp():
+    next_run = get_next_run_time()
+    return next_run.timestamp() if next_run else None
+
+
+NEXT_DIGEST.set_function(_next_digest_timestamp)
+
+
+def _live_stats() -> dict:
+    """Counters pushed to Web UI clients; a subset of /api/stats that needs no database access"""
+    unprocessed = aggregator.get_unprocessed_count()
+    next_run = get_next_run_time()
+    return {
+        "unprocessed_items": unprocessed,
+        "threshold": settings.digest_threshold,
+        "unprocessed_by_type": aggregator.get_unprocessed_counts(),
+        "threshold_met": unprocessed >= settings.digest_threshold if settings.digest_threshold > 0 else False,
+        "next_run": next_run.isoformat() if next_run else None
+    }
+
+
+event_broadcaster.set_snapshot(_live_stats)
+
+
+async def _on_elected():
+    """This worker now runs the scheduler and the threshold trigger"""
+    # Digests interrupted by a restart, or by a previous leader that went away
+    aggregator.release_stale_claims()
+    start_scheduler()
+    event_broadcaster.publish_stats()
+    
+    # Pick up library additions made while we (or the previous leader) were down
+    if settings.backfill_on_startup:
+        plex_backfill.start("startup" if coordinator.elections == 1 else "failover")
+    
+    # The backlog may already be over the threshold
+    await check_threshold(0)
+
+
+async def _on_demoted():
+    """Another worker runs the scheduler now"""
+    stop_scheduler()
+    event_broadcaster.publish_stats()
+
+
+async def _on_changed():
+    """Another worker changed the backlog"""
+    event_broadcaster.publish_stats()
+    await check_threshold(0)
+
+
+async def _on_config_changed():
+    """Another worker saved the configuration"""
+    load_saved_config()
+    discord_sender.update_config()
+    event_broadcaster.publish_stats()
 
 
 # Configuration Models
@@ -79,6 +184,7 @@ class ConfigUpdate(BaseModel):
     plex_token: Optional[str] = None
     discord_webhook_url: Optional[str] = None
     discord_username: Optional[str] = None
+    discord_destinations: Optional[List[dict]] = None
     digest_schedule: Optional[str] = None
     digest_threshold: Optional[int] = None
     timezone: Optional[str] = None
@@ -124,21 +230,14 @@ def save_config(config_update: ConfigUpdate):
     logger.info("Configuration saved to file")
 
 
-# Web UI Routes
-@app.get("/", response_class=HTMLResponse)
-async def web_ui(request: FastAPIRequest):
-    """Serve the web UI"""
-    return templates.TemplateResponse("index.html", {"request": request})
-
-
-@app.get("/api/config")
-async def get_config():
-    """Get current configuration (sanitized)"""
-    config = {
+def _public_config() -> dict:
+    """Current configuration as shown in the Web UI"""
+    return {
         "plex_url": settings.plex_url,
         "plex_token": settings.plex_token if settings.plex_token else "",
         "discord_webhook_url": settings.discord_webhook_url if settings.discord_webhook_url else "",
         "discord_username": settings.discord_username,
+        "discord_destinations": settings.discord_destinations,
         "digest_schedule": settings.digest_schedule,
         "digest_threshold": settings.digest_threshold,
         "timezone": settings.timezone,
@@ -146,7 +245,30 @@ async def get_config():
         "enable_tv_shows": settings.enable_tv_shows,
         "enable_music": settings.enable_music,
     }
-    return config
+
+
+# Responses served with strong ETags and pre-compressed bodies.
+# The Web UI template has no per-request data: it is rendered once.
+ui_page = CachedResponse(
+    lambda: templates.get_template("index.html").render(),
+    media_type="text/html; charset=utf-8",
+    version=lambda: settings.app_version
+)
+# Settings only change through /api/config, which reconfigures the Discord sender
+config_response = CachedResponse(_public_config, version=lambda: discord_sender.config_version)
+
+
+# Web UI Routes
+@app.get("/", response_class=HTMLResponse)
+async def web_ui(request: FastAPIRequest):
+    """Serve the web UI"""
+    return ui_page.response(request)
+
+
+@app.get("/api/config")
+async def get_config(request: FastAPIRequest):
+    """Get current configuration (sanitized)"""
+    return config_response.response(request)
 
 
 @app.post("/api/config")
@@ -166,35 +288,95 @@ async def update_config(config: ConfigUpdate):
         discord_sender.update_config()
         logger.info("Discord sender configuration updated")
         
+        # Other workers reload the saved file
+        coordinator.record_config_change()
+        
+        # The threshold may have changed
+        event_broadcaster.publish_stats()
+        
         return {"message": "Configuration updated successfully. Some changes may require container restart."}
     except Exception as e:
         logger.error(f"Failed to update configuration: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/stats")
-async def get_stats():
-    """Get current statistics"""
-    unprocessed = aggregator.get_unprocessed_count()
-    next_run = get_next_run_time()
+def _stats() -> dict:
+    """Current statistics"""
+    retention = get_last_retention_run()
     
     return {
-        "unprocessed_items": unprocessed,
-        "threshold": settings.digest_threshold,
-        "threshold_met": unprocessed >= settings.digest_threshold if settings.digest_threshold > 0 else False,
-        "next_run": next_run.isoformat() if next_run else None
+        **_live_stats(),
+        "digest": digest_engine.get_stats(),
+        "preview": digest_preview.get_stats(),
+        "events": event_broadcaster.get_stats(),
+        "coordination": coordinator.get_stats(),
+        "destinations": discord_sender.get_stats(),
+        "retention": retention.model_dump(mode="json") if retention else None
     }
 
 
+def _stats_version() -> tuple:
+    """
+    Moves with the data behind /api/stats: the backlog, the configuration,
+    the leader and schedule, and digest and retention runs. Counters that
+    tick on their own (lease renewals, syncs, cache hits) are refreshed with
+    the next such change rather than re-rendering the body every time.
+    """
+    last_run = digest_engine.last_run
+    retention = get_last_retention_run()
+    return (
+        aggregator.version,
+        discord_sender.config_version,
+        coordinator.config_seq,
+        coordinator.leader,
+        get_next_run_time(),
+        digest_engine.total_runs,
+        digest_engine.running,
+        last_run.finished_at if last_run else None,
+        retention.finished_at if retention else None
+    )
+
+
+# Rendered once per data version; unchanged stats are answered with 304
+stats_response = CachedResponse(_stats, version=_stats_version)
+
+
+@app.get("/api/stats")
+async def get_stats(request: FastAPIRequest):
+    """Get current statistics"""
+    return stats_response.response(request)
+
+
 @app.post("/api/send-digest")
 async def trigger_digest():
     """Manually trigger a digest send"""
-    try:
-        await send_digest_now()
-        return {"message": "Digest sent successfully"}
-    except Exception as e:
-        logger.error(f"Failed to send digest: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    run = await send_digest_now("manual")
+    if run.status == "sent":
+        return {"message": "Digest sent successfully", "run": run.model_dump(mode="json")}
+    if run.status == "empty":
+        return {"message": "No unprocessed items to send", "run": run.model_dump(mode="json")}
+    
+    logger.error(f"Failed to send digest: {run.error or run.status}")
+    raise HTTPException(status_code=500, detail=run.error or "Failed to send digest")
+
+
+@app.get("/api/backfill")
+async def get_backfill():
+    """Get backfill progress"""
+    return plex_backfill.get_stats()
+
+
+@app.post("/api/backfill")
+async def trigger_backfill(hours: Optional[float] = None):
+    """
+    Backfill items added to Plex since the newest stored item,
+    or over the last N hours if given
+    """
+    since = datetime.now() - timedelta(hours=hours) if hours else None
+    run = plex_backfill.start("manual", since)
+    if run is None:
+        raise HTTPException(status_code=409, detail="A backfill is already running")
+    return {"message": "Backfill started", "run": run.model_dump(mode="json")}
 
 
 @app.post("/api/test-discord")
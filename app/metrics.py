@@ -0,0 +1,306 @@
+import logging
+import math
+import threading
+import time
+from contextlib import ContextDecorator
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bucket upper bounds in seconds
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SLOW_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Plex webhook events; anything else is counted as "other" to bound label cardinality
+PLEX_EVENTS = {
+    "library.new", "library.on.deck",
+    "media.play", "media.pause", "media.resume", "media.stop", "media.scrobble", "media.rate",
+    "playback.started", "device.new",
+    "admin.database.backup", "admin.database.corrupted"
+}
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """
+    A metric family in the Prometheus text exposition format.
+
+    Deliberately minimal, so metrics cost no extra dependency or import time;
+    label values are passed as keyword arguments.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+            *self.samples()
+        ]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(_Metric):
+    """
+    Current value. Can be set directly or computed on every scrape by a
+    function returning a number (or, for labelled gauges, a dict of label
+    value tuples to numbers; None means no sample).
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], Union[None, float, Dict[LabelValues, float]]]] = None
+
+    def set(self, value: float, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], Union[None, float, Dict[LabelValues, float]]]):
+        self._function = function
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception as e:
+                logger.warning(f"Could not collect metric {self.name}: {str(e)}")
+                return []
+            if value is None:
+                return []
+            values = list(value.items()) if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {_format_value(value)}" for key, value in values]
+
+
+class _Timer(ContextDecorator):
+    """Observes the time spent in a with-block or decorated function"""
+
+    def __init__(self, histogram: "Histogram", labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self._start, **self.labels)
+        return False
+
+    def _recreate_cm(self):
+        # A fresh timer per decorated call, so concurrent calls don't share a start time
+        return _Timer(self.histogram, self.labels)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = FAST_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [bucket counts..., sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-1] += value
+
+    def time(self, **labels) -> _Timer:
+        """Time a block (with ...) or every call of a function (as a decorator)"""
+        return _Timer(self, labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+
+        lines = []
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = self._format_labels(key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together by the /metrics endpoint"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = FAST_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global instance
+registry = MetricsRegistry()
+
+WEBHOOK_STAGE_SECONDS = registry.histogram(
+    "digestarr_webhook_stage_duration_seconds",
+    "Time spent handling a Plex webhook, by stage (parse, validate, store)",
+    ["stage"]
+)
+WEBHOOKS = registry.counter(
+    "digestarr_webhooks_total",
+    "Plex webhooks received, by event and outcome (accepted, ignored, failed)",
+    ["event", "outcome"]
+)
+DB_OPERATION_SECONDS = registry.histogram(
+    "digestarr_db_operation_duration_seconds",
+    "Time spent in MediaAggregator database operations, by method",
+    ["method"]
+)
+DIGEST_STAGE_SECONDS = registry.histogram(
+    "digestarr_digest_stage_duration_seconds",
+    "Time spent in each digest run stage (aggregate, render, send, mark)",
+    ["stage"],
+    buckets=SLOW_BUCKETS
+)
+DIGEST_RUNS = registry.counter(
+    "digestarr_digest_runs_total",
+    "Digest runs, by status",
+    ["status"]
+)
+DISCORD_RESPONSES = registry.counter(
+    "digestarr_discord_responses_total",
+    "Discord webhook responses, by HTTP status code (or 'error' for connection failures)",
+    ["status"]
+)
+UNPROCESSED_ITEMS = registry.gauge(
+    "digestarr_unprocessed_items",
+    "Media items waiting to be sent, by media type",
+    ["media_type"]
+)
+NEXT_DIGEST = registry.gauge(
+    "digestarr_next_digest_timestamp_seconds",
+    "Unix time of the next scheduled digest"
+)
+
+
+def timed(histogram: Histogram, label: str = "method"):
+    """Decorator observing every call of a function, labelled with its name"""
+    def decorator(function):
+        return histogram.time(**{label: function.__name__})(function)
+    return decorator
+
+
+def event_label(event: Optional[str]) -> str:
+    """Webhook event as a metric label"""
+    if event is None:
+        return "unknown"
+    return event if event in PLEX_EVENTS else "other"
+
+
+@router.get("/metrics")
+async def metrics():
+    """Metrics in the Prometheus text exposition format"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,229 @@
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from app.database import Database
+
+logger = logging.getLogger(__name__)
+
+
+def _ensure_column(conn: sqlite3.Connection, table: str, column: str, definition: str):
+    """Add a column to an existing table if it is missing"""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _iso_to_epoch(value):
+    """Convert an isoformat() timestamp (naive, local time) to epoch seconds"""
+    if not isinstance(value, str):
+        return value
+    return int(datetime.fromisoformat(value).timestamp())
+
+
+def _initial_schema(conn: sqlite3.Connection):
+    """
+    Schema as of the last unversioned release. Existing databases may have
+    any subset of it, so every step is idempotent.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS media_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            media_type TEXT NOT NULL,
+            title TEXT NOT NULL,
+            year INTEGER,
+            show_title TEXT,
+            season_number INTEGER,
+            episode_number INTEGER,
+            artist TEXT,
+            album TEXT,
+            track_title TEXT,
+            added_at TIMESTAMP NOT NULL,
+            thumb_url TEXT,
+            rating_key TEXT,
+            processed BOOLEAN DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_processed ON media_items(processed)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_media_type ON media_items(media_type)")
+
+    # Covering indexes for the SQL aggregation engine's GROUP BY queries
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_pending_shows
+        ON media_items(processed, media_type, show_title, season_number, episode_number)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_pending_music
+        ON media_items(processed, media_type, artist, album)
+    """)
+
+    # Lookups by ratingKey across processed and pending items (backfill dedupe)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_rating_key ON media_items(rating_key)")
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS digests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TIMESTAMP NOT NULL,
+            min_item_id INTEGER NOT NULL,
+            max_item_id INTEGER NOT NULL,
+            item_count INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            sent_at TIMESTAMP
+        )
+    """)
+    _ensure_column(conn, "media_items", "digest_id", "INTEGER REFERENCES digests(id)")
+    _ensure_column(conn, "digests", "message_ids", "TEXT")
+
+    # One pending row per Plex item; keep the first duplicate so digest ordering is unchanged
+    if not conn.execute("""
+        SELECT 1 FROM sqlite_master
+        WHERE type = 'index' AND name = 'idx_unprocessed_rating_key'
+    """).fetchone():
+        removed = conn.execute("""
+            DELETE FROM media_items
+            WHERE processed = 0
+            AND rating_key IS NOT NULL
+            AND id NOT IN (
+                SELECT MIN(id) FROM media_items
+                WHERE processed = 0 AND rating_key IS NOT NULL
+                GROUP BY rating_key, media_type
+            )
+        """).rowcount
+        if removed:
+            logger.info(f"Removed {removed} duplicate unprocessed media items")
+        conn.execute("""
+            CREATE UNIQUE INDEX idx_unprocessed_rating_key
+            ON media_items(rating_key, media_type)
+            WHERE processed = 0
+        """)
+
+
+def _epoch_added_at(conn: sqlite3.Connection):
+    """
+    Store added_at as integer epoch seconds instead of ISO text.
+    The column's NUMERIC affinity keeps integers as integers, so no table rebuild is needed.
+    """
+    conn.create_function("iso_to_epoch", 1, _iso_to_epoch, deterministic=True)
+    converted = conn.execute("""
+        UPDATE media_items SET added_at = iso_to_epoch(added_at)
+        WHERE typeof(added_at) = 'text'
+    """).rowcount
+    if converted:
+        logger.info(f"Converted added_at of {converted} media items to epoch seconds")
+
+
+def _pending_added_at_index(conn: sqlite3.Connection):
+    """Serve WHERE processed = ? ORDER BY added_at (and retention range deletes) from one index"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_added_at ON media_items(processed, added_at)")
+    # Its leading column makes the single-column index redundant
+    conn.execute("DROP INDEX IF EXISTS idx_processed")
+    conn.execute("ANALYZE media_items")
+
+
+def _coordination_tables(conn: sqlite3.Connection):
+    """Leader lease and shared change sequence numbers for multi-worker deployments"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            acquired_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            next_run REAL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            change_seq INTEGER NOT NULL DEFAULT 0,
+            reset_seq INTEGER NOT NULL DEFAULT 0,
+            config_seq INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO sync_state (id) VALUES (1)")
+
+
+def _pending_indexes_with_digest_id(conn: sqlite3.Connection):
+    """
+    The SQL engine filters on digest_id IS ? (unclaimed, or claimed by one digest);
+    without it in the indexes every matching row is looked up in the table
+    """
+    conn.execute("DROP INDEX IF EXISTS idx_pending_shows")
+    conn.execute("""
+        CREATE INDEX idx_pending_shows
+        ON media_items(processed, media_type, digest_id, show_title, season_number, episode_number)
+    """)
+    conn.execute("DROP INDEX IF EXISTS idx_pending_music")
+    conn.execute("""
+        CREATE INDEX idx_pending_music
+        ON media_items(processed, media_type, digest_id, artist, album)
+    """)
+    conn.execute("ANALYZE media_items")
+
+
+def _digest_deliveries(conn: sqlite3.Connection):
+    """Per-destination delivery state, so a failed destination is retried without resending to the others"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS digest_deliveries (
+            digest_id INTEGER NOT NULL REFERENCES digests(id),
+            destination TEXT NOT NULL,
+            status TEXT NOT NULL,
+            message_ids TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (digest_id, destination)
+        )
+    """)
+
+
+def _digest_id_index(conn: sqlite3.Connection):
+    """Retention checks that no item still refers to a digest before deleting it"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_digest_id ON media_items(digest_id)")
+
+
+def _digest_owner(conn: sqlite3.Connection):
+    """Worker that claimed a digest, so only claims of stopped workers are released"""
+    _ensure_column(conn, "digests", "owner", "TEXT")
+
+
+# (version, description, upgrade); versions are stored in PRAGMA user_version
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "initial schema", _initial_schema),
+    (2, "added_at as epoch seconds", _epoch_added_at),
+    (3, "(processed, added_at) index", _pending_added_at_index),
+    (4, "coordination tables", _coordination_tables),
+    (5, "digest_id in the SQL engine's covering indexes", _pending_indexes_with_digest_id),
+    (6, "per-destination digest deliveries", _digest_deliveries),
+    (7, "digest_id index", _digest_id_index),
+    (8, "digest owner", _digest_owner),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def migrate(db: Database) -> int:
+    """
+    Bring the database schema up to date in place.
+    Each migration runs in its own transaction together with its version bump.
+    Returns the resulting schema version.
+    """
+    version = db.reader().execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this release supports ({SCHEMA_VERSION})"
+        )
+
+    for target, description, upgrade in MIGRATIONS:
+        if target <= version:
+            continue
+        with db.transaction() as conn:
+            # Another worker starting alongside may have migrated in the meantime
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= target:
+                version = target
+                continue
+            logger.info(f"Migrating database to schema version {target}: {description}")
+            upgrade(conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+        version = target
+
+    return version
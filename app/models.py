@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 from pydantic import BaseModel
 
 
@@ -88,3 +88,94 @@ class DigestData(BaseModel):
     total_items: int = 0
     digest_start: datetime
     digest_end: datetime
+
+
+class DigestBatch(BaseModel):
+    """A digest together with the range of media items it has claimed"""
+    digest_id: int
+    min_item_id: int
+    max_item_id: int
+    digest: DigestData
+
+
+class DigestRun(BaseModel):
+    """Outcome and timings of one digest engine run"""
+    trigger: str  # schedule, threshold or manual
+    status: str = "running"  # running, sent, partial, failed, empty or error
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    digest_id: Optional[int] = None
+    item_count: int = 0
+    coalesced_triggers: int = 0
+    pages: int = 0
+    message_ids: Dict[str, List[str]] = {}  # By destination
+    destinations: Dict[str, str] = {}  # Destination -> sent, failed or skipped
+    retried: Dict[int, str] = {}  # Partly delivered digests retried by this run -> sent or partial
+    timings_ms: Dict[str, float] = {}  # aggregate, retry, render, send, mark
+    profile: Optional[str] = None  # Profile report name, if this run was profiled
+    error: Optional[str] = None
+
+
+class BackfillRun(BaseModel):
+    """Progress and outcome of one backfill from the Plex library API"""
+    trigger: str  # startup, failover or manual
+    status: str = "running"  # running, done, error or cancelled
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    since: Optional[datetime] = None
+    sections: int = 0
+    pages: int = 0
+    fetched: int = 0  # Items returned by Plex
+    inserted: int = 0  # New items stored
+    skipped: int = 0  # Already stored or not a supported media type
+    items_per_second: float = 0.0
+    error: Optional[str] = None
+
+
+class RetentionRun(BaseModel):
+    """Outcome of one retention and compaction run"""
+    status: str = "running"  # running, done or error
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    cutoff: datetime
+    items_deleted: int = 0
+    digests_deleted: int = 0
+    chunks: int = 0
+    pages_freed: int = 0
+    bytes_reclaimed: int = 0
+    timings_ms: Dict[str, float] = {}  # delete, vacuum, optimize
+    error: Optional[str] = None
+
+
+class ProfilingRequest(BaseModel):
+    """Profiling to start; omitted fields keep their current value"""
+    webhook_sample_rate: Optional[float] = None  # Share of /webhook requests to profile, 0-1
+    webhook_max_profiles: Optional[int] = None  # Stop sampling after this many profiles
+    digest_runs: Optional[int] = None  # Profile the next N digest runs
+    tracemalloc: Optional[bool] = None  # Also report the top memory allocations
+
+
+class DiscordDestination(BaseModel):
+    """A Discord webhook that receives digests, with its own media type filter"""
+    name: str
+    webhook_url: str
+    enable_movies: bool = True
+    enable_tv_shows: bool = True
+    enable_music: bool = True
+    
+    def media_filter(self) -> Tuple[bool, bool, bool]:
+        """Filter key; destinations with the same key share one rendering"""
+        return (self.enable_movies, self.enable_tv_shows, self.enable_music)
+
+
+class DeliveryResult(BaseModel):
+    """Outcome of posting a payload (or a whole digest) to Discord"""
+    success: bool
+    destination: Optional[str] = None
+    skipped: bool = False  # Nothing in the digest for this destination
+    status: Optional[int] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    response: Optional[dict] = None
+    message_ids: List[str] = []
+    destinations: List["DeliveryResult"] = []  # Per-destination results of a fan-out
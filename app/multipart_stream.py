@@ -0,0 +1,161 @@
+import logging
+import os
+from typing import BinaryIO, Callable, Dict, Optional
+
+from fastapi import HTTPException, Request
+
+# python-multipart renamed its import package in 0.0.13
+try:
+    from python_multipart.multipart import MultipartParseError, MultipartParser, parse_options_header
+except ImportError:
+    from multipart.multipart import MultipartParseError, MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# Plex payloads are a few KB; anything far larger is not a Plex webhook
+MAX_PAYLOAD_BYTES = 1024 * 1024
+
+# Called with the payload bytes when an image part starts; returns a file to
+# stream the image into, or None to drop it
+ImageSink = Callable[[bytes], Optional[BinaryIO]]
+
+
+class WebhookBody:
+    """The parts of a Plex webhook body we keep"""
+
+    def __init__(self, payload: Optional[bytes] = None):
+        self.payload = payload
+        self.image_path: Optional[str] = None
+        self.skipped_bytes = 0
+
+
+class _PartReader:
+    """
+    Callbacks for python-multipart's streaming parser.
+
+    The payload part is collected in memory. Image parts are either written
+    chunk by chunk into the file provided by the image sink or dropped as
+    they arrive, so they are never buffered.
+    """
+
+    def __init__(self, image_sink: Optional[ImageSink]):
+        self.body = WebhookBody()
+        self._image_sink = image_sink
+        self._payload = bytearray()
+        self._headers: Dict[bytes, bytes] = {}
+        self._field = bytearray()
+        self._value = bytearray()
+        self._part: Optional[str] = None
+        self._file: Optional[BinaryIO] = None
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._part = None
+        self._payload.clear()
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[bytes(self._field).lower()] = bytes(self._value)
+        self._field.clear()
+        self._value.clear()
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        content_type = self._headers.get(b"content-type", b"")
+
+        if options.get(b"name") == b"payload" and b"filename" not in options:
+            self._part = "payload"
+        elif (content_type.startswith(b"image/") and self._image_sink is not None
+              and self.body.payload is not None and self.body.image_path is None):
+            # Plex sends the payload first, so we know which item the image belongs to
+            self._file = self._image_sink(self.body.payload)
+            if self._file is not None:
+                self._part = "image"
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._part == "payload":
+            if len(self._payload) + end - start > MAX_PAYLOAD_BYTES:
+                raise HTTPException(status_code=413, detail="Webhook payload too large")
+            self._payload += data[start:end]
+        elif self._part == "image":
+            self._file.write(data[start:end])
+        else:
+            self.body.skipped_bytes += end - start
+
+    def on_part_end(self):
+        if self._part == "payload":
+            self.body.payload = bytes(self._payload)
+        elif self._part == "image":
+            self._file.close()
+            self.body.image_path = self._file.name
+            self._file = None
+        self._part = None
+
+    def discard(self):
+        """Remove a partially or fully written image after a failure"""
+        if self._file is not None:
+            self._file.close()
+            self.body.image_path = self._file.name
+            self._file = None
+        if self.body.image_path:
+            try:
+                os.remove(self.body.image_path)
+            except OSError:
+                pass
+            self.body.image_path = None
+
+
+async def read_webhook_body(request: Request, image_sink: Optional[ImageSink] = None) -> WebhookBody:
+    """
+    Read a Plex webhook body as a stream.
+
+    Only the 'payload' field is held in memory. An attached image is streamed
+    into the file returned by image_sink (if any) and otherwise discarded.
+    Non-multipart bodies fall back to regular form parsing.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+
+    if content_type != b"multipart/form-data":
+        form = await request.form()
+        payload = form.get("payload")
+        return WebhookBody(payload.encode("utf-8") if isinstance(payload, str) else None)
+
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Missing multipart boundary")
+
+    reader = _PartReader(image_sink)
+    parser = MultipartParser(boundary, reader.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except MultipartParseError as e:
+        reader.discard()
+        raise HTTPException(status_code=400, detail=f"Malformed multipart body: {str(e)}")
+    except BaseException:
+        reader.discard()
+        raise
+
+    if reader.body.payload is None:
+        # Truncated body: never keep an image we can't attribute
+        reader.discard()
+    if reader.body.skipped_bytes:
+        logger.debug(f"Skipped {reader.body.skipped_bytes} bytes of unused webhook parts")
+    return reader.body
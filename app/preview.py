@@ -0,0 +1,130 @@
+import logging
+import time
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, Response
+
+from app.aggregator import aggregator, MediaAggregator
+from app.discord_sender import discord_sender, DiscordSender
+from app.http_cache import etag_matches
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# The rendering depends on the clock too (the "Last Hour" / "Today" header,
+# the embed timestamp, rendered_at), so a cached preview is reused for at
+# most this long even when nothing else changed
+TIME_BUCKET_SECONDS = 60
+
+
+class DigestPreview:
+    """
+    Memoized rendering of the next digest.
+
+    The backlog only changes when the aggregator's version moves and the
+    rendering only when the Discord configuration does, so the preview is
+    aggregated and rendered once per (version, config version, minute) and
+    repeated requests are answered from that, or with 304 Not Modified.
+    """
+
+    def __init__(self, aggregator: MediaAggregator, sender: DiscordSender):
+        self.aggregator = aggregator
+        self.sender = sender
+        # Versions restart with the process; keep ETags from a previous run from matching
+        self._boot_id = f"{time.time_ns():x}"
+        self._key: Optional[Tuple[int, int, int]] = None
+        self._preview: Optional[dict] = None
+
+        # Statistics
+        self.renders = 0
+        self.hits = 0
+
+    def _current_key(self) -> Tuple[int, int, int]:
+        return self.aggregator.version, self.sender.config_version, int(time.time() // TIME_BUCKET_SECONDS)
+
+    def etag(self) -> str:
+        """ETag of the preview for the current versions, without rendering it"""
+        version, config_version, time_bucket = self._current_key()
+        return f'"preview-{self._boot_id}-{version}-{config_version}-{time_bucket}"'
+
+    def get(self) -> dict:
+        """The preview for the current versions, rendered if they moved"""
+        # Read the key first: a write racing the render only makes the next call render again
+        key = self._current_key()
+        if self._preview is not None and key == self._key:
+            self.hits += 1
+            return self._preview
+
+        start = time.perf_counter()
+        self._preview = self._render(key)
+        self._key = key
+        self.renders += 1
+        logger.debug(f"Rendered digest preview for version {key[0]} in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return self._preview
+
+    def _render(self, key: Tuple[int, int, int]) -> dict:
+        """Aggregate and render the unclaimed backlog without claiming it"""
+        digest = self.aggregator.aggregate_digest()
+        preview = {
+            "version": key[0],
+            "rendered_at": datetime.now().isoformat(),
+            "summary": {
+                "total_items": 0,
+                "movies": 0,
+                "tv_shows": 0,
+                "episodes": 0,
+                "artists": 0,
+                "albums": 0,
+                "digest_start": None,
+                "digest_end": None,
+                "pages": 0
+            },
+            "destinations": {}
+        }
+        if digest is None:
+            return preview
+
+        destinations = self.sender.render_preview(digest)
+        preview["summary"] = {
+            "total_items": digest.total_items,
+            "movies": len(digest.movies),
+            "tv_shows": len(digest.tv_shows),
+            "episodes": sum(show.episode_count for show in digest.tv_shows),
+            "artists": len(digest.music),
+            "albums": sum(len(artist.albums) for artist in digest.music),
+            "digest_start": digest.digest_start.isoformat(),
+            "digest_end": digest.digest_end.isoformat(),
+            "pages": sum(len(pages) for pages in destinations.values())
+        }
+        preview["destinations"] = destinations
+        return preview
+
+    def get_stats(self) -> dict:
+        """Get cache statistics"""
+        return {
+            "renders": self.renders,
+            "hits": self.hits,
+            "version": self._key[0] if self._key else None
+        }
+
+
+# Global instance
+digest_preview = DigestPreview(aggregator, discord_sender)
+
+
+@router.get("/api/digest/preview")
+async def get_digest_preview(request: Request):
+    """Preview the next digest: summary counts and the rendered pages per destination"""
+    etag = digest_preview.etag()
+    headers = {
+        "ETag": etag,
+        # Always revalidate; unchanged previews cost a 304
+        "Cache-Control": "no-cache"
+    }
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    return JSONResponse(content=digest_preview.get(), headers=headers)
@@ -0,0 +1,293 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+
+from app.config import settings
+from app.models import ProfilingRequest
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Reports come in pairs: <name>.prof (pstats, for snakeviz & co.) and <name>.txt (summary)
+REPORT_NAME = re.compile(r"^(webhook|digest)-\d{8}-\d{6}-\d+\.(prof|txt)$")
+REPORT_TYPES = {".prof": "application/octet-stream", ".txt": "text/plain; charset=utf-8"}
+
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+TRACEMALLOC_FRAMES = 10
+
+
+class Profiler:
+    """
+    Opt-in cProfile and tracemalloc profiling of sampled webhook requests and
+    of the next digest runs.
+
+    While profiling is off, callers only check a counter or the sampling
+    rate, so the hot paths pay nothing. One profile runs at a time: cProfile
+    hooks the whole thread, so a profile also covers whatever else ran on
+    the event loop while the profiled coroutine was waiting. Samples that
+    would overlap the running profile are skipped rather than nested.
+    """
+
+    def __init__(self):
+        self.webhook_sample_rate = 0.0
+        self.webhook_profiles_left = 0
+        self.digest_runs_left = 0
+        self.tracemalloc = False
+        self._busy = False
+        self._owns_tracemalloc = False
+        self._sequence = 0
+
+        # Statistics
+        self.profiles_written = 0
+        self.samples_skipped = 0
+
+    @property
+    def reports_dir(self) -> str:
+        return os.path.join(settings.data_dir, "profiles")
+
+    @property
+    def enabled(self) -> bool:
+        """Whether anything is still due to be profiled"""
+        webhooks = self.webhook_sample_rate > 0 and self.webhook_profiles_left > 0
+        return webhooks or self.digest_runs_left > 0
+
+    def start(self):
+        """Apply the profiling settings (called from the app lifespan)"""
+        self.configure(ProfilingRequest(
+            webhook_sample_rate=settings.profiling_webhook_sample_rate,
+            webhook_max_profiles=settings.profiling_webhook_max_profiles,
+            digest_runs=settings.profiling_digest_runs,
+            tracemalloc=settings.profiling_tracemalloc
+        ))
+
+    def configure(self, request: ProfilingRequest):
+        """Start (or adjust) profiling"""
+        if request.webhook_sample_rate is not None:
+            self.webhook_sample_rate = request.webhook_sample_rate
+        if request.webhook_max_profiles is not None:
+            self.webhook_profiles_left = request.webhook_max_profiles
+        if request.digest_runs is not None:
+            self.digest_runs_left = request.digest_runs
+        if request.tracemalloc is not None:
+            self.tracemalloc = request.tracemalloc
+        self._update_tracemalloc()
+
+        if self.enabled:
+            logger.info(
+                f"Profiling enabled: {self.webhook_sample_rate:.2%} of webhooks "
+                f"(up to {self.webhook_profiles_left}), next {self.digest_runs_left} digest runs, "
+                f"tracemalloc {'on' if self.tracemalloc else 'off'}"
+            )
+
+    def stop(self):
+        """Stop profiling; a profile in progress still completes"""
+        self.webhook_sample_rate = 0.0
+        self.webhook_profiles_left = 0
+        self.digest_runs_left = 0
+        self._update_tracemalloc()
+        logger.info("Profiling disabled")
+
+    def _update_tracemalloc(self):
+        """Trace allocations only while profiles with tracemalloc are due"""
+        wanted = self.tracemalloc and (self.enabled or self._busy)
+        if wanted and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._owns_tracemalloc = True
+        elif not wanted and self._owns_tracemalloc:
+            # Leave tracing alone if someone else (PYTHONTRACEMALLOC) started it
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+
+    def sample_webhook(self) -> bool:
+        """Whether to profile this webhook request"""
+        if self.webhook_profiles_left <= 0 or random.random() >= self.webhook_sample_rate:
+            return False
+        if self._busy:
+            self.samples_skipped += 1
+            return False
+        self.webhook_profiles_left -= 1
+        return True
+
+    def take_digest_run(self) -> bool:
+        """Whether to profile this digest run"""
+        if self.digest_runs_left <= 0:
+            return False
+        if self._busy:
+            # Not counted: the next run gets profiled instead
+            self.samples_skipped += 1
+            return False
+        self.digest_runs_left -= 1
+        return True
+
+    async def profile(self, kind: str, awaitable: Awaitable[Any]) -> Tuple[Any, Optional[str]]:
+        """
+        Await under the profiler and write a report in the background.
+        Returns the result and the report name.
+        """
+        before = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # Another profiler or debugger already hooks this thread
+            logger.warning(f"Could not start {kind} profile: {str(e)}")
+            return await awaitable, None
+
+        self._busy = True
+        self._sequence += 1
+        name = f"{kind}-{datetime.now():%Y%m%d-%H%M%S}-{self._sequence}"
+        start = time.perf_counter()
+        try:
+            return await awaitable, name
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - start
+            after = tracemalloc.take_snapshot() if before is not None else None
+            self._busy = False
+            self._update_tracemalloc()
+
+            # Formatting and writing happen off the event loop
+            asyncio.get_running_loop().run_in_executor(
+                None, self._write_report, name, profile, elapsed, before, after
+            )
+
+    def _write_report(
+        self,
+        name: str,
+        profile: cProfile.Profile,
+        elapsed: float,
+        before: Optional[tracemalloc.Snapshot],
+        after: Optional[tracemalloc.Snapshot]
+    ):
+        """Write the pstats dump and a text summary of one profile"""
+        try:
+            os.makedirs(self.reports_dir, exist_ok=True)
+            path = os.path.join(self.reports_dir, name)
+            profile.dump_stats(f"{path}.prof")
+
+            summary = io.StringIO()
+            summary.write(f"Profile {name}\n")
+            summary.write(f"Wall time: {elapsed * 1000:.3f} ms\n")
+            summary.write("Includes other tasks that ran on the event loop in the meantime.\n\n")
+            pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+            if before is not None and after is not None:
+                own_frames = (tracemalloc.Filter(False, tracemalloc.__file__),)
+                allocations = after.filter_traces(own_frames).compare_to(before.filter_traces(own_frames), "lineno")
+                summary.write(f"Top {TOP_ALLOCATIONS} allocations while profiling (net, by line)\n\n")
+                for allocation in allocations[:TOP_ALLOCATIONS]:
+                    summary.write(f"{allocation}\n")
+
+            with open(f"{path}.txt", "w") as f:
+                f.write(summary.getvalue())
+
+            self.profiles_written += 1
+            logger.info(f"Wrote profile {name} ({elapsed * 1000:.1f} ms)")
+            self._prune()
+        except Exception as e:
+            logger.error(f"Failed to write profile {name}: {str(e)}", exc_info=True)
+
+    def _prune(self):
+        """Delete the oldest reports beyond profiling_max_reports"""
+        names = sorted({os.path.splitext(report["name"])[0] for report in self.list_reports()}, key=self._sort_key)
+        for name in names[:max(0, len(names) - settings.profiling_max_reports)]:
+            for extension in REPORT_TYPES:
+                try:
+                    os.remove(os.path.join(self.reports_dir, name + extension))
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def _sort_key(name: str) -> Tuple[str, int]:
+        # <kind>-<date>-<time>-<sequence>: order by timestamp, then sequence
+        _, date, clock, sequence = name.split("-")
+        return f"{date}{clock}", int(sequence)
+
+    def list_reports(self) -> List[Dict]:
+        """Reports on disk, newest first"""
+        try:
+            entries = list(os.scandir(self.reports_dir))
+        except FileNotFoundError:
+            return []
+
+        reports = []
+        for entry in entries:
+            if not REPORT_NAME.match(entry.name):
+                continue
+            stat = entry.stat()
+            reports.append({
+                "name": entry.name,
+                "kind": entry.name.split("-", 1)[0],
+                "size": stat.st_size,
+                "created_at": datetime.fromtimestamp(stat.st_mtime).isoformat()
+            })
+        reports.sort(key=lambda report: (self._sort_key(os.path.splitext(report["name"])[0]), report["name"]), reverse=True)
+        return reports
+
+    def get_stats(self) -> dict:
+        """Get profiling status"""
+        return {
+            "enabled": self.enabled,
+            "profiling": self._busy,
+            "webhook_sample_rate": self.webhook_sample_rate,
+            "webhook_profiles_left": self.webhook_profiles_left,
+            "digest_runs_left": self.digest_runs_left,
+            "tracemalloc": tracemalloc.is_tracing(),
+            "profiles_written": self.profiles_written,
+            "samples_skipped": self.samples_skipped
+        }
+
+
+# Global instance
+profiler = Profiler()
+
+
+@router.get("/api/profiling")
+async def get_profiling():
+    """Get profiling status and the available reports"""
+    return {**profiler.get_stats(), "reports": profiler.list_reports()}
+
+
+@router.post("/api/profiling")
+async def start_profiling(request: ProfilingRequest):
+    """Profile a sample of webhook requests and/or the next digest runs"""
+    if request.webhook_sample_rate is not None and not 0 <= request.webhook_sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="webhook_sample_rate must be between 0 and 1")
+    if any(value is not None and value < 0 for value in (request.webhook_max_profiles, request.digest_runs)):
+        raise HTTPException(status_code=400, detail="Profile counts cannot be negative")
+
+    profiler.configure(request)
+    return profiler.get_stats()
+
+
+@router.delete("/api/profiling")
+async def stop_profiling():
+    """Stop profiling"""
+    profiler.stop()
+    return profiler.get_stats()
+
+
+@router.get("/api/profiling/reports/{name}")
+async def download_report(name: str):
+    """Download a profile (.prof, for pstats or snakeviz) or its summary (.txt)"""
+    if not REPORT_NAME.match(name):
+        raise HTTPException(status_code=404, detail="Unknown report")
+
+    path = os.path.join(profiler.reports_dir, name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    return FileResponse(path, media_type=REPORT_TYPES[os.path.splitext(name)[1]], filename=name)
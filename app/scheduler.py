@@ -1,49 +1,104 @@
-import asyncio
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from pytz import timezone as pytz_timezone
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
 import logging
+import time
 
 from app.config import settings
-from app.aggregator import MediaAggregator
-from app.discord_sender import discord_sender
+from app.aggregator import aggregator
+from app.digest_engine import digest_engine
+from app.coordination import coordinator
+from app.models import DigestRun, RetentionRun
 
 logger = logging.getLogger(__name__)
 
 # Global scheduler instance
 scheduler = AsyncIOScheduler()
-aggregator = MediaAggregator()
+
+# Outcome of the most recent retention run
+last_retention_run: Optional[RetentionRun] = None
 
 
-async def send_digest_now():
+async def send_digest_now(trigger: str = "manual") -> DigestRun:
     """Send digest immediately (called by threshold trigger or manual command)"""
-    logger.info("Generating and sending digest...")
+    return await digest_engine.run(trigger)
+
+
+async def scheduled_digest_job():
+    """Cron job, run natively as a coroutine by the AsyncIOScheduler"""
+    await digest_engine.run("schedule")
+
+
+async def _delete_in_chunks(delete_chunk, run: RetentionRun) -> int:
+    """Repeat a bounded delete until nothing is left, pausing between chunks"""
+    chunk_size = max(1, settings.retention_chunk_size)
+    total = 0
+    while True:
+        deleted = delete_chunk(run.cutoff, chunk_size)
+        total += deleted
+        run.chunks += 1
+        if deleted < chunk_size:
+            return total
+        await asyncio.sleep(settings.retention_chunk_pause_ms / 1000)
+
+
+async def retention_job() -> Optional[RetentionRun]:
+    """
+    Delete sent items past the retention period, then return the freed pages
+    to the filesystem and refresh the query planner statistics.
+
+    Deletes run in small transactions with a pause in between, so the write
+    lock is never held for long and webhooks keep flowing.
+    """
+    global last_retention_run
+    if settings.retention_days <= 0:
+        return None
+    
+    run = RetentionRun(
+        started_at=datetime.now(),
+        cutoff=datetime.now() - timedelta(days=settings.retention_days)
+    )
+    last_retention_run = run
+    db = aggregator.db
     
     try:
-        # Get aggregated digest
-        digest = aggregator.aggregate_digest()
+        pages_before = db.page_count()
+        start = time.perf_counter()
+        run.items_deleted = await _delete_in_chunks(aggregator.delete_processed_chunk, run)
+        run.digests_deleted = await _delete_in_chunks(aggregator.delete_finished_digests, run)
+        run.timings_ms["delete"] = round((time.perf_counter() - start) * 1000, 3)
         
-        if not digest:
-            logger.info("No unprocessed items to send")
-            return
+        start = time.perf_counter()
+        vacuum_pages = max(1, settings.retention_vacuum_pages)
+        while db.incremental_vacuum(vacuum_pages) >= vacuum_pages:
+            await asyncio.sleep(settings.retention_chunk_pause_ms / 1000)
+        run.pages_freed = max(0, pages_before - db.page_count())
+        run.bytes_reclaimed = run.pages_freed * db.page_size()
+        run.timings_ms["vacuum"] = round((time.perf_counter() - start) * 1000, 3)
         
-        # Send to Discord
-        success = await discord_sender.send_digest(digest)
+        start = time.perf_counter()
+        db.optimize()
+        run.timings_ms["optimize"] = round((time.perf_counter() - start) * 1000, 3)
         
-        if success:
-            # Mark items as processed
-            aggregator.mark_items_processed()
-            logger.info("Digest sent and items marked as processed")
-        else:
-            logger.error("Failed to send digest, items remain unprocessed")
+        run.status = "done"
     
     except Exception as e:
-        logger.error(f"Error in send_digest_now: {str(e)}", exc_info=True)
-
-
-def scheduled_digest_job():
-    """Job function that wraps async send_digest_now for scheduler"""
-    asyncio.create_task(send_digest_now())
+        logger.error(f"Retention run failed: {str(e)}", exc_info=True)
+        run.status = "error"
+        run.error = str(e)
+    
+    finally:
+        run.finished_at = datetime.now()
+        logger.info(
+            f"Retention {run.status}: deleted {run.items_deleted} items and {run.digests_deleted} digests "
+            f"older than {settings.retention_days} days in {run.chunks} chunks, "
+            f"reclaimed {run.bytes_reclaimed / 1024 / 1024:.1f} MB {run.timings_ms}"
+        )
+    
+    return run
 
 
 def start_scheduler():
@@ -62,6 +117,15 @@ def start_scheduler():
             replace_existing=True
         )
         
+        if settings.retention_days > 0:
+            scheduler.add_job(
+                retention_job,
+                trigger=CronTrigger.from_crontab(settings.retention_schedule, timezone=tz),
+                id='retention_job',
+                name='Prune Sent Items',
+                replace_existing=True
+            )
+        
         # Start scheduler
         scheduler.start()
         
@@ -81,12 +145,21 @@ def stop_scheduler():
     """Stop the digest scheduler"""
     if scheduler.running:
         scheduler.shutdown()
+        # Started again if this worker becomes the leader again
+        scheduler.remove_all_jobs()
         logger.info("Scheduler stopped")
 
 
+def get_last_retention_run() -> Optional[RetentionRun]:
+    """Get the outcome of the most recent retention run"""
+    return last_retention_run
+
+
 def get_next_run_time():
-    """Get the next scheduled run time"""
+    """Get the next scheduled run time (announced by the leader if another worker runs the scheduler)"""
     job = scheduler.get_job('digest_job')
     if job:
         return job.next_run_time
+    if coordinator.leader_next_run is not None:
+        return datetime.fromtimestamp(coordinator.leader_next_run, pytz_timezone(settings.timezone))
     return None
@@ -0,0 +1,436 @@
+import asyncio
+import hashlib
+import hmac
+import io
+import logging
+import os
+import re
+import secrets
+import tempfile
+from collections import OrderedDict
+from typing import BinaryIO, Dict, List, Optional, Set
+
+import aiohttp
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+from app.config import settings
+from app.http_cache import etag_matches
+
+# Pillow is optional; without it thumbnails are cached at their original size
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Only Plex metadata images can be proxied: /library/metadata/<id>/<thumb|art>/<version>
+PLEX_THUMB_PATH = re.compile(r"^/?library/metadata/(\d+)/(thumb|art)/(\d+)$")
+THUMB_KEY = re.compile(r"^(\d+)-(thumb|art)-(\d+)$")
+
+# Random key for thumbnail URL signatures, kept in the data directory so
+# links in posted embeds survive restarts and Plex token changes
+SECRET_FILE = "thumbs.key"
+
+CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp"
+}
+
+
+def _sniff_extension(data: bytes) -> str:
+    """Pick a file extension from the image's magic bytes"""
+    if data.startswith(b"\x89PNG"):
+        return ".png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return ".jpg"
+
+
+class ThumbnailCache:
+    """
+    Size-bounded LRU cache of Plex thumbnails on local disk.
+
+    Each image is fetched from Plex at most once (concurrent requests for the
+    same key share one fetch task, which outlives any one request) and is
+    then served from disk. Keys encode the Plex image path, so no lookup
+    table is needed and only Plex metadata images can be requested. Public
+    URLs carry an HMAC of the key, so only thumbnails Digestarr linked to
+    can be fetched through it. Prefetches go through a bounded queue served
+    by a few workers.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (filename, size)
+        self._total_bytes = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._prefetch_queue: Optional[asyncio.Queue] = None
+        self._prefetch_pending: Set[str] = set()
+        self._prefetch_workers: List[asyncio.Task] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loaded = False
+        self._secret: Optional[bytes] = None
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.adopted = 0
+        self.evictions = 0
+        self.prefetches_skipped = 0
+
+    @property
+    def cache_dir(self) -> str:
+        return settings.thumb_cache_dir or os.path.join(settings.data_dir, "thumbs")
+
+    @property
+    def max_bytes(self) -> int:
+        return settings.thumb_cache_max_mb * 1024 * 1024
+
+    @staticmethod
+    def key_for_path(thumb_path: str) -> Optional[str]:
+        """Get the cache key for a Plex thumb path, or None if it can't be proxied"""
+        match = PLEX_THUMB_PATH.match(thumb_path or "")
+        if not match:
+            return None
+        return "-".join(match.groups())
+
+    @staticmethod
+    def path_for_key(key: str) -> Optional[str]:
+        """Get the Plex path for a cache key, or None if the key is invalid"""
+        match = THUMB_KEY.match(key)
+        if not match:
+            return None
+        rating_key, kind, version = match.groups()
+        return f"/library/metadata/{rating_key}/{kind}/{version}"
+
+    def _signing_secret(self) -> bytes:
+        """The signing key, generated on first use and shared by every worker through the data directory"""
+        if self._secret is not None:
+            return self._secret
+
+        path = os.path.join(settings.data_dir, SECRET_FILE)
+        try:
+            with open(path, "rb") as f:
+                secret = f.read()
+        except FileNotFoundError:
+            secret = b""
+
+        if not secret:
+            os.makedirs(settings.data_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(secrets.token_bytes(32))
+            try:
+                # Never replaces an existing key: a worker that loses the race uses the winner's
+                os.link(tmp_path, path)
+                logger.info(f"Created thumbnail signing key {path}")
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp_path)
+            with open(path, "rb") as f:
+                secret = f.read()
+
+        self._secret = secret
+        return secret
+
+    def sign(self, key: str) -> str:
+        """Signature of a cache key, with the secret kept in the data directory"""
+        return hmac.new(self._signing_secret(), key.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+    def verify(self, key: str, signature: str) -> bool:
+        """Whether a signature from a thumbnail URL matches the key"""
+        return hmac.compare_digest(self.sign(key), signature or "")
+
+    def public_url(self, key: str) -> str:
+        """Signed URL under which Discord can fetch a cached thumbnail"""
+        return f"{settings.public_base_url.rstrip('/')}/thumbs/{key}?sig={self.sign(key)}"
+
+    def _load(self):
+        """Index existing cache files, least recently used first"""
+        if self._loaded:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        files = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                key, ext = os.path.splitext(entry.name)
+                if ext == ".part":
+                    # Upload interrupted by a restart
+                    os.remove(entry.path)
+                    continue
+                if entry.is_file() and ext in CONTENT_TYPES and THUMB_KEY.match(key):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, key, entry.name, stat.st_size))
+
+        for _, key, filename, size in sorted(files):
+            self._entries[key] = (filename, size)
+            self._total_bytes += size
+
+        self._loaded = True
+        logger.info(f"Thumbnail cache: {len(self._entries)} files, {self._total_bytes / 1024 / 1024:.1f} MB")
+
+    async def start(self):
+        """Index the cache directory, open the Plex HTTP session and start the prefetch workers"""
+        self._load()
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=settings.thumb_fetch_timeout)
+            )
+        if settings.thumb_prefetch and not self._prefetch_workers:
+            self._prefetch_queue = asyncio.Queue(maxsize=max(1, settings.thumb_prefetch_queue_size))
+            self._prefetch_workers = [
+                asyncio.create_task(self._prefetch_worker(), name=f"thumb-prefetch-{index}")
+                for index in range(max(1, settings.thumb_prefetch_concurrency))
+            ]
+
+    async def close(self):
+        """Cancel prefetches and fetches, and close the Plex HTTP session"""
+        for task in self._prefetch_workers + list(self._inflight.values()):
+            task.cancel()
+        self._prefetch_workers = []
+        self._prefetch_queue = None
+        self._prefetch_pending.clear()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Get the cached file for a key, marking it recently used"""
+        self._load()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        filename = os.path.join(self.cache_dir, entry[0])
+        if not os.path.exists(filename):
+            self._forget(key)
+            return None
+
+        self._entries.move_to_end(key)
+        try:
+            # Persist recency across restarts
+            os.utime(filename)
+        except OSError:
+            pass
+        return filename
+
+    def _forget(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+
+    def _evict(self):
+        """Remove least recently used files until the cache fits its limit"""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, (filename, _) = next(iter(self._entries.items()))
+            self._forget(key)
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.cache_dir, filename))
+            except OSError:
+                pass
+
+    def _downscale(self, data: bytes) -> bytes:
+        """Shrink an image to the configured width (requires Pillow)"""
+        if Image is None or settings.thumb_max_width <= 0:
+            return data
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                if image.width <= settings.thumb_max_width:
+                    return data
+                height = round(image.height * settings.thumb_max_width / image.width)
+                resized = image.convert("RGB").resize((settings.thumb_max_width, height))
+                output = io.BytesIO()
+                resized.save(output, format="JPEG", quality=85)
+                return output.getvalue()
+        except Exception as e:
+            logger.warning(f"Could not downscale thumbnail: {str(e)}")
+            return data
+
+    def _write(self, key: str, data: bytes) -> str:
+        """Atomically write image data into the cache"""
+        self._load()
+        filename = key + _sniff_extension(data)
+        path = os.path.join(self.cache_dir, filename)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._add_entry(key, filename, len(data))
+        return path
+
+    def _add_entry(self, key: str, filename: str, size: int):
+        self._forget(key)
+        self._entries[key] = (filename, size)
+        self._total_bytes += size
+        self._evict()
+
+    async def store(self, key: str, data: bytes) -> str:
+        """Add image data to the cache (downscaling it off the event loop)"""
+        if Image is not None and settings.thumb_max_width > 0:
+            data = await asyncio.to_thread(self._downscale, data)
+        return self._write(key, data)
+
+    def open_upload(self) -> BinaryIO:
+        """Open a temporary file in the cache directory for an incoming image"""
+        self._load()
+        return tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".part", delete=False)
+
+    async def adopt(self, key: str, upload_path: str) -> Optional[str]:
+        """
+        Move a finished upload (such as the image attached to a Plex webhook)
+        into the cache. The file is renamed into place, not copied.
+        """
+        try:
+            with open(upload_path, "rb") as f:
+                head = f.read(12)
+            if not head:
+                os.remove(upload_path)
+                return None
+
+            if Image is not None and settings.thumb_max_width > 0:
+                with open(upload_path, "rb") as f:
+                    data = f.read()
+                os.remove(upload_path)
+                path = await self.store(key, data)
+            else:
+                filename = key + _sniff_extension(head)
+                path = os.path.join(self.cache_dir, filename)
+                os.replace(upload_path, path)
+                self._add_entry(key, filename, os.path.getsize(path))
+        except OSError as e:
+            logger.warning(f"Could not cache attached thumbnail {key}: {str(e)}")
+            return None
+
+        self.adopted += 1
+        return path
+
+    async def get(self, key: str) -> Optional[str]:
+        """Get the cached file for a key, fetching it from Plex on a miss"""
+        filename = self.lookup(key)
+        if filename:
+            self.hits += 1
+            return filename
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            # Its own task: a caller that is cancelled (client gone) doesn't cancel the others' fetch
+            task = asyncio.create_task(self._fetch(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._fetch_done(key, done))
+        return await asyncio.shield(task)
+
+    def _fetch_done(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Make sure the exception counts as retrieved if nobody else waits
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch(self, key: str) -> Optional[str]:
+        """Download an image from Plex into the cache"""
+        path = self.path_for_key(key)
+        if path is None:
+            return None
+
+        if self._session is None or self._session.closed:
+            await self.start()
+
+        headers = {"Accept": "image/*"}
+        if settings.plex_token:
+            headers["X-Plex-Token"] = settings.plex_token
+
+        self.fetches += 1
+        async with self._session.get(f"{settings.plex_url.rstrip('/')}{path}", headers=headers) as response:
+            if response.status != 200:
+                logger.warning(f"Plex returned {response.status} for thumbnail {key}")
+                return None
+            data = await response.read()
+
+        return await self.store(key, data)
+
+    def prefetch(self, key: str):
+        """Warm the cache for a key in the background"""
+        if self._prefetch_queue is None or key in self._entries or key in self._inflight or key in self._prefetch_pending:
+            return
+        try:
+            self._prefetch_queue.put_nowait(key)
+        except asyncio.QueueFull:
+            # A large backfill; the rest is fetched when Discord first asks for it
+            self.prefetches_skipped += 1
+            return
+        self._prefetch_pending.add(key)
+
+    async def _prefetch_worker(self):
+        """Fetch queued keys one at a time; a few of these bound the load on Plex"""
+        while True:
+            key = await self._prefetch_queue.get()
+            try:
+                await self.get(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"Thumbnail prefetch for {key} failed: {str(e)}")
+            finally:
+                self._prefetch_pending.discard(key)
+
+    def get_stats(self) -> dict:
+        """Get cache statistics"""
+        return {
+            "files": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "fetches": self.fetches,
+            "adopted": self.adopted,
+            "evictions": self.evictions,
+            "prefetch_queue": self._prefetch_queue.qsize() if self._prefetch_queue else 0,
+            "prefetches_skipped": self.prefetches_skipped
+        }
+
+
+# Global instance
+thumbnail_cache = ThumbnailCache()
+
+
+@router.get("/thumbs/{key}")
+async def get_thumbnail(key: str, request: Request, sig: str = ""):
+    """Serve a Plex thumbnail from the local cache (signed links only)"""
+    # Same answer for both, so keys can't be probed
+    if not THUMB_KEY.match(key) or not thumbnail_cache.verify(key, sig):
+        raise HTTPException(status_code=404, detail="Unknown thumbnail")
+
+    try:
+        filename = await thumbnail_cache.get(key)
+    except Exception as e:
+        logger.error(f"Failed to fetch thumbnail {key}: {str(e)}")
+        raise HTTPException(status_code=502, detail="Could not fetch thumbnail from Plex")
+
+    if not filename:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+
+    # The key contains Plex's image version, so a cached file never changes
+    stat = os.stat(filename)
+    etag = f'"{key}-{stat.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=604800, immutable"
+    }
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        filename,
+        media_type=CONTENT_TYPES[os.path.splitext(filename)[1]],
+        headers=headers
+    )
@@ -1,16 +1,62 @@
 from fastapi import APIRouter, Request, HTTPException
 from datetime import datetime
+from typing import Optional
+import json
 import logging
+import re
 
 from app.config import settings
 from app.models import PlexWebhookPayload, MediaItem, MediaType
-from app.aggregator import MediaAggregator
+from app.aggregator import aggregator
+from app.ingest import IngestQueue
+from app.digest_engine import digest_engine
+from app.coordination import coordinator
+from app.thumbnails import thumbnail_cache
+from app.multipart_stream import read_webhook_body
+from app.backfill import PlexBackfill
+from app.metrics import WEBHOOK_STAGE_SECONDS, WEBHOOKS, event_label
+from app.profiling import profiler
+from app.events import event_broadcaster
+from app.http_cache import CachedResponse
+
+# orjson is optional; it decodes payloads several times faster
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Initialize aggregator
-aggregator = MediaAggregator()
+# The "event" field of a raw Plex payload
+EVENT_FIELD = re.compile(rb'"event"\s*:\s*"([^"\\]*)"')
+
+# Metadata field whose image the digest embed links, by Plex item type
+# (episodes show their series poster, not the episode still)
+EMBED_THUMB_FIELDS = {"movie": "thumb", "episode": "grandparentThumb", "track": "thumb"}
+
+
+async def check_threshold(batch_size: int):
+    """Trigger a digest once enough items have been written (on the leader only)"""
+    if settings.digest_threshold > 0 and coordinator.is_leader:
+        # Items already claimed by an in-flight digest don't count again
+        unclaimed_count = aggregator.get_unclaimed_count()
+        if unclaimed_count >= settings.digest_threshold:
+            logger.info(f"Threshold reached ({unclaimed_count} items), triggering digest send")
+            # Runs in the background; concurrent triggers coalesce
+            digest_engine.trigger("threshold")
+
+
+async def _batch_written(batch_size: int):
+    """Tell Web UI clients about new items, then check the threshold"""
+    event_broadcaster.publish("items", {"added": batch_size})
+    event_broadcaster.publish_stats()
+    await check_threshold(batch_size)
+
+
+# Batched writer in front of the aggregator
+ingest_queue = IngestQueue(aggregator, on_batch_written=_batch_written)
 
 
 @router.post("/webhook")
@@ -19,80 +65,74 @@ async def plex_webhook(request: Request):
     Handle incoming Plex webhooks
     Plex sends webhooks as multipart/form-data with a 'payload' JSON field
     """
+    # While profiling is off this is a single attribute check
+    if profiler.webhook_sample_rate and profiler.sample_webhook():
+        response, _ = await profiler.profile("webhook", _handle_webhook(request))
+        return response
+    return await _handle_webhook(request)
+
+
+async def _handle_webhook(request: Request):
+    """Parse, filter and queue one webhook"""
+    event = None
     try:
-        # Parse form data
-        form = await request.form()
-        payload_json = form.get("payload")
+        payload_dict = None
+        image_key = None
+        
+        def image_sink(payload_json: bytes):
+            # Called when the attached image starts, after the payload part
+            nonlocal payload_dict, image_key
+            if _peek_event(payload_json) != "library.new":
+                return None
+            payload_dict = _json_loads(payload_json)
+            image_key = _attached_thumb_key(payload_dict)
+            return thumbnail_cache.open_upload() if image_key else None
+        
+        with WEBHOOK_STAGE_SECONDS.time(stage="parse"):
+            # Stream the body: keep the payload, stream or drop the image
+            body = await read_webhook_body(request, image_sink)
+            
+            # Cache the attached image before the item asks for a prefetch
+            if body.image_path:
+                await thumbnail_cache.adopt(image_key, body.image_path)
+            
+            if not body.payload:
+                raise HTTPException(status_code=400, detail="No payload in request")
+            
+            event = _peek_event(body.payload)
         
-        if not payload_json:
-            raise HTTPException(status_code=400, detail="No payload in request")
+        # Only process library.new events (new media added); playback events
+        # vastly outnumber them, so reject those before decoding anything
+        if event is not None and event != "library.new":
+            logger.debug(f"Ignoring event type: {event}")
+            WEBHOOKS.inc(event=event_label(event), outcome="ignored")
+            return {"status": "ignored", "reason": "not a library.new event"}
         
-        # Parse JSON
-        import json
-        payload_dict = json.loads(payload_json)
-        payload = PlexWebhookPayload(**payload_dict)
+        with WEBHOOK_STAGE_SECONDS.time(stage="validate"):
+            # Parse JSON
+            if payload_dict is None:
+                payload_dict = _json_loads(body.payload)
+            payload = PlexWebhookPayload(**payload_dict)
+            event = payload.event
+            
+            # Determine media type and create MediaItem
+            media_item = None
+            if payload.event == "library.new":
+                media_item = media_item_from_metadata(payload.Metadata)
         
         # Log the event
         logger.info(f"Received Plex webhook: {payload.event}")
         
-        # Only process library.new events (new media added)
         if payload.event != "library.new":
             logger.debug(f"Ignoring event type: {payload.event}")
+            WEBHOOKS.inc(event=event_label(event), outcome="ignored")
             return {"status": "ignored", "reason": "not a library.new event"}
         
-        # Extract metadata
-        metadata = payload.Metadata
-        
-        # Determine media type and create MediaItem
-        media_item = None
-        
-        if metadata.get("type") == "movie":
-            media_item = MediaItem(
-                media_type=MediaType.MOVIE,
-                title=metadata.get("title"),
-                year=metadata.get("year"),
-                added_at=datetime.fromtimestamp(metadata.get("addedAt", 0)),
-                thumb_url=_build_thumb_url(metadata.get("thumb")),
-                rating_key=metadata.get("ratingKey")
-            )
-        
-        elif metadata.get("type") == "episode":
-            media_item = MediaItem(
-                media_type=MediaType.TV_SHOW,
-                title=metadata.get("title"),
-                show_title=metadata.get("grandparentTitle"),
-                season_number=metadata.get("parentIndex"),
-                episode_number=metadata.get("index"),
-                year=metadata.get("year"),
-                added_at=datetime.fromtimestamp(metadata.get("addedAt", 0)),
-                thumb_url=_build_thumb_url(metadata.get("grandparentThumb")),
-                rating_key=metadata.get("ratingKey")
-            )
-        
-        elif metadata.get("type") == "track":
-            media_item = MediaItem(
-                media_type=MediaType.MUSIC,
-                title=metadata.get("title"),
-                track_title=metadata.get("title"),
-                artist=metadata.get("grandparentTitle"),
-                album=metadata.get("parentTitle"),
-                added_at=datetime.fromtimestamp(metadata.get("addedAt", 0)),
-                thumb_url=_build_thumb_url(metadata.get("thumb")),
-                rating_key=metadata.get("ratingKey")
-            )
-        
         if media_item:
-            # Add to aggregator
-            aggregator.add_media_item(media_item)
-            
-            # Check threshold for auto-send
-            if settings.digest_threshold > 0:
-                unprocessed_count = aggregator.get_unprocessed_count()
-                if unprocessed_count >= settings.digest_threshold:
-                    logger.info(f"Threshold reached ({unprocessed_count} items), triggering digest send")
-                    # Import here to avoid circular import
-                    from app.scheduler import send_digest_now
-                    await send_digest_now()
+            # Queue for the batched writer (threshold is checked after commit)
+            with WEBHOOK_STAGE_SECONDS.time(stage="store"):
+                await ingest_queue.put(media_item, wait=settings.ingest_wait_durable)
+            WEBHOOKS.inc(event=event_label(event), outcome="accepted")
             
             return {
                 "status": "success",
@@ -100,19 +140,104 @@ async def plex_webhook(request: Request):
                 "title": media_item.title
             }
         else:
-            logger.warning(f"Unknown media type: {metadata.get('type')}")
+            logger.warning(f"Unknown media type: {payload.Metadata.get('type')}")
+            WEBHOOKS.inc(event=event_label(event), outcome="ignored")
             return {"status": "ignored", "reason": "unknown media type"}
     
+    except HTTPException:
+        WEBHOOKS.inc(event=event_label(event), outcome="failed")
+        raise
     except Exception as e:
         logger.error(f"Error processing webhook: {str(e)}", exc_info=True)
+        WEBHOOKS.inc(event=event_label(event), outcome="failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def media_item_from_metadata(metadata: dict) -> Optional[MediaItem]:
+    """
+    Convert Plex item metadata (from a webhook or the library API) into a
+    MediaItem. Returns None for unsupported media types.
+    """
+    if metadata.get("type") == "movie":
+        return MediaItem(
+            media_type=MediaType.MOVIE,
+            title=metadata.get("title"),
+            year=metadata.get("year"),
+            added_at=datetime.fromtimestamp(metadata.get("addedAt", 0)),
+            thumb_url=_build_thumb_url(metadata.get(EMBED_THUMB_FIELDS["movie"])),
+            rating_key=metadata.get("ratingKey")
+        )
+    
+    elif metadata.get("type") == "episode":
+        return MediaItem(
+            media_type=MediaType.TV_SHOW,
+            title=metadata.get("title"),
+            show_title=metadata.get("grandparentTitle"),
+            season_number=metadata.get("parentIndex"),
+            episode_number=metadata.get("index"),
+            year=metadata.get("year"),
+            added_at=datetime.fromtimestamp(metadata.get("addedAt", 0)),
+            thumb_url=_build_thumb_url(metadata.get(EMBED_THUMB_FIELDS["episode"])),
+            rating_key=metadata.get("ratingKey")
+        )
+    
+    elif metadata.get("type") == "track":
+        return MediaItem(
+            media_type=MediaType.MUSIC,
+            title=metadata.get("title"),
+            track_title=metadata.get("title"),
+            artist=metadata.get("grandparentTitle"),
+            album=metadata.get("parentTitle"),
+            added_at=datetime.fromtimestamp(metadata.get("addedAt", 0)),
+            thumb_url=_build_thumb_url(metadata.get(EMBED_THUMB_FIELDS["track"])),
+            rating_key=metadata.get("ratingKey")
+        )
+    
+    return None
+
+
+def _peek_event(payload_json: bytes) -> Optional[str]:
+    """Read the event name from a raw payload without validating it"""
+    events = set(EVENT_FIELD.findall(payload_json))
+    if len(events) == 1:
+        return events.pop().decode("utf-8", "replace")
+    
+    # Missing, escaped or ambiguous (a nested "event" key): decode properly
+    try:
+        event = _json_loads(payload_json).get("event")
+    except (ValueError, AttributeError):
+        return None
+    return event if isinstance(event, str) else None
+
+
+def _attached_thumb_key(payload_dict: dict) -> Optional[str]:
+    """Cache key for the image attached to a webhook, or None if we don't keep it"""
+    if not settings.public_base_url or payload_dict.get("event") != "library.new":
+        return None
+    
+    # Plex attaches the item's own poster ("thumb"); keep it only where the
+    # embed links that same image, so nothing is cached under another item's key
+    metadata = payload_dict.get("Metadata") or {}
+    if EMBED_THUMB_FIELDS.get(metadata.get("type")) != "thumb":
+        return None
+    key = thumbnail_cache.key_for_path(metadata.get("thumb"))
+    if key is None or thumbnail_cache.lookup(key):
+        return None
+    return key
+
+
 def _build_thumb_url(thumb_path: str) -> str:
     """Build full thumbnail URL from Plex path"""
     if not thumb_path:
         return None
     
+    # Serve through the local thumbnail cache when Digestarr is publicly reachable
+    if settings.public_base_url:
+        key = thumbnail_cache.key_for_path(thumb_path)
+        if key:
+            thumbnail_cache.prefetch(key)
+            return thumbnail_cache.public_url(key)
+    
     # Remove leading slash if present
     thumb_path = thumb_path.lstrip('/')
     
@@ -125,9 +250,11 @@ def _build_thumb_url(thumb_path: str) -> str:
         return f"{base_url}/{thumb_path}"
 
 
-@router.get("/health")
-async def health_check():
-    """Health check endpoint"""
+# Catch-up from the Plex library API, sharing the webhook's item mapping
+plex_backfill = PlexBackfill(aggregator, media_item_from_metadata, on_batch_written=_batch_written)
+
+
+def _health() -> dict:
     return {
         "status": "healthy",
         "app": settings.app_name,
@@ -135,6 +262,15 @@ async def health_check():
     }
 
 
+health_response = CachedResponse(_health, version=lambda: settings.app_version)
+
+
+@router.get("/health")
+async def health_check(request: Request):
+    """Health check endpoint"""
+    return health_response.response(request)
+
+
 @router.get("/stats")
 async def get_stats():
     """Get current statistics"""
@@ -142,5 +278,8 @@ async def get_stats():
     return {
         "unprocessed_items": unprocessed,
         "threshold": settings.digest_threshold,
-        "threshold_met": unprocessed >= settings.digest_threshold if settings.digest_threshold > 0 else False
+        "unprocessed_by_type": aggregator.get_unprocessed_counts(),
+        "threshold_met": unprocessed >= settings.digest_threshold if settings.digest_threshold > 0 else False,
+        "ingest": ingest_queue.get_stats(),
+        "thumbnails": thumbnail_cache.get_stats()
     }
@@ -0,0 +1,6 @@
+"""
+Reproducible benchmarks for Digestarr's hot paths.
+
+Run with ``python -m benchmarks`` from the repository root; see
+``python -m benchmarks --help`` for options.
+"""
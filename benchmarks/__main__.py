@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def _int_list(value: str):
+    return [int(part.replace("_", "")) for part in value.split(",") if part]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Digestarr benchmark suite")
+    parser.add_argument("--sizes", type=_int_list, default=[1000, 10000, 100000, 1000000],
+                        help="Backlog sizes for the digest benchmark (comma separated)")
+    parser.add_argument("--engines", default="incremental,sql",
+                        help="Digest engines to compare (incremental, sql, python)")
+    parser.add_argument("--requests", type=int, default=5000, help="Webhook requests to send")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent webhook requests")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per digest measurement")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data")
+    parser.add_argument("--skip-webhook", action="store_true", help="Skip the webhook benchmark")
+    parser.add_argument("--skip-digest", action="store_true", help="Skip the digest benchmark")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/bench-<timestamp>.json)")
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace, workdir: str) -> dict:
+    # Imported here so the environment below is in place before settings load
+    from benchmarks.bench_digest import run_digest_benchmark
+    from benchmarks.bench_webhook import run_webhook_benchmark
+
+    results = {}
+    if not args.skip_webhook:
+        print(f"webhook: {args.requests} requests at concurrency {args.concurrency}", file=sys.stderr)
+        results["webhook"] = await run_webhook_benchmark(args.requests, args.concurrency, seed=args.seed)
+    if not args.skip_digest:
+        engines = [engine.strip() for engine in args.engines.split(",") if engine.strip()]
+        print(f"digest: sizes {args.sizes}, engines {engines}", file=sys.stderr)
+        results["digest"] = await run_digest_benchmark(workdir, args.sizes, engines, args.repeat, args.seed)
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = datetime.now(timezone.utc)
+
+    with tempfile.TemporaryDirectory(prefix="digestarr-bench-") as workdir:
+        # A throwaway data directory; nothing touches the real database or Plex
+        os.environ.update({
+            "DATA_DIR": workdir,
+            "DB_PATH": os.path.join(workdir, "webhook.db"),
+            "BACKFILL_ON_STARTUP": "false",
+            "DISCORD_WEBHOOK_URL": "",
+            "LOG_LEVEL": os.environ.get("BENCH_LOG_LEVEL", "WARNING")
+        })
+        results = asyncio.run(run(args, workdir))
+
+    report = {
+        "meta": {
+            "started_at": started.isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key != "output"}
+        },
+        **results
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{started.strftime('%Y%m%dT%H%M%SZ')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import asyncio
+from typing import List, Tuple
+
+
+async def asgi_request(
+    app,
+    method: str,
+    path: str,
+    body: bytes = b"",
+    headers: List[Tuple[str, str]] = (),
+    chunk_size: int = 64 * 1024
+) -> Tuple[int, bytes]:
+    """
+    Send one HTTP request straight into an ASGI app, with no sockets or
+    client library in between. The body is delivered in chunks, like a
+    server would. Returns the status code and response body.
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+        + [(b"content-length", str(len(body)).encode("ascii"))],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80)
+    }
+
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+    position = 0
+    done = asyncio.Event()
+
+    async def receive():
+        nonlocal position
+        if position < len(chunks):
+            chunk = chunks[position]
+            position += 1
+            return {"type": "http.request", "body": chunk, "more_body": position < len(chunks)}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    status = 0
+    response = []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            response.append(message.get("body", b""))
+            if not message.get("more_body"):
+                done.set()
+
+    await app(scope, receive, send)
+    return status, b"".join(response)
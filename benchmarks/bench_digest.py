@@ -0,0 +1,131 @@
+import os
+import statistics
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from benchmarks.discord_sink import DiscordSink
+from benchmarks.generator import WebhookGenerator
+
+INSERT_SQL = """
+    INSERT INTO media_items (
+        media_type, title, year, show_title, season_number,
+        episode_number, artist, album, track_title,
+        added_at, thumb_url, rating_key, processed
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Rows per insert transaction while seeding
+SEED_CHUNK = 50000
+
+
+def _measure(function: Callable, repeat: int) -> Tuple[Dict[str, float], object]:
+    """Run function repeat times; returns min/median in milliseconds and the last result"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - start)
+    return {
+        "min": round(min(samples) * 1000, 3),
+        "median": round(statistics.median(samples) * 1000, 3)
+    }, result
+
+
+def _query_plans(conn) -> Dict[str, dict]:
+    """EXPLAIN QUERY PLAN of the SQL engine's GROUP BY queries, and whether they use a covering index"""
+    from app.aggregator import SHOW_SEASONS_SQL, ARTIST_ALBUMS_SQL
+    from app.models import MediaType
+
+    plans = {}
+    for name, sql, media_type in (
+        ("show_seasons", SHOW_SEASONS_SQL, MediaType.TV_SHOW),
+        ("artist_albums", ARTIST_ALBUMS_SQL, MediaType.MUSIC)
+    ):
+        details = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", (media_type.value, None))]
+        plans[name] = {
+            "plan": details,
+            "covering": any("COVERING INDEX" in detail for detail in details)
+        }
+    return plans
+
+
+def _seed(aggregator, rows: int, seed: int) -> float:
+    """Bulk insert rows unprocessed items; returns the time taken in seconds"""
+    generator = WebhookGenerator(seed)
+    pending = generator.media_rows(rows)
+    start = time.perf_counter()
+    remaining = rows
+    while remaining:
+        chunk = [next(pending) for _ in range(min(SEED_CHUNK, remaining))]
+        with aggregator.db.transaction() as conn:
+            conn.executemany(INSERT_SQL, chunk)
+        remaining -= len(chunk)
+    return time.perf_counter() - start
+
+
+async def run_digest_benchmark(
+    workdir: str,
+    sizes: Sequence[int],
+    engines: Sequence[str] = ("incremental", "sql"),
+    repeat: int = 3,
+    seed: int = 0
+) -> List[dict]:
+    """
+    Time each stage of a digest run over backlogs of the given sizes:
+    rebuilding the in-memory state, aggregating with each engine, rendering
+    the Discord payloads and posting them to a local Discord stand-in.
+    """
+    from app.aggregator import MediaAggregator
+    from app.config import settings
+    from app.database import close_databases
+    from app.discord_sender import discord_sender
+
+    sink = DiscordSink()
+    await sink.start()
+    settings.discord_webhook_url = sink.url
+    settings.discord_destinations = []
+    settings.discord_rate_limit_requests = 1000000
+    discord_sender.update_config()
+    await discord_sender.start()
+
+    results = []
+    try:
+        for rows in sizes:
+            settings.db_path = os.path.join(workdir, f"digest-{rows}.db")
+            aggregator = MediaAggregator()
+            seed_seconds = _seed(aggregator, rows, seed)
+            load_state, _ = _measure(aggregator._load_state, 1)
+            plans = _query_plans(aggregator.db.reader())
+
+            for engine in engines:
+                settings.digest_engine = engine
+                aggregate, digest = _measure(aggregator.aggregate_digest, repeat)
+                render, rendered = _measure(lambda: discord_sender.render_digest(digest), repeat)
+                payloads = sum(len(pages) for pages in rendered.values())
+
+                sink.reset()
+                start = time.perf_counter()
+                delivery = await discord_sender.deliver(rendered, digest.total_items)
+                send_seconds = time.perf_counter() - start
+
+                results.append({
+                    "rows": rows,
+                    "engine": engine,
+                    "seed_rows_per_second": round(rows / seed_seconds, 1) if seed_seconds else None,
+                    "load_state_ms": load_state["min"],
+                    "aggregate_ms": aggregate,
+                    "render_ms": render,
+                    "send_ms": round(send_seconds * 1000, 3),
+                    "total_items": digest.total_items,
+                    "messages": payloads,
+                    "payload_bytes": sink.bytes,
+                    "delivered": delivery.success,
+                    **({"query_plans": plans} if engine == "sql" else {})
+                })
+    finally:
+        await discord_sender.close()
+        await sink.stop()
+        close_databases()
+
+    return results
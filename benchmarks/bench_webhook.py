@@ -0,0 +1,97 @@
+import asyncio
+import time
+from collections import Counter
+from typing import Dict, List
+
+from benchmarks.asgi import asgi_request
+from benchmarks.generator import WebhookGenerator
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Summary of latencies in seconds, reported in milliseconds (nearest rank)"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def rank(fraction: float) -> float:
+        index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+        return round(ordered[index] * 1000, 3)
+
+    return {
+        "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50": rank(0.50),
+        "p90": rank(0.90),
+        "p99": rank(0.99),
+        "max": round(ordered[-1] * 1000, 3)
+    }
+
+
+async def run_webhook_benchmark(
+    requests: int = 5000,
+    concurrency: int = 32,
+    warmup: int = 200,
+    seed: int = 0
+) -> dict:
+    """
+    Drive /webhook in-process through the ASGI app with a fixed set of
+    synthetic requests and report throughput and latency percentiles.
+    """
+    from app.config import settings
+    from app.main import app
+    from app.webhook import ingest_queue
+
+    generator = WebhookGenerator(seed)
+    batch = [generator.request() for _ in range(warmup + requests)]
+    warmup_batch, measured = batch[:warmup], batch[warmup:]
+
+    latencies: List[float] = []
+    by_kind: Dict[str, List[float]] = {"library.new": [], "playback": []}
+    statuses: Counter = Counter()
+
+    async def post(event: str, body: bytes, content_type: str, record: bool):
+        start = time.perf_counter()
+        status, _ = await asgi_request(app, "POST", "/webhook", body, [("content-type", content_type)])
+        elapsed = time.perf_counter() - start
+        if record:
+            latencies.append(elapsed)
+            by_kind["library.new" if event == "library.new" else "playback"].append(elapsed)
+            statuses[status] += 1
+
+    async def worker(requests_iter, record: bool):
+        for event, body, content_type in requests_iter:
+            await post(event, body, content_type, record)
+
+    async with app.router.lifespan_context(app):
+        warmup_iter = iter(warmup_batch)
+        await asyncio.gather(*(worker(warmup_iter, False) for _ in range(concurrency)))
+
+        # Let the warmup items reach the database before taking the baseline
+        while ingest_queue.get_stats()["queue_depth"]:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(settings.ingest_batch_delay_ms / 1000 * 2)
+        before = ingest_queue.get_stats()
+        measured_iter = iter(measured)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(measured_iter, True) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    # Written by the ingest queue during the measured run, including the final flush
+    after = ingest_queue.get_stats()
+    batches = after["batches_written"] - before["batches_written"]
+    items = after["items_written"] - before["items_written"]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "library_new": len(by_kind["library.new"]),
+        "request_bytes": sum(len(body) for _, body, _ in measured),
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 1),
+        "latency_ms": percentiles(latencies),
+        "latency_ms_by_kind": {kind: percentiles(samples) for kind, samples in by_kind.items()},
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "ingest": {
+            "batches_written": batches,
+            "items_written": items,
+            "avg_batch_size": round(items / batches, 2) if batches else 0
+        }
+    }
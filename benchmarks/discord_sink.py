@@ -0,0 +1,52 @@
+import itertools
+from typing import Optional
+
+from aiohttp import web
+
+
+class DiscordSink:
+    """
+    Local stand-in for a Discord webhook.
+
+    Accepts every post, answers like Discord does with wait=true (the created
+    message, including its id) and advertises a rate limit that never runs
+    out, so benchmarks measure Digestarr rather than Discord.
+    """
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+        self.messages = 0
+        self.bytes = 0
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        self.messages += 1
+        self.bytes += len(body)
+        return web.json_response({"id": str(next(self._ids))}, headers={
+            "X-RateLimit-Limit": "1000000",
+            "X-RateLimit-Remaining": "1000000",
+            "X-RateLimit-Reset-After": "0"
+        })
+
+    async def start(self) -> str:
+        """Serve on a free local port; returns the webhook URL"""
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_post("/api/webhooks/{id}/{token}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/api/webhooks/1/benchmark"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def reset(self):
+        self.messages = 0
+        self.bytes = 0
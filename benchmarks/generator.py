@@ -0,0 +1,166 @@
+import json
+import random
+import time
+from typing import Iterator, Tuple
+
+PLAYBACK_EVENTS = ("media.play", "media.pause", "media.resume", "media.stop", "media.scrobble")
+
+# Share of library.new items by Plex type
+LIBRARY_MIX = (("episode", 0.7), ("track", 0.2), ("movie", 0.1))
+
+WORDS = (
+    "night", "river", "empire", "shadow", "garden", "signal", "winter", "glass", "echo", "harbor",
+    "crown", "ember", "north", "paper", "silver", "storm", "velvet", "wild", "zero", "atlas"
+)
+
+
+class WebhookGenerator:
+    """
+    Deterministic source of synthetic Plex webhooks and media rows.
+
+    Library additions draw from fixed pools of shows and artists so episodes
+    and tracks group the way a real library does, while every item gets a
+    unique ratingKey. Playback events carry the same metadata shape plus a
+    Player block, like the ones Plex sends for every play, pause and stop.
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        library_ratio: float = 0.3,
+        thumb_ratio: float = 0.5,
+        thumb_bytes: int = 24 * 1024,
+        shows: int = 200,
+        artists: int = 300
+    ):
+        self.random = random.Random(seed)
+        self.library_ratio = library_ratio
+        self.thumb_ratio = thumb_ratio
+        self.thumb_bytes = thumb_bytes
+        self.shows = [self._title(3) for _ in range(shows)]
+        self.artists = [self._title(2) for _ in range(artists)]
+        self.next_rating_key = 100000
+        self.added_at = int(time.time()) - 86400
+
+    def _title(self, words: int) -> str:
+        return " ".join(self.random.choice(WORDS).capitalize() for _ in range(words))
+
+    def _rating_key(self) -> int:
+        self.next_rating_key += 1
+        return self.next_rating_key
+
+    def _pick_type(self) -> str:
+        roll = self.random.random()
+        for media_type, share in LIBRARY_MIX:
+            if roll < share:
+                return media_type
+            roll -= share
+        return LIBRARY_MIX[-1][0]
+
+    def metadata(self, media_type: str) -> dict:
+        """Plex metadata for one new item of the given type"""
+        rating_key = self._rating_key()
+        self.added_at += self.random.randint(1, 30)
+        metadata = {
+            "ratingKey": str(rating_key),
+            "key": f"/library/metadata/{rating_key}",
+            "guid": f"plex://{media_type}/{rating_key:x}",
+            "type": media_type,
+            "addedAt": self.added_at,
+            "updatedAt": self.added_at,
+            "summary": " ".join(self.random.choice(WORDS) for _ in range(40)),
+            "thumb": f"/library/metadata/{rating_key}/thumb/{self.added_at}"
+        }
+
+        if media_type == "movie":
+            metadata.update(librarySectionType="movie", title=self._title(2), year=self.random.randint(1970, 2025))
+        elif media_type == "episode":
+            show_index = self.random.randrange(len(self.shows))
+            metadata.update(
+                librarySectionType="show",
+                title=self._title(2),
+                grandparentTitle=self.shows[show_index],
+                grandparentThumb=f"/library/metadata/{show_index + 1}/thumb/1700000000",
+                parentIndex=self.random.randint(1, 8),
+                index=self.random.randint(1, 24),
+                year=self.random.randint(1990, 2025)
+            )
+        else:
+            artist = self.random.choice(self.artists)
+            metadata.update(
+                librarySectionType="artist",
+                title=self._title(2),
+                grandparentTitle=artist,
+                parentTitle=f"{artist} {self.random.randint(1, 6)}",
+                index=self.random.randint(1, 14)
+            )
+        return metadata
+
+    def payload(self) -> dict:
+        """A webhook payload: a library addition or playback noise"""
+        library = self.random.random() < self.library_ratio
+        event = "library.new" if library else self.random.choice(PLAYBACK_EVENTS)
+        payload = {
+            "event": event,
+            "user": True,
+            "owner": True,
+            "Account": {"id": 1, "thumb": "https://plex.tv/users/avatar", "title": "owner"},
+            "Server": {"title": "Plex Media Server", "uuid": "0123456789abcdef"},
+            "Metadata": self.metadata(self._pick_type())
+        }
+        if not library:
+            payload["Player"] = {
+                "local": True,
+                "publicAddress": "203.0.113.7",
+                "title": "Living Room TV",
+                "uuid": f"player-{self.random.randint(1, 20)}"
+            }
+        return payload
+
+    def request(self) -> Tuple[str, bytes, str]:
+        """One multipart webhook request: (event, body, content type)"""
+        payload = self.payload()
+        boundary = f"----PlexBoundary{self.random.getrandbits(64):016x}"
+        parts = [
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="payload"\r\n\r\n'
+            f"{json.dumps(payload)}\r\n".encode("utf-8")
+        ]
+
+        # Plex attaches a poster to library.new and media.play webhooks
+        if payload["event"] in ("library.new", "media.play") and self.random.random() < self.thumb_ratio:
+            image = b"\xff\xd8\xff\xe0" + self.random.randbytes(self.thumb_bytes)
+            parts.append(
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="thumb"; filename="image.jpg"\r\n'
+                f"Content-Type: image/jpeg\r\n\r\n".encode("utf-8") + image + b"\r\n"
+            )
+
+        parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+        return payload["event"], b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+    def media_rows(self, count: int) -> Iterator[tuple]:
+        """
+        Unprocessed media_items rows in insert column order (media_type, title,
+        year, show_title, season_number, episode_number, artist, album,
+        track_title, added_at, thumb_url, rating_key, processed)
+        """
+        for _ in range(count):
+            metadata = self.metadata(self._pick_type())
+            media_type = metadata["type"]
+            thumb = metadata["grandparentThumb"] if media_type == "episode" else metadata["thumb"]
+            yield (
+                media_type,
+                metadata["title"],
+                metadata.get("year"),
+                metadata.get("grandparentTitle") if media_type == "episode" else None,
+                metadata.get("parentIndex") if media_type == "episode" else None,
+                metadata.get("index") if media_type == "episode" else None,
+                metadata.get("grandparentTitle") if media_type == "track" else None,
+                metadata.get("parentTitle") if media_type == "track" else None,
+                metadata["title"] if media_type == "track" else None,
+                metadata["addedAt"],
+                f"http://plex:32400{thumb}",
+                metadata["ratingKey"],
+                0
+            )
@@ -0,0 +1,58 @@
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict
+
+# Settings are read when app.config is first imported: point the global
+# database and data directory at a scratch directory before any test does
+_DATA_DIR = tempfile.mkdtemp(prefix="digestarr-tests-")
+os.environ.setdefault("DATA_DIR", _DATA_DIR)
+os.environ.setdefault("DB_PATH", os.path.join(_DATA_DIR, "digestarr.db"))
+os.environ.setdefault("BACKFILL_ON_STARTUP", "false")
+
+import pytest
+from aiohttp import web
+
+from app.aggregator import MediaAggregator
+from app.database import Database
+
+
+@pytest.fixture
+def db_path(tmp_path) -> str:
+    return str(tmp_path / "digestarr.db")
+
+
+@pytest.fixture
+def make_aggregator(db_path):
+    """Aggregators on one temp database file, each with its own connections (like separate workers)"""
+    databases = []
+
+    def make() -> MediaAggregator:
+        db = Database(db_path)
+        databases.append(db)
+        return MediaAggregator(db)
+
+    yield make
+    for db in databases:
+        db.close()
+
+
+@asynccontextmanager
+async def stand_in(routes: Dict[str, Callable]) -> AsyncIterator[str]:
+    """
+    Serve aiohttp handlers on a free local port for the duration of the block.
+    routes maps "METHOD /path" to a handler; yields the base URL.
+    """
+    app = web.Application()
+    for route, handler in routes.items():
+        method, path = route.split(" ", 1)
+        app.router.add_route(method, path, handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.config import settings
+from app.models import MediaItem, MediaType
+
+ENGINES = ("incremental", "sql", "python")
+BASE = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def episode(rating_key: str, show: str, season: int, number: int, minutes: int, thumb: str = None) -> MediaItem:
+    return MediaItem(
+        media_type=MediaType.TV_SHOW, title=f"{show} {season}x{number}", show_title=show,
+        season_number=season, episode_number=number, added_at=BASE + timedelta(minutes=minutes),
+        thumb_url=thumb, rating_key=rating_key
+    )
+
+
+def movie(rating_key: str, title: str, minutes: int) -> MediaItem:
+    return MediaItem(
+        media_type=MediaType.MOVIE, title=title, year=2020, added_at=BASE + timedelta(minutes=minutes),
+        thumb_url=f"https://thumbs/{rating_key}", rating_key=rating_key
+    )
+
+
+def track(rating_key: str, artist: str, album: str, minutes: int) -> MediaItem:
+    return MediaItem(
+        media_type=MediaType.MUSIC, title=f"Track {rating_key}", track_title=f"Track {rating_key}",
+        artist=artist, album=album, added_at=BASE + timedelta(minutes=minutes), rating_key=rating_key
+    )
+
+
+# Out of added_at order, as when a backfill stores older items after newer ones
+BACKLOG = [
+    # Episode 3 is stored twice (two versions of it): [3, 1, 3, 2]
+    episode("e3a", "Show A", 1, 3, 30, "https://thumbs/a-late"),
+    episode("e1", "Show A", 1, 1, 5, "https://thumbs/a-early"),
+    episode("e3b", "Show A", 1, 3, 31),
+    episode("e2", "Show A", 1, 2, 10),
+    episode("b21", "Show B", 2, 1, 40, "https://thumbs/b"),
+    episode("b11", "Show B", 1, 1, 20),
+    movie("m2", "Second", 50),
+    movie("m1", "First", 1),
+    movie("m3", "Third", 60),
+    track("t1", "Artist", "Album B", 15),
+    track("t2", "Artist", "Album A", 16),
+    track("t3", "Artist", "Album B", 17),
+    track("t4", "Artist", "", 18),
+]
+
+
+def digests(aggregator, monkeypatch, build) -> dict:
+    results = {}
+    for engine in ENGINES:
+        monkeypatch.setattr(settings, "digest_engine", engine)
+        results[engine] = build().model_dump()
+    return results
+
+
+@pytest.fixture
+def aggregator(make_aggregator):
+    aggregator = make_aggregator()
+    for item in BACKLOG:
+        aggregator.add_media_items([item])
+    return aggregator
+
+
+def test_engines_agree_on_backlog(aggregator, monkeypatch):
+    results = digests(aggregator, monkeypatch, aggregator.aggregate_digest)
+
+    assert results["sql"] == results["incremental"]
+    assert results["python"] == results["incremental"]
+
+    digest = results["incremental"]
+    show_a = digest["tv_shows"][0]
+    assert (show_a["show_title"], show_a["episodes"], show_a["episode_count"]) == ("Show A", [1, 2, 3], 3)
+    assert show_a["thumb_url"] == "https://thumbs/a-early"
+    assert [(show["show_title"], show["season_number"]) for show in digest["tv_shows"]] == [
+        ("Show A", 1), ("Show B", 1), ("Show B", 2)
+    ]
+    assert [m["title"] for m in digest["movies"]] == ["First", "Second", "Third"]
+    assert digest["music"] == [{"artist": "Artist", "albums": ["Album A", "Album B"]}]
+    assert digest["total_items"] == len(BACKLOG)
+
+
+def test_engines_agree_on_claimed_digest(aggregator, monkeypatch):
+    batch = aggregator.claim_digest()
+    claimed = aggregator._claimed[batch.digest_id]
+
+    results = digests(aggregator, monkeypatch, lambda: aggregator._aggregate(claimed, batch.digest_id))
+
+    assert results["sql"] == results["incremental"]
+    assert results["python"] == results["incremental"]
+    assert results["incremental"]["total_items"] == len(BACKLOG)
+
+
+def test_engines_agree_with_media_types_disabled(aggregator, monkeypatch):
+    monkeypatch.setattr(settings, "enable_movies", False)
+    monkeypatch.setattr(settings, "enable_music", False)
+
+    results = digests(aggregator, monkeypatch, aggregator.aggregate_digest)
+
+    assert results["sql"] == results["incremental"]
+    assert results["python"] == results["incremental"]
+    assert results["incremental"]["movies"] == []
@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from aiohttp import web
+
+from app.backfill import PlexBackfill
+from app.config import settings
+from app.webhook import media_item_from_metadata
+from conftest import stand_in
+
+NOW = int(datetime.now().timestamp())
+SINCE = datetime.fromtimestamp(NOW - 3600)
+
+
+def movie(rating_key: int, age: int) -> dict:
+    return {"type": "movie", "ratingKey": str(rating_key), "title": f"Movie {rating_key}",
+            "year": 2020, "addedAt": NOW - age}
+
+
+def episode(rating_key: int, number: int, age: int) -> dict:
+    return {"type": "episode", "ratingKey": str(rating_key), "title": f"Episode {number}",
+            "grandparentTitle": "Show", "parentIndex": 1, "index": number, "addedAt": NOW - age}
+
+
+class FakePlex:
+    """Stand-in for the Plex library API: section items newest first, paged like Plex pages them"""
+
+    def __init__(self, sections: dict):
+        self.sections = sections
+        self.requests = []
+
+    async def handle_sections(self, request: web.Request) -> web.Response:
+        return web.json_response({"MediaContainer": {"Directory": [
+            {"key": key, "type": section_type, "title": key}
+            for key, (section_type, _) in self.sections.items()
+        ]}})
+
+    async def handle_all(self, request: web.Request) -> web.Response:
+        key = request.match_info["key"]
+        start = int(request.query["X-Plex-Container-Start"])
+        size = int(request.query["X-Plex-Container-Size"])
+        self.requests.append((key, start, size, request.query.get("addedAt>>")))
+        items = sorted(self.sections[key][1], key=lambda item: item["addedAt"], reverse=True)
+        return web.json_response({"MediaContainer": {
+            "totalSize": len(items),
+            "Metadata": items[start:start + size]
+        }})
+
+    def routes(self) -> dict:
+        return {
+            "GET /library/sections": self.handle_sections,
+            "GET /library/sections/{key}/all": self.handle_all
+        }
+
+
+@pytest.fixture(autouse=True)
+def plex_settings(monkeypatch):
+    monkeypatch.setattr(settings, "backfill_page_size", 2)
+    monkeypatch.setattr(settings, "public_base_url", None)
+    monkeypatch.setattr(settings, "plex_token", None)
+
+
+def run_backfill(aggregator, plex: FakePlex, monkeypatch):
+    written = []
+
+    async def on_batch_written(count: int):
+        written.append(count)
+
+    async def scenario():
+        async with stand_in(plex.routes()) as url:
+            monkeypatch.setattr(settings, "plex_url", url)
+            backfill = PlexBackfill(aggregator, media_item_from_metadata, on_batch_written)
+            backfill.start("test", since=SINCE)
+            await backfill._task
+            return backfill.last_run
+
+    return asyncio.run(scenario()), written
+
+
+def test_pages_through_sections_until_the_cutoff(make_aggregator, monkeypatch):
+    aggregator = make_aggregator()
+    plex = FakePlex({
+        # The fake ignores addedAt>>, so the two old movies test the client-side cutoff
+        "1": ("movie", [movie(i, age=60 * i) for i in range(1, 6)] + [movie(90, 7200), movie(91, 9000)]),
+        "2": ("show", [episode(100 + n, n, age=60 * n) for n in range(1, 4)]),
+        "3": ("photo", [])
+    })
+
+    run, written = run_backfill(aggregator, plex, monkeypatch)
+
+    assert run.status == "done"
+    assert run.sections == 2
+    assert run.inserted == 8
+    assert aggregator.get_unprocessed_counts() == {"movies": 5, "episodes": 3, "tracks": 0}
+    # Movies: pages of 2 until the page holding the first item older than the cutoff
+    assert [(key, start) for key, start, _, _ in plex.requests] == [
+        ("1", 0), ("1", 2), ("1", 4), ("2", 0), ("2", 2)
+    ]
+    assert {since for _, _, _, since in plex.requests} == {str(int(SINCE.timestamp()))}
+    assert sum(written) == 8
+
+
+def test_skips_items_already_stored(make_aggregator, monkeypatch):
+    aggregator = make_aggregator()
+    stored = [media_item_from_metadata(movie(1, age=60)), media_item_from_metadata(movie(2, age=120))]
+    aggregator.add_media_items(stored)
+    # Both were sent in a digest; a third one is still pending
+    batch = aggregator.claim_digest()
+    aggregator.mark_digest_processed(batch)
+    aggregator.add_media_items([media_item_from_metadata(movie(3, age=180))])
+
+    plex = FakePlex({"1": ("movie", [movie(i, age=60 * i) for i in range(1, 6)])})
+    run, written = run_backfill(aggregator, plex, monkeypatch)
+
+    assert run.status == "done"
+    assert (run.fetched, run.inserted, run.skipped) == (5, 2, 3)
+    assert aggregator.get_unprocessed_count() == 3
+    titles = {movie.title for movie in aggregator.aggregate_digest().movies}
+    assert titles == {"Movie 3", "Movie 4", "Movie 5"}
+    assert sum(written) == 2
+
+
+def test_plex_error_ends_the_run(make_aggregator, monkeypatch):
+    aggregator = make_aggregator()
+
+    async def unavailable(request: web.Request) -> web.Response:
+        return web.Response(status=503)
+
+    plex = FakePlex({})
+    plex.handle_sections = unavailable
+    run, written = run_backfill(aggregator, plex, monkeypatch)
+
+    assert run.status == "error"
+    assert "503" in run.error
+    assert written == []
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.config import settings
+from app.coordination import Coordinator
+from app.models import MediaItem, MediaType
+
+LEASE = 0.4
+
+
+@pytest.fixture(autouse=True)
+def short_leases(monkeypatch):
+    monkeypatch.setattr(settings, "leader_lease_seconds", LEASE)
+    monkeypatch.setattr(settings, "leader_renew_seconds", 0.1)
+    monkeypatch.setattr(settings, "sync_poll_seconds", 0.05)
+
+
+def episodes(count: int, start: int = 1):
+    added_at = datetime.now() - timedelta(hours=1)
+    return [
+        MediaItem(media_type=MediaType.TV_SHOW, title=f"Episode {i}", show_title="Show",
+                  season_number=1, episode_number=i, added_at=added_at + timedelta(seconds=i),
+                  rating_key=f"e{i}")
+        for i in range(start, start + count)
+    ]
+
+
+async def kill(coordinator: Coordinator):
+    """Stop renewing without handing anything over, like a worker that crashed"""
+    coordinator._task.cancel()
+    try:
+        await coordinator._task
+    except asyncio.CancelledError:
+        pass
+    coordinator._task = None
+
+
+async def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+def test_one_leader_and_failover(make_aggregator):
+    first, second = Coordinator(make_aggregator()), Coordinator(make_aggregator())
+
+    async def scenario():
+        await first.start()
+        await second.start()
+        await asyncio.sleep(LEASE)
+        # The first worker keeps renewing, so the second never takes over
+        assert (first.is_leader, second.is_leader) == (True, False)
+        assert second.leader == first.owner
+
+        await kill(first)
+        started = time.monotonic()
+        await wait_for(lambda: second.is_leader)
+        elapsed = time.monotonic() - started
+        await second.stop()
+        return elapsed
+
+    elapsed = asyncio.run(scenario())
+
+    assert elapsed < LEASE + 0.5
+    assert second.elections == 1
+
+
+def test_stop_hands_over_immediately(make_aggregator):
+    first, second = Coordinator(make_aggregator()), Coordinator(make_aggregator())
+
+    async def scenario():
+        await first.start()
+        await second.start()
+        await first.stop()
+        started = time.monotonic()
+        await wait_for(lambda: second.is_leader)
+        elapsed = time.monotonic() - started
+        await second.stop()
+        return elapsed
+
+    # The lease is released rather than left to expire; the next renewal takes it
+    assert asyncio.run(scenario()) < LEASE
+
+
+def test_claims_of_dead_worker_are_released(make_aggregator):
+    dead, alive = make_aggregator(), make_aggregator()
+    dead_coordinator, alive_coordinator = Coordinator(dead), Coordinator(alive)
+    dead.add_media_items(episodes(4))
+
+    async def scenario():
+        await dead_coordinator.start()
+        await alive_coordinator.start()
+        batch = dead.claim_digest()
+        assert batch is not None
+
+        # Still renewing its lease: its claim is left alone
+        assert alive.release_stale_claims() == 0
+        await kill(dead_coordinator)
+        await asyncio.sleep(LEASE + 0.1)
+        released = alive.release_stale_claims()
+        await alive_coordinator.stop()
+        return batch, released
+
+    batch, released = asyncio.run(scenario())
+
+    assert released == 4
+    assert alive.state.total_items == 4
+    assert alive.get_unprocessed_count() == 4
+    status, = alive.db.reader().execute("SELECT status FROM digests WHERE id = ?", (batch.digest_id,)).fetchone()
+    assert status == "failed"
+    # The dead worker's expired lease is cleaned up with its claims
+    names = [row[0] for row in alive.db.reader().execute("SELECT name FROM leases")]
+    assert not any(dead.worker_id in name for name in names)
+
+
+def test_state_follows_other_worker(make_aggregator):
+    writer, follower = make_aggregator(), make_aggregator()
+
+    writer.add_media_items(episodes(3))
+    assert follower.sync()
+    assert follower.state.total_items == 3
+    assert follower.aggregate_digest().tv_shows[0].episodes == [1, 2, 3]
+    assert not follower.sync()
+
+    batch = writer.claim_digest()
+    writer.add_media_items(episodes(2, start=4))
+    assert follower.sync()
+    # Claimed items are no longer in the backlog, but still count as unprocessed
+    assert follower.state.total_items == 2
+    assert follower.get_unprocessed_count() == 5
+
+    writer.mark_digest_processed(batch)
+    assert follower.sync()
+    assert follower.get_unprocessed_count() == 2
+    assert follower.aggregate_digest().tv_shows[0].episodes == [4, 5]
+
+    # Writes by the follower reach the writer the same way
+    follower.add_media_items(episodes(1, start=6))
+    assert writer.sync()
+    assert writer.get_unprocessed_count() == 3
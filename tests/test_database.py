@@ -0,0 +1,35 @@
+import sqlite3
+
+from app import database
+from app.database import Database
+
+
+def test_only_the_writer_sets_file_pragmas(db_path, monkeypatch):
+    statements = {}
+    connect = sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        log = statements.setdefault(conn, [])
+        conn.set_trace_callback(log.append)
+        return conn
+
+    monkeypatch.setattr(database.sqlite3, "connect", traced_connect)
+    db = Database(db_path)
+
+    # A reader on a new file first, as migrate() does
+    reader = db.reader()
+    assert reader.execute("PRAGMA user_version").fetchone()[0] == 0
+    with db.transaction() as conn:
+        conn.execute("CREATE TABLE t (x)")
+    writer = db._writer
+
+    assert "PRAGMA auto_vacuum = INCREMENTAL" in statements[writer]
+    assert not [sql for sql in statements[reader] if "auto_vacuum" in sql or "journal_mode" in sql]
+    # The new file still got both settings
+    check = connect(db_path)
+    assert check.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    assert check.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    check.close()
+    assert db.enable_incremental_vacuum() is False
+    db.close()
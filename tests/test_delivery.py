@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from app.config import settings
+from app.delivery import WebhookDelivery
+from conftest import stand_in
+
+
+class Discord:
+    """Stand-in webhook answering from a script of responses, recording when each request arrived"""
+
+    def __init__(self, *script: web.Response):
+        self.script = list(script)
+        self.arrivals = []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.arrivals.append(time.monotonic())
+        if len(self.script) > 1:
+            return self.script.pop(0)
+        # The last response repeats; build a fresh copy, a prepared response can't be sent twice
+        last = self.script[0]
+        return web.Response(status=last.status, body=last.body, headers=last.headers)
+
+
+def ok(**headers) -> web.Response:
+    return web.json_response({"id": "1"}, headers=headers)
+
+
+def rate_limited(retry_after: float) -> web.Response:
+    return web.json_response({"message": "You are being rate limited.", "retry_after": retry_after}, status=429)
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "discord_retry_base_delay", 0.05)
+    monkeypatch.setattr(settings, "discord_retry_max_delay", 0.1)
+    monkeypatch.setattr(settings, "discord_retry_deadline", 5.0)
+    monkeypatch.setattr(settings, "discord_max_attempts", 5)
+    monkeypatch.setattr(settings, "discord_rate_limit_requests", 50)
+
+
+def deliver(discord: Discord, posts: int = 1) -> list:
+    async def scenario():
+        async with stand_in({"POST /webhook": discord.handle}) as url:
+            async with aiohttp.ClientSession() as session:
+                async def get_session():
+                    return session
+
+                delivery = WebhookDelivery(get_session)
+                return [await delivery.post(f"{url}/webhook", {"content": "hi"}) for _ in range(posts)]
+
+    return asyncio.run(scenario())
+
+
+def test_429_waits_for_retry_after():
+    discord = Discord(rate_limited(0.3), ok())
+
+    result, = deliver(discord)
+
+    assert result.success and result.attempts == 2
+    assert result.response == {"id": "1"}
+    assert discord.arrivals[1] - discord.arrivals[0] >= 0.3
+
+
+def test_exhausted_bucket_holds_the_next_request():
+    discord = Discord(ok(**{"X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "0.3"}), ok())
+
+    first, second = deliver(discord, posts=2)
+
+    assert first.success and second.success
+    # The wait happens before sending, so Discord never answers 429
+    assert (first.attempts, second.attempts) == (1, 1)
+    assert discord.arrivals[1] - discord.arrivals[0] >= 0.3
+
+
+def test_5xx_is_retried_with_backoff():
+    discord = Discord(web.Response(status=500), web.Response(status=502, text="Bad Gateway"), ok())
+
+    result, = deliver(discord)
+
+    assert result.success
+    assert result.attempts == 3
+    assert result.status == 200 and result.error is None
+
+
+def test_gives_up_when_the_retry_would_pass_the_deadline(monkeypatch):
+    monkeypatch.setattr(settings, "discord_retry_deadline", 0.5)
+    discord = Discord(rate_limited(0.3))
+
+    started = time.monotonic()
+    result, = deliver(discord)
+
+    assert not result.success
+    assert result.status == 429
+    assert "Rate limited" in result.error
+    # Two attempts fit in the deadline; the third would not, so it is never slept for
+    assert result.attempts == 2
+    assert time.monotonic() - started < 0.5
+
+
+def test_client_error_is_not_retried():
+    discord = Discord(web.Response(status=400, text="Invalid Form Body"))
+
+    result, = deliver(discord)
+
+    assert not result.success
+    assert result.attempts == 1
+    assert result.error == "400 - Invalid Form Body"
+
+
+def test_unreadable_success_body_counts_as_delivered():
+    discord = Discord(web.Response(status=200, text="<html>ok</html>", content_type="text/html"))
+
+    result, = deliver(discord)
+
+    assert result.success
+    assert result.response is None
+    assert len(discord.arrivals) == 1
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import sqlite3
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+from aiohttp import web
+
+from app import digest_engine as engine_module
+from app.config import settings
+from app.digest_engine import DigestEngine
+from app.discord_sender import DiscordSender
+from app.models import MediaItem, MediaType
+from conftest import stand_in
+
+
+class Discord:
+    """Stand-in for Discord webhooks: one per destination name, answering from a script of statuses"""
+
+    def __init__(self):
+        self.scripts = defaultdict(list)
+        self.posts = defaultdict(int)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        await request.read()
+        status = self.scripts[name].pop(0) if self.scripts[name] else 200
+        if status != 200:
+            return web.Response(status=status, text="unavailable")
+        self.posts[name] += 1
+        return web.json_response({"id": f"{name}-{self.posts[name]}"})
+
+
+@pytest.fixture
+def digest_setup(make_aggregator, monkeypatch):
+    """A fresh aggregator and engine; Discord destinations are configured per test"""
+    aggregator = make_aggregator()
+    monkeypatch.setattr(engine_module, "aggregator", aggregator)
+    monkeypatch.setattr(settings, "discord_webhook_url", None)
+    monkeypatch.setattr(settings, "discord_max_attempts", 1)
+    return aggregator, DigestEngine()
+
+
+def configure(monkeypatch, base_url: str, names) -> DiscordSender:
+    monkeypatch.setattr(settings, "discord_destinations", [
+        {"name": name, "webhook_url": f"{base_url}/hooks/{name}"} for name in names
+    ])
+    sender = DiscordSender()
+    monkeypatch.setattr(engine_module, "discord_sender", sender)
+    return sender
+
+
+def add_movies(aggregator, count: int, start: int = 0):
+    added_at = datetime.now() - timedelta(hours=1)
+    aggregator.add_media_items([
+        MediaItem(media_type=MediaType.MOVIE, title=f"Movie {i}", year=2000 + i % 20,
+                  added_at=added_at + timedelta(seconds=i), rating_key=f"m{i}")
+        for i in range(start, start + count)
+    ])
+
+
+def digest_rows(aggregator):
+    return aggregator.db.reader().execute("SELECT id, status, message_ids FROM digests ORDER BY id").fetchall()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_failed_destination_is_retried_without_resending(digest_setup, monkeypatch):
+    aggregator, engine = digest_setup
+    discord = Discord()
+    discord.scripts["b"] = [500]
+    add_movies(aggregator, 5)
+
+    async def scenario():
+        async with stand_in({"POST /hooks/{name}": discord.handle}) as url:
+            sender = configure(monkeypatch, url, ["a", "b"])
+            first = await engine.run()
+            second = await engine.run()
+            await sender.close()
+        return first, second
+
+    first, second = run(scenario())
+
+    assert first.status == "partial"
+    assert first.destinations == {"a": "sent", "b": "failed"}
+    assert second.retried == {first.digest_id: "sent"}
+    assert second.status == "sent"
+    assert dict(discord.posts) == {"a": 1, "b": 1}
+    assert aggregator.get_unprocessed_count() == 0
+    (digest_id, status, message_ids), = digest_rows(aggregator)
+    assert status == "sent"
+    assert json.loads(message_ids) == {"a": ["a-1"], "b": ["b-1"]}
+
+
+def test_all_destinations_failed_releases_items(digest_setup, monkeypatch):
+    aggregator, engine = digest_setup
+    discord = Discord()
+    discord.scripts["a"] = [500]
+    discord.scripts["b"] = [502]
+    add_movies(aggregator, 4)
+
+    async def scenario():
+        async with stand_in({"POST /hooks/{name}": discord.handle}) as url:
+            sender = configure(monkeypatch, url, ["a", "b"])
+            first = await engine.run()
+            second = await engine.run()
+            await sender.close()
+        return first, second
+
+    first, second = run(scenario())
+
+    assert first.status == "failed"
+    # Released to the backlog and sent whole by the next run, as a new digest
+    assert second.status == "sent"
+    assert second.retried == {}
+    assert second.item_count == 4
+    assert dict(discord.posts) == {"a": 1, "b": 1}
+    assert [row[1] for row in digest_rows(aggregator)] == ["failed", "sent"]
+    assert aggregator.get_unprocessed_count() == 0
+
+
+def test_no_destinations_keeps_items(digest_setup, monkeypatch):
+    aggregator, engine = digest_setup
+    monkeypatch.setattr(settings, "discord_destinations", [])
+    monkeypatch.setattr(engine_module, "discord_sender", DiscordSender())
+    add_movies(aggregator, 3)
+
+    result = run(engine.run())
+
+    assert result.status == "failed"
+    assert aggregator.get_unprocessed_count() == 3
+    assert [row[1] for row in digest_rows(aggregator)] == ["failed"]
+
+
+def test_removed_destination_completes_partial_digest(digest_setup, monkeypatch):
+    aggregator, engine = digest_setup
+    discord = Discord()
+    discord.scripts["b"] = [500]
+    add_movies(aggregator, 2)
+
+    async def scenario():
+        async with stand_in({"POST /hooks/{name}": discord.handle}) as url:
+            sender = configure(monkeypatch, url, ["a", "b"])
+            first = await engine.run()
+            await sender.close()
+            # b is removed from the configuration before the retry
+            sender = configure(monkeypatch, url, ["a"])
+            second = await engine.run()
+            await sender.close()
+        return first, second
+
+    first, second = run(scenario())
+
+    assert first.status == "partial"
+    assert second.retried == {first.digest_id: "sent"}
+    assert dict(discord.posts) == {"a": 1}
+    assert aggregator.get_unprocessed_count() == 0
+    assert [row[1] for row in digest_rows(aggregator)] == ["sent"]
+
+
+def test_failed_claim_hands_back_partial_digests(digest_setup, monkeypatch):
+    aggregator, engine = digest_setup
+    discord = Discord()
+    discord.scripts["b"] = [500]
+    add_movies(aggregator, 3)
+
+    def locked():
+        raise sqlite3.OperationalError("database is locked")
+
+    async def scenario():
+        async with stand_in({"POST /hooks/{name}": discord.handle}) as url:
+            sender = configure(monkeypatch, url, ["a", "b"])
+            first = await engine.run()
+            add_movies(aggregator, 2, start=10)
+            with monkeypatch.context() as patch:
+                patch.setattr(aggregator, "claim_digest", locked)
+                failed = await engine.run()
+            status_after_failure = digest_rows(aggregator)[0][1]
+            retrying_after_failure = set(aggregator._retrying)
+            third = await engine.run()
+            await sender.close()
+        return first, failed, status_after_failure, retrying_after_failure, third
+
+    first, failed, status_after_failure, retrying_after_failure, third = run(scenario())
+
+    assert first.status == "partial"
+    assert failed.status == "error"
+    assert status_after_failure == "partial"
+    assert retrying_after_failure == set()
+    assert third.retried == {first.digest_id: "sent"}
+    assert third.status == "sent"
+    assert third.item_count == 2
+    assert dict(discord.posts) == {"a": 2, "b": 2}
+    assert aggregator.get_unprocessed_count() == 0
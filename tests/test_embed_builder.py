@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.config import settings
+from app.discord_sender import DiscordSender
+from app.embed_builder import (
+    DESCRIPTION_LIMIT, EMBEDS_PER_MESSAGE, MAX_LINE_LENGTH, MESSAGE_EMBED_LIMIT, EmbedPaginator
+)
+from app.models import DigestData, MovieAggregation, MusicAggregation, TVShowAggregation
+
+HEADINGS = ("🎬 **Movies**", "📺 **TV Shows**", "🎵 **Music**")
+
+
+def message_chars(embeds: list) -> int:
+    """Characters Discord counts towards a message's 6000 limit"""
+    return sum(
+        len(embed.get("title", "")) + len(embed["description"]) + len(embed.get("footer", {}).get("text", ""))
+        for embed in embeds
+    )
+
+
+def embed_lines(messages: list) -> list:
+    """Lines of every embed in page order, one list per embed"""
+    return [embed["description"].splitlines(keepends=True) for embeds in messages for embed in embeds]
+
+
+@pytest.fixture
+def large_digest() -> DigestData:
+    now = datetime.now()
+    movies = [MovieAggregation(title=f"Movie {i} " + "x" * (i % 97), year=1950 + i % 70) for i in range(3000)]
+    # One title longer than a whole embed is allowed to be
+    movies[1234] = MovieAggregation(title="Long " + "y" * 5000, year=2000)
+    return DigestData(
+        movies=movies,
+        tv_shows=[
+            TVShowAggregation(show_title=f"Show {i}", season_number=1 + i % 9,
+                              episodes=list(range(1, 2 + i % 20)), episode_count=1 + i % 20)
+            for i in range(1500)
+        ],
+        music=[MusicAggregation(artist=f"Artist {i}", albums=[f"Album {i}-{n}" for n in range(1 + i % 4)])
+               for i in range(800)],
+        total_items=8000,
+        digest_start=now - timedelta(days=1),
+        digest_end=now
+    )
+
+
+@pytest.fixture
+def messages(large_digest, monkeypatch) -> list:
+    monkeypatch.setattr(settings, "plex_url", "http://plex.local:32400")
+    return DiscordSender()._build_messages(large_digest)
+
+
+def test_large_digest_stays_within_discord_limits(messages):
+    assert len(messages) > 1
+    for embeds in messages:
+        assert 1 <= len(embeds) <= EMBEDS_PER_MESSAGE
+        assert message_chars(embeds) <= MESSAGE_EMBED_LIMIT
+        for embed in embeds:
+            assert len(embed["description"]) <= DESCRIPTION_LIMIT
+
+
+def test_pages_are_numbered_in_order(messages):
+    total = len(messages)
+
+    titles = [embeds[0]["title"] for embeds in messages]
+
+    assert titles == [f"📬 New Media Available ({n}/{total})" for n in range(1, total + 1)]
+    # Only the very last embed carries the footer and timestamp
+    footers = [embed for embeds in messages for embed in embeds if "footer" in embed]
+    assert footers == [messages[-1][-1]]
+    assert "timestamp" in messages[-1][-1]
+
+
+def test_items_appear_once_in_order_and_whole(messages, large_digest):
+    expected = (
+        [f"  • {movie.title} ({movie.year})\n" for movie in large_digest.movies]
+        + [f"  • {show.show_title} - " for show in large_digest.tv_shows]
+        + [f"  • {artist.artist} - {', '.join(artist.albums)}\n" for artist in large_digest.music]
+    )
+
+    items = [line for lines in embed_lines(messages) for line in lines if line.startswith("  • ")]
+
+    assert len(items) == len(expected)
+    for line, start in zip(items, expected):
+        if start.startswith("  • Long "):
+            assert len(line) == MAX_LINE_LENGTH and line.endswith("…\n")
+        else:
+            assert line.startswith(start)
+
+
+def test_splits_only_at_section_and_line_boundaries(messages):
+    for lines in embed_lines(messages):
+        # Every embed holds whole lines
+        assert all(line.endswith("\n") for line in lines)
+        # An embed never starts mid-section without repeating the section heading...
+        assert not lines[0].startswith("  • ")
+        # ...and never ends on a heading separated from its first item
+        assert not lines[-1].startswith(HEADINGS)
+
+    continued = [lines[0] for lines in embed_lines(messages) if "(continued)" in lines[0]]
+    assert continued
+    assert all(line.startswith(HEADINGS) for line in continued)
+
+
+def test_block_is_kept_in_one_embed():
+    paginator = EmbedPaginator(title="Digest", color=0)
+    paginator.add_block(["a" * 1000 + "\n"] * 3)
+    # Its first line would still fit the first embed, the whole block does not
+    paginator.add_block(["b" * 600 + "\n", "c" * 600 + "\n"])
+
+    embeds, = paginator.finish()
+
+    assert [embed["description"] for embed in embeds] == [("a" * 1000 + "\n") * 3, "b" * 600 + "\n" + "c" * 600 + "\n"]
+    assert message_chars(embeds) <= MESSAGE_EMBED_LIMIT
@@ -0,0 +1,151 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from app.aggregator import ARTIST_ALBUMS_SQL, SHOW_SEASONS_SQL, MediaAggregator
+from app.database import Database
+from app.migrations import SCHEMA_VERSION, migrate
+from app.models import MediaType
+
+# Schema of the last unversioned release (d14743d): ISO text added_at, no user_version
+BASELINE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS media_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        media_type TEXT NOT NULL,
+        title TEXT NOT NULL,
+        year INTEGER,
+        show_title TEXT,
+        season_number INTEGER,
+        episode_number INTEGER,
+        artist TEXT,
+        album TEXT,
+        track_title TEXT,
+        added_at TIMESTAMP NOT NULL,
+        thumb_url TEXT,
+        rating_key TEXT,
+        processed BOOLEAN DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_processed ON media_items(processed);
+    CREATE INDEX IF NOT EXISTS idx_media_type ON media_items(media_type);
+"""
+
+ADDED = [datetime(2024, 3, 1, 20, 15, 0), datetime(2024, 3, 2, 8, 0, 30, 250000), datetime(2024, 3, 3, 23, 59, 59)]
+
+# (media_type, title, show_title, season, episode, artist, album, added_at, rating_key, processed)
+ROWS = [
+    ("movie", "Movie", None, None, None, None, None, ADDED[0], "1", 0),
+    # The same episode stored twice while pending: only the first survives
+    ("episode", "Pilot", "Show", 1, 1, None, None, ADDED[1], "2", 0),
+    ("episode", "Pilot", "Show", 1, 1, None, None, ADDED[2], "2", 0),
+    # Sent duplicates are history and are kept
+    ("movie", "Old", None, None, None, None, None, ADDED[0], "3", 1),
+    ("movie", "Old", None, None, None, None, None, ADDED[1], "3", 1),
+    ("track", "Song", None, None, None, "Artist", "Album", ADDED[2], "4", 0),
+    # Without a ratingKey there is nothing to dedupe on
+    ("movie", "Manual", None, None, None, None, None, ADDED[1], None, 0),
+    ("movie", "Manual", None, None, None, None, None, ADDED[2], None, 0),
+]
+
+
+@pytest.fixture
+def baseline(db_path) -> str:
+    """A database file as the unversioned release left it"""
+    conn = sqlite3.connect(db_path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany("""
+        INSERT INTO media_items (
+            media_type, title, show_title, season_number, episode_number,
+            artist, album, added_at, rating_key, processed
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [row[:7] + (row[7].isoformat(),) + row[8:] for row in ROWS])
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+@pytest.fixture
+def migrated(baseline):
+    db = Database(baseline)
+    assert migrate(db) == SCHEMA_VERSION
+    yield db
+    db.close()
+
+
+def indexes(conn: sqlite3.Connection) -> dict:
+    return {
+        name: [column for _, _, column in conn.execute(f"PRAGMA index_info({name})")]
+        for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'media_items'")
+    }
+
+
+def plan(conn: sqlite3.Connection, sql: str, params: tuple) -> str:
+    return " | ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+
+def test_added_at_converted_to_epoch(migrated):
+    conn = migrated.reader()
+
+    rows = conn.execute("SELECT typeof(added_at), added_at FROM media_items ORDER BY id").fetchall()
+
+    assert {kind for kind, _ in rows} == {"integer"}
+    survivors = [row for i, row in enumerate(ROWS) if i != 2]
+    assert [added_at for _, added_at in rows] == [int(row[7].timestamp()) for row in survivors]
+
+
+def test_duplicate_pending_rows_removed(migrated):
+    conn = migrated.reader()
+
+    rows = conn.execute("SELECT id, rating_key, processed FROM media_items ORDER BY id").fetchall()
+
+    assert rows == [(1, "1", 0), (2, "2", 0), (4, "3", 1), (5, "3", 1), (6, "4", 0), (7, None, 0), (8, None, 0)]
+    with pytest.raises(sqlite3.IntegrityError):
+        with migrated.transaction() as write:
+            write.execute("""
+                INSERT INTO media_items (media_type, title, added_at, rating_key)
+                VALUES ('episode', 'Pilot again', 0, '2')
+            """)
+
+
+def test_indexes_rebuilt_for_the_sql_engine(migrated):
+    conn = migrated.reader()
+
+    assert indexes(conn) == {
+        "idx_media_type": ["media_type"],
+        "idx_rating_key": ["rating_key"],
+        "idx_unprocessed_rating_key": ["rating_key", "media_type"],
+        "idx_processed_added_at": ["processed", "added_at"],
+        "idx_pending_shows": ["processed", "media_type", "digest_id", "show_title", "season_number", "episode_number"],
+        "idx_pending_music": ["processed", "media_type", "digest_id", "artist", "album"],
+        "idx_digest_id": ["digest_id"],
+    }
+    assert "COVERING INDEX idx_pending_shows" in plan(conn, SHOW_SEASONS_SQL, (MediaType.TV_SHOW.value, None))
+    assert "COVERING INDEX idx_pending_music" in plan(conn, ARTIST_ALBUMS_SQL, (MediaType.MUSIC.value, None))
+    pending = plan(conn, "SELECT * FROM media_items WHERE processed = 0 ORDER BY added_at", ())
+    assert "INDEX idx_processed_added_at" in pending
+    assert "TEMP B-TREE" not in pending
+
+
+def test_migrated_database_serves_the_app(migrated):
+    aggregator = MediaAggregator(migrated)
+
+    assert aggregator.get_unprocessed_counts() == {"movies": 3, "episodes": 1, "tracks": 1}
+    digest = aggregator.aggregate_digest()
+    assert [movie.title for movie in digest.movies] == ["Movie", "Manual", "Manual"]
+    assert digest.tv_shows[0].episodes == [1]
+    # Running again (a restart, or a second worker) changes nothing
+    assert migrate(migrated) == SCHEMA_VERSION
+
+
+def test_newer_schema_is_refused(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+    conn.close()
+    db = Database(db_path)
+
+    with pytest.raises(RuntimeError, match="newer than this release"):
+        migrate(db)
+
+    assert db.reader().execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION + 1
+    db.close()
@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+from starlette.requests import Request
+
+from app.multipart_stream import read_webhook_body
+
+BOUNDARY = "digestarr-test"
+
+
+def _part(name: str, value: bytes, filename: str = None, content_type: str = None) -> bytes:
+    disposition = f'form-data; name="{name}"'
+    if filename:
+        disposition += f'; filename="{filename}"'
+    head = f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n"
+    if content_type:
+        head += f"Content-Type: {content_type}\r\n"
+    return head.encode() + b"\r\n" + value + b"\r\n"
+
+
+def _body(*parts: bytes) -> bytes:
+    return b"".join(parts) + f"--{BOUNDARY}--\r\n".encode()
+
+
+def _read(body: bytes, chunk_size: int = 7):
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    async def receive():
+        if chunks:
+            return {"type": "http.request", "body": chunks.pop(0), "more_body": bool(chunks)}
+        return {"type": "http.disconnect"}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/webhook",
+        "headers": [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    }
+    return asyncio.run(read_webhook_body(Request(scope, receive)))
+
+
+PAYLOAD = json.dumps({"event": "library.new", "Metadata": {"ratingKey": "1"}}).encode()
+
+
+def test_payload_only():
+    body = _read(_body(_part("payload", PAYLOAD)))
+    assert body.payload == PAYLOAD
+
+
+def test_leading_field_before_payload():
+    body = _read(_body(_part("extra", b"not the payload" * 10), _part("payload", PAYLOAD)))
+    assert body.payload == PAYLOAD
+    assert body.skipped_bytes == len(b"not the payload" * 10)
+
+
+def test_repeated_payload_field_is_not_concatenated():
+    other = json.dumps({"event": "media.play"}).encode()
+    body = _read(_body(_part("payload", other), _part("payload", PAYLOAD)))
+    assert body.payload == PAYLOAD
+
+
+def test_image_without_sink_is_skipped():
+    image = b"\xff\xd8\xff\xe0" + b"x" * 100
+    body = _read(_body(_part("payload", PAYLOAD), _part("thumb", image, "thumb.jpg", "image/jpeg")))
+    assert body.payload == PAYLOAD
+    assert body.image_path is None
+    assert body.skipped_bytes == len(image)
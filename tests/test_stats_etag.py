@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from app.aggregator import aggregator
+from app.coordination import coordinator
+from app.main import app
+from app.models import MediaItem, MediaType
+
+
+def test_stats_revalidate_until_data_changes():
+    client = TestClient(app)
+
+    first = client.get("/api/stats")
+    etag = first.headers["ETag"]
+
+    # Lease renewals and syncs alone don't change the ETag
+    coordinator.syncs += 1
+    coordinator._lease_expires += 5
+    unchanged = client.get("/api/stats", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+
+    aggregator.add_media_items([MediaItem(
+        media_type=MediaType.MOVIE, title="New", added_at=datetime.now(), rating_key="stats-etag"
+    )])
+    changed = client.get("/api/stats", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["unprocessed_items"] == first.json()["unprocessed_items"] + 1
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import stat
+
+import httpx
+import pytest
+from aiohttp import web
+from fastapi import FastAPI
+
+from app import thumbnails
+from app.config import settings
+from app.thumbnails import ThumbnailCache, router
+from conftest import stand_in
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 1020
+
+
+class FakePlex:
+    """Stand-in for Plex's image endpoint, counting fetches per key"""
+
+    def __init__(self, size: int = len(JPEG), delay: float = 0.0):
+        self.body = JPEG[:4] + b"\x00" * (size - 4)
+        self.delay = delay
+        self.fetches = {}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        key = "-".join(request.match_info[part] for part in ("id", "kind", "version"))
+        self.fetches[key] = self.fetches.get(key, 0) + 1
+        await asyncio.sleep(self.delay)
+        if request.match_info["id"] == "404":
+            return web.Response(status=404)
+        return web.Response(body=self.body, content_type="image/jpeg")
+
+    def routes(self) -> dict:
+        return {"GET /library/metadata/{id}/{kind}/{version}": self.handle}
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "thumb_cache_dir", str(tmp_path / "thumbs"))
+    monkeypatch.setattr(settings, "thumb_prefetch", False)
+    monkeypatch.setattr(settings, "thumb_max_width", 0)
+    monkeypatch.setattr(settings, "public_base_url", "https://digestarr.example")
+    cache = ThumbnailCache()
+    monkeypatch.setattr(thumbnails, "thumbnail_cache", cache)
+    return cache
+
+
+def serve(cache: ThumbnailCache, plex: FakePlex, scenario, monkeypatch):
+    async def main():
+        async with stand_in(plex.routes()) as url:
+            monkeypatch.setattr(settings, "plex_url", url)
+            await cache.start()
+            try:
+                return await scenario()
+            finally:
+                await cache.close()
+
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_share_one_fetch(cache, monkeypatch):
+    plex = FakePlex(delay=0.1)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get("1-thumb-100") for _ in range(10)))
+
+    paths = serve(cache, plex, scenario, monkeypatch)
+
+    assert plex.fetches == {"1-thumb-100": 1}
+    assert len(set(paths)) == 1 and os.path.exists(paths[0])
+    assert cache._inflight == {}
+
+
+def test_cancelled_caller_does_not_strand_the_others(cache, monkeypatch):
+    plex = FakePlex(delay=0.1)
+
+    async def scenario():
+        first = asyncio.create_task(cache.get("1-thumb-100"))
+        await asyncio.sleep(0.02)
+        second = asyncio.create_task(cache.get("1-thumb-100"))
+        await asyncio.sleep(0.02)
+        first.cancel()
+        return await asyncio.wait_for(second, 2)
+
+    path = serve(cache, plex, scenario, monkeypatch)
+
+    assert os.path.exists(path)
+    assert plex.fetches == {"1-thumb-100": 1}
+    assert cache._inflight == {}
+
+
+def test_least_recently_used_is_evicted(cache, monkeypatch):
+    monkeypatch.setattr(settings, "thumb_cache_max_mb", 1)
+    plex = FakePlex(size=400 * 1024)
+
+    async def scenario():
+        await cache.get("1-thumb-1")
+        await cache.get("2-thumb-1")
+        # Touch the first one, so the second is the least recently used
+        assert await cache.get("1-thumb-1")
+        await cache.get("3-thumb-1")
+
+    serve(cache, plex, scenario, monkeypatch)
+
+    assert list(cache._entries) == ["1-thumb-1", "3-thumb-1"]
+    assert cache.evictions == 1
+    assert sorted(os.listdir(cache.cache_dir)) == ["1-thumb-1.jpg", "3-thumb-1.jpg"]
+    assert plex.fetches == {"1-thumb-1": 1, "2-thumb-1": 1, "3-thumb-1": 1}
+
+
+def test_route_requires_signature_and_revalidates(cache, monkeypatch):
+    plex = FakePlex()
+    app = FastAPI()
+    app.include_router(router)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            url = cache.public_url("1-thumb-100").replace("https://digestarr.example", "")
+            unsigned = await client.get("/thumbs/1-thumb-100")
+            forged = await client.get("/thumbs/1-thumb-100?sig=" + "0" * 32)
+            other_key = await client.get(url.replace("1-thumb-100", "2-thumb-100"))
+            first = await client.get(url)
+            again = await client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+            missing = await client.get(cache.public_url("404-thumb-1").replace("https://digestarr.example", ""))
+        return unsigned, forged, other_key, first, again, missing
+
+    unsigned, forged, other_key, first, again, missing = serve(cache, plex, scenario, monkeypatch)
+
+    assert [unsigned.status_code, forged.status_code, other_key.status_code] == [404, 404, 404]
+    assert first.status_code == 200
+    assert first.content == plex.body
+    assert first.headers["content-type"] == "image/jpeg"
+    assert again.status_code == 304
+    assert missing.status_code == 404
+    # Rejected requests never reach Plex
+    assert plex.fetches == {"1-thumb-100": 1, "404-thumb-1": 1}
+
+
+def test_signing_key_is_random_and_persistent(cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "plex_token", None)
+    signature = cache.sign("1-thumb-100")
+
+    key_file = tmp_path / thumbnails.SECRET_FILE
+    assert stat.S_IMODE(key_file.stat().st_mode) == 0o600
+    assert len(key_file.read_bytes()) == 32
+
+    # Another worker (or a restart) signs the same way, whatever the Plex token
+    monkeypatch.setattr(settings, "plex_token", "rotated")
+    assert ThumbnailCache().sign("1-thumb-100") == signature
+
+    # A different data directory means a different key
+    monkeypatch.setattr(settings, "data_dir", str(tmp_path / "elsewhere"))
+    assert ThumbnailCache().sign("1-thumb-100") != signature
@@ -0,0 +1,37 @@
+import pytest
+
+from app.config import settings
+from app.webhook import _attached_thumb_key, media_item_from_metadata
+
+
+@pytest.fixture(autouse=True)
+def public_url(monkeypatch):
+    monkeypatch.setattr(settings, "public_base_url", "https://digestarr.example")
+
+
+def webhook(metadata: dict) -> dict:
+    return {"event": "library.new", "Metadata": {"addedAt": 1700000000, "ratingKey": "10", **metadata}}
+
+
+def test_attached_image_adopted_under_the_linked_key():
+    payload = webhook({"type": "movie", "title": "Movie", "thumb": "/library/metadata/10/thumb/1700000001"})
+
+    key = _attached_thumb_key(payload)
+    item = media_item_from_metadata(payload["Metadata"])
+
+    assert key == "10-thumb-1700000001"
+    assert f"/thumbs/{key}?" in item.thumb_url
+
+
+def test_attached_image_not_adopted_for_episodes():
+    # The embed links the series poster, while Plex attaches the episode's own image
+    payload = webhook({
+        "type": "episode", "title": "Pilot", "grandparentTitle": "Show", "parentIndex": 1, "index": 1,
+        "thumb": "/library/metadata/10/thumb/1700000001",
+        "grandparentThumb": "/library/metadata/2/thumb/1600000000"
+    })
+
+    item = media_item_from_metadata(payload["Metadata"])
+
+    assert _attached_thumb_key(payload) is None
+    assert "/thumbs/2-thumb-1600000000?" in item.thumb_url